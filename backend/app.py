@@ -4,8 +4,8 @@ from flask_cors import CORS
 from config import config
 from extensions import db, migrate, login_manager
 
-def create_app(config_name=None):
-    """Application factory function"""
+def create_app(config_name=None, overrides=None):
+    """Application factory function (overrides: config values applied on top, e.g. a test database)"""
     
     # Create Flask app
     app = Flask(__name__)
@@ -13,11 +13,32 @@ def create_app(config_name=None):
     # Load configuration
     config_name = config_name or os.environ.get('FLASK_ENV', 'development')
     app.config.from_object(config[config_name])
+    app.config.update(overrides or {})
     
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # Batched product view counting
+    from services.view_counter import view_counter
+    view_counter.init_app(app)
+    
+    # Trending score settings
+    from services.trending import trending_scores
+    trending_scores.init_app(app)
+    
+    # Fingerprinted, precompressed frontend files
+    from services.static_assets import static_assets
+    static_assets.init_app(app)
+    
+    # Pooled Omise API client
+    from services.omise_service import omise_service
+    omise_service.init_app(app)
+    
+    # Background card charges and their recovery sweep
+    from services.payments import payment_jobs
+    payment_jobs.init_app(app)
+    
     # Configure Flask-Login
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
@@ -28,7 +49,7 @@ def create_app(config_name=None):
     CORS(app, 
          origins="*",  # Allow all origins for development
          supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization"],
+         allow_headers=["Content-Type", "Authorization", "Idempotency-Key"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"])
     
     
@@ -264,6 +285,9 @@ def create_app(config_name=None):
                 db.session.add(product)
             db.session.commit()
             
+            from services.catalog_cache import catalog_version
+            catalog_version.bump()
+            
             return jsonify({
                 'status': 'success',
                 'message': 'Products reset successfully',
@@ -302,8 +326,7 @@ def create_app(config_name=None):
     @app.route('/product/<slug>')
     def product_page(slug):
         """Serve individual product pages based on slug"""
-        from flask import send_from_directory, abort
-        import os
+        from flask import abort
         
         # Check if product exists
         product = Product.query.filter_by(slug=slug, is_active=True).first()
@@ -311,11 +334,7 @@ def create_app(config_name=None):
             abort(404)
         
         # Serve the product.html template
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(frontend_dir, 'product.html')
-        except FileNotFoundError:
-            abort(404)
+        return static_assets.send('product.html')
     
     # ===== LOGO REDIRECT ROUTE =====
     @app.route('/home')
@@ -323,89 +342,40 @@ def create_app(config_name=None):
     @app.route('/logo')
     def logo_redirect():
         """Handle logo clicks - redirect to main.html"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(frontend_dir, 'main.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('main.html')
     
     # ===== ADMIN ROUTES =====
     @app.route('/admin')
     @app.route('/admin/')
     def admin_redirect():
         """Redirect /admin to admin dashboard"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-dashboard.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-dashboard.html')
     
     # Admin page routes
     @app.route('/admin-dashboard')
     def admin_dashboard():
         """Serve admin dashboard"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-dashboard.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-dashboard.html')
     
     @app.route('/admin-orders')
     def admin_orders():
         """Serve admin orders page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-orders.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-orders.html')
     
     @app.route('/admin-products')
     def admin_products():
         """Serve admin products page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-products.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-products.html')
     
     @app.route('/admin-analytics')
     def admin_analytics():
         """Serve admin analytics page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-analytics.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-analytics.html')
     
     @app.route('/admin-influencer-applications')
     def admin_influencer_applications():
         """Serve admin influencer applications page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(os.path.join(frontend_dir, 'admin'), 'admin-influencer-applications.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('admin/admin-influencer-applications.html')
 
     # ===== SERVE FRONTEND FILES =====
     @app.route('/<path:filename>')
@@ -419,47 +389,25 @@ def create_app(config_name=None):
         # Handle trailing slashes and directory requests
         if filename.endswith('/'):
             filename = filename.rstrip('/')
-            
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
         
         # If it's a directory-like request (like main.html/), redirect properly
         if '/' in filename and not filename.split('/')[-1].count('.'):
             from flask import abort
             abort(404)
             
-        try:
-            from flask import send_from_directory
-            return send_from_directory(frontend_dir, filename)
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send(filename)
     
     # ===== CART ROUTE =====
     @app.route('/cart')
     def cart_page():
         """Serve cart page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(frontend_dir, 'cart.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('cart.html')
     
     # ===== CHECKOUT ROUTE =====
     @app.route('/checkout')
     def checkout_page():
         """Serve checkout page"""
-        from flask import send_from_directory
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
-        try:
-            return send_from_directory(frontend_dir, 'checkout.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('checkout.html')
     
     # Category page routes
     @app.route('/cleanser')
@@ -470,9 +418,6 @@ def create_app(config_name=None):
     @app.route('/category/<category_name>')
     def category_page(category_name=None):
         """Serve dynamic category pages"""
-        import os
-        frontend_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'frontend')
-        
         # Map URL paths to category names
         category_mapping = {
             'cleanser': 'cleanser',
@@ -489,12 +434,7 @@ def create_app(config_name=None):
             path = flask.request.path.strip('/')
             category_name = category_mapping.get(path, path)
         
-        try:
-            from flask import send_from_directory
-            return send_from_directory(frontend_dir, 'category.html')
-        except FileNotFoundError:
-            from flask import abort
-            abort(404)
+        return static_assets.send('category.html')
     
     return app
 
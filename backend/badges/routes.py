@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from extensions import db
 from models import Badge
+from services.catalog_cache import catalog_version
+from services.admin_stats import catalog_stats
 from datetime import datetime
 import re
 
@@ -132,12 +134,13 @@ def admin_get_badges():
         
         # Order by sort_order, then by created_at (newest first)
         badges = query.order_by(Badge.sort_order.asc(), Badge.created_at.desc()).all()
+        badge_counts = catalog_stats.get()['badge_counts']
         
         return jsonify({
             'badges': [badge.to_dict() for badge in badges],
-            'total_badges': Badge.query.count(),
-            'active_badges': Badge.query.filter_by(is_active=True).count(),
-            'category_badges': Badge.query.filter_by(is_category_badge=True).count(),
+            'total_badges': badge_counts['total'],
+            'active_badges': badge_counts['active'],
+            'category_badges': badge_counts['category'],
             'status': 'success'
         })
         
@@ -232,6 +235,7 @@ def admin_create_badge():
         
         db.session.add(badge)
         db.session.commit()
+        catalog_version.bump()
         
         return jsonify({
             'message': 'Badge created successfully',
@@ -304,6 +308,7 @@ def admin_update_badge(badge_id):
         
         badge.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
         
         return jsonify({
             'message': 'Badge updated successfully',
@@ -336,6 +341,7 @@ def admin_delete_badge(badge_id):
         badge.is_active = False
         badge.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
         
         return jsonify({
             'message': 'Badge deleted successfully',
@@ -366,6 +372,7 @@ def admin_toggle_badge_status(badge_id):
         badge.is_active = not badge.is_active
         badge.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
         
         status_text = 'activated' if badge.is_active else 'deactivated'
         
@@ -28,6 +28,28 @@ class Config:
     OMISE_SECRET_KEY = os.environ.get('OMISE_SECRET_KEY')
     OMISE_PUBLIC_KEY = os.environ.get('OMISE_PUBLIC_KEY')
     OMISE_API_VERSION = os.environ.get('OMISE_API_VERSION') or '2017-11-02'
+    OMISE_API_URL = os.environ.get('OMISE_API_URL') or 'https://api.omise.co'
+    OMISE_VAULT_URL = os.environ.get('OMISE_VAULT_URL') or 'https://vault.omise.co'
+    
+    # Omise HTTP client: keep-alive pool, timeouts (seconds), retries for idempotent calls,
+    # and a circuit breaker that fails calls fast after N consecutive failures for M seconds
+    OMISE_CONNECT_TIMEOUT = float(os.environ.get('OMISE_CONNECT_TIMEOUT') or 3.05)
+    OMISE_READ_TIMEOUT = float(os.environ.get('OMISE_READ_TIMEOUT') or 15)
+    OMISE_POOL_SIZE = int(os.environ.get('OMISE_POOL_SIZE') or 10)
+    OMISE_MAX_RETRIES = int(os.environ.get('OMISE_MAX_RETRIES') or 2)
+    OMISE_BREAKER_THRESHOLD = int(os.environ.get('OMISE_BREAKER_THRESHOLD') or 5)
+    OMISE_BREAKER_RESET = float(os.environ.get('OMISE_BREAKER_RESET') or 30)
+    
+    # Card charges run in a background pool: 'omise' (default when OMISE_SECRET_KEY is set),
+    # or 'local' (test stand-in with PAYMENT_GATEWAY_LATENCY seconds per charge; never a default).
+    # With neither, card payments are refused
+    PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY')
+    PAYMENT_GATEWAY_LATENCY = float(os.environ.get('PAYMENT_GATEWAY_LATENCY') or 0)
+    PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS') or 4)
+    PAYMENT_QUEUE_SIZE = int(os.environ.get('PAYMENT_QUEUE_SIZE') or 100)  # jobs waiting in memory
+    PAYMENT_JOB_TIMEOUT = int(os.environ.get('PAYMENT_JOB_TIMEOUT') or 120)  # seconds before a stuck charge is retried
+    PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS') or 5)  # tries while the gateway is unreachable, then held for review
+    PAYMENT_SWEEP_INTERVAL = float(os.environ.get('PAYMENT_SWEEP_INTERVAL') or 30)  # seconds between sweeps that resume queued charges
     
     # Store Configuration
     STORE_CURRENCY = os.environ.get('STORE_CURRENCY') or 'THB'
@@ -40,9 +62,30 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     
+    # Catalog Response Cache (entries are dropped whenever an admin edits the catalog;
+    # the TTL bounds staleness when several worker processes each hold a cache)
+    CATALOG_CACHE_ENABLED = True
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL') or 60)  # seconds
+    
+    # Product view counts are buffered in memory and written every N seconds
+    VIEW_COUNT_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL') or 10)
+    
+    # Trending ranking: a sale's weight halves every N days (at least 1); rebuilds read this many days of orders
+    TRENDING_HALF_LIFE_DAYS = float(os.environ.get('TRENDING_HALF_LIFE_DAYS') or 7)
+    TRENDING_WINDOW_DAYS = int(os.environ.get('TRENDING_WINDOW_DAYS') or 90)
+    
+    # Frontend served by the app (default: ../frontend next to the backend)
+    FRONTEND_DIR = os.environ.get('FRONTEND_DIR')
+    
+    # Checkout stock holds are released if no order is placed within N seconds
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL') or 900)
+    
     # File Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'static/uploads'
+    
+    # Worker processes rendering image derivatives (default: one per CPU)
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 0) or None
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -52,9 +95,15 @@ class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
 
+class TestingConfig(Config):
+    """Test configuration (the test suite supplies a throwaway database)"""
+    CATALOG_CACHE_ENABLED = False
+    PAYMENT_GATEWAY = 'local'
+
 # Configuration dictionary
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -3,6 +3,10 @@ from .user import User
 from .order import Order
 from .order_item import OrderItem
 from .badge import Badge
+from .related_product import RelatedProduct
+from .stock_reservation import StockReservation
+from .payment_job import PaymentJob
+from .trending_state import TrendingState
 
 # Import Product model if it exists in a separate file
 try:
@@ -12,4 +16,4 @@ except ImportError:
     # or create a product.py file with the Product model
     pass
 
-__all__ = ['User', 'Order', 'OrderItem', 'Product', 'Badge']
\ No newline at end of file
+__all__ = ['User', 'Order', 'OrderItem', 'Product', 'Badge', 'RelatedProduct', 'StockReservation', 'PaymentJob', 'TrendingState']
\ No newline at end of file
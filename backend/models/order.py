@@ -1,7 +1,6 @@
 from datetime import datetime
 from sqlalchemy import Numeric
 from extensions import db
-import uuid
 
 class Order(db.Model):
     """Order model for customer purchases"""
@@ -78,43 +77,15 @@ class Order(db.Model):
     
     @classmethod
     def generate_order_number(cls):
-        """Generate a unique order number"""
-        timestamp = datetime.now().strftime('%Y%m%d')
-        unique_id = str(uuid.uuid4())[:8].upper()
-        order_number = f"GJ{timestamp}{unique_id}"
-        
-        # Ensure uniqueness
-        while cls.query.filter_by(order_number=order_number).first():
-            unique_id = str(uuid.uuid4())[:8].upper()
-            order_number = f"GJ{timestamp}{unique_id}"
-        
-        return order_number
+        """Generate a unique order number (no database lookup needed)"""
+        from services.order_ids import order_ids
+        return order_ids.order_number()
     
     @classmethod
-    def generate_tracking_number(cls, order_number):
-        """Generate a tracking number based on order number"""
-        if not order_number:
-            timestamp = datetime.now().strftime('%Y%m%d')
-            unique_id = str(uuid.uuid4())[:4].upper()
-            return f"TH{timestamp}{unique_id}"
-        
-        # Extract date and unique parts from order number (format: GJ20250805ABCD1234)
-        if len(order_number) >= 14 and order_number.startswith('GJ'):
-            date_part = order_number[2:10]  # 20250805
-            unique_part = order_number[10:14]  # First 4 chars of unique part
-            tracking_number = f"TH{date_part}{unique_part}"
-        else:
-            # Fallback for different order number formats
-            timestamp = datetime.now().strftime('%Y%m%d')
-            unique_id = str(uuid.uuid4())[:4].upper()
-            tracking_number = f"TH{timestamp}{unique_id}"
-        
-        # Ensure uniqueness
-        while cls.query.filter_by(tracking_number=tracking_number).first():
-            unique_id = str(uuid.uuid4())[:4].upper()
-            tracking_number = f"TH{tracking_number[:10]}{unique_id}"
-        
-        return tracking_number
+    def generate_tracking_number(cls, order_number=None):
+        """Generate a unique tracking number (independent of the order number)"""
+        from services.order_ids import order_ids
+        return order_ids.tracking_number()
     
     def generate_and_set_tracking_number(self):
         """Generate and set tracking number for this order"""
@@ -0,0 +1,62 @@
+from datetime import datetime
+from extensions import db
+
+class PaymentJob(db.Model):
+    """A card charge for an order, run in the background by the payment workers"""
+
+    __tablename__ = 'payment_jobs'
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Client-supplied (or generated) key; a retried checkout with the same key
+    # gets the original order back instead of a second order and charge
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+
+    # Charge details (amount in satang)
+    amount = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default='THB')
+    card_token = db.Column(db.String(100))  # Single-use gateway token; cleared once charged
+    description = db.Column(db.String(255))
+
+    # queued -> processing -> succeeded / failed, or review when the gateway
+    # never answered and the charge has to be checked by hand
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    charge_id = db.Column(db.String(100))  # Gateway charge ID
+    error = db.Column(db.String(255))
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    # Relationships
+    order = db.relationship('Order', backref=db.backref('payment_jobs', lazy=True))
+
+    __table_args__ = (
+        # Serves the recovery sweep: WHERE status = ? AND updated_at < ?
+        db.Index('ix_payment_jobs_status_updated', status, updated_at),
+    )
+
+    # Statuses the workers no longer act on
+    FINAL_STATUSES = ('succeeded', 'failed', 'review')
+
+    @property
+    def is_final(self):
+        return self.status in self.FINAL_STATUSES
+
+    def to_dict(self):
+        """Convert payment job to dictionary for API responses"""
+        return {
+            'status': self.status,
+            'attempts': self.attempts,
+            'charge_id': self.charge_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+    def __repr__(self):
+        return f'<PaymentJob {self.idempotency_key} order={self.order_id} {self.status}>'
@@ -1,8 +1,21 @@
 from datetime import datetime
-from sqlalchemy import Numeric
+from sqlalchemy import Float, Numeric, and_, case, inspect, literal_column, type_coerce
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import defer
 from extensions import db
+from models.types import JSONValue
+import json
 import re
 
+def discount_expression(price, original_price):
+    """SQL discount percentage (unrounded); shared by Product.discount_percentage and its index"""
+    # Inline literals (not bound parameters) so queries match the expression index;
+    # typed as Float so keyset cursors round-trip the exact value
+    return type_coerce(case(
+        (original_price > price, (original_price - price) * literal_column('100.0') / original_price),
+        else_=literal_column('0')
+    ), Float)
+
 class Product(db.Model):
     """Product model for skincare items"""
     
@@ -55,16 +68,18 @@ class Product(db.Model):
     # Images
     primary_image = db.Column(db.String(200))  # Main product image
     secondary_image = db.Column(db.String(200))  # Hover/secondary image
-    gallery_images = db.Column(db.Text)  # JSON string of additional images (for thumbnails)
-    gallery_items = db.Column(db.Text)  # JSON string of gallery items with captions
+    gallery_images = db.Column(JSONValue)  # List of additional images (for thumbnails)
+    gallery_items = db.Column(JSONValue)  # List of gallery items with captions
     video_url = db.Column(db.String(500))  # YouTube/Vimeo video URL
     
     # Badges
-    badge_ids = db.Column(db.Text)  # JSON string of badge IDs
+    badge_ids = db.Column(JSONValue)  # List of badge IDs
     
     # Analytics
     view_count = db.Column(db.Integer, default=0)
     sales_count = db.Column(db.Integer, default=0)
+    trending_score = db.Column(db.Float, default=0, nullable=False, index=True)  # Time-decayed sales, see services/trending.py
+    related_indexed_at = db.Column(db.DateTime)  # Last related_products refresh; NULL = not indexed yet, see services/related_products.py
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -72,6 +87,51 @@ class Product(db.Model):
     
     # Relationships (we'll add these later)
     # order_items = db.relationship('OrderItem', backref='product', lazy=True)
+
+    # Composite indexes shaped like the listing queries in products/routes.py:
+    # equality filters first, then the ORDER BY columns (id breaks ties for keyset pages).
+    # test_query_plans.py fails if a listing stops using them.
+    __table_args__ = (
+        # Storefront: /, /facets, /?category=, /featured, /new (newest first)
+        db.Index('ix_products_active_created', is_active, created_at, id),
+        db.Index('ix_products_active_category_created', is_active, category, created_at, id),
+        db.Index('ix_products_active_featured_created', is_active, is_featured, created_at, id),
+        db.Index('ix_products_active_new_created', is_active, is_new, created_at, id),
+        # /bestsellers, /?bestseller=1
+        db.Index('ix_products_active_trending', is_active, trending_score, id),
+        # ?sort=price_asc|price_desc|discount|popular (popular also fills /related)
+        db.Index('ix_products_active_price', is_active, price, id),
+        db.Index('ix_products_active_discount', is_active, discount_expression(price, original_price), id),
+        db.Index('ix_products_active_popular', is_active, sales_count, id),
+        # Admin table (most recently updated first)
+        db.Index('ix_products_updated', updated_at, id),
+        db.Index('ix_products_active_updated', is_active, updated_at, id),
+        db.Index('ix_products_category_updated', category, updated_at, id),
+    )
+
+    # Cached by field_names()
+    _field_names = None
+    
+    # Serialized field sets for the ?view= parameter on product endpoints ('detail' = everything)
+    VIEW_FIELDS = {
+        # Category grids and product strips
+        'card': (
+            'id', 'name', 'slug', 'short_description', 'price', 'original_price', 'category',
+            'skin_type', 'size', 'primary_image', 'secondary_image', 'srcset', 'is_featured', 'is_bestseller',
+            'is_new', 'is_on_sale', 'discount_percentage', 'is_in_stock', 'badges'
+        ),
+        # Admin product table (long texts are loaded when a product is opened for editing)
+        'admin': (
+            'id', 'name', 'slug', 'short_description', 'price', 'original_price', 'cost_price',
+            'category', 'skin_type', 'size', 'stock_quantity', 'low_stock_threshold', 'track_inventory',
+            'show_urgency_override', 'urgency_message', 'urgency_stock_display', 'should_show_urgency',
+            'urgency_display_data', 'is_active', 'is_featured', 'is_bestseller', 'is_new', 'meta_title',
+            'meta_description', 'primary_image', 'secondary_image', 'gallery_images_list',
+            'gallery_items_list', 'video_url', 'badge_ids_list', 'badges',
+            'tags', 'is_on_sale', 'discount_percentage', 'is_in_stock', 'is_low_stock', 'view_count',
+            'sales_count', 'trending_score', 'created_at', 'updated_at'
+        ),
+    }
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -89,29 +149,80 @@ class Product(db.Model):
     def set_slug_from_name(self):
         """Set the slug based on the product name"""
         if self.name:
-            base_slug = self.generate_slug(self.name)
-            
-            # Check for uniqueness and append number if needed
-            counter = 1
-            slug = base_slug
-            while Product.query.filter_by(slug=slug).first() is not None:
-                slug = f"{base_slug}-{counter}"
+            self.slug = Product.allocate_slugs([self.generate_slug(self.name)])[0]
+
+    @classmethod
+    def allocate_slugs(cls, base_slugs, reserved=None, ignore=()):
+        """
+        Make a batch of slugs unique with a single lookup
+
+        Taken slugs get the first free numeric suffix (base, base-1, base-2, ...).
+
+        Args:
+            base_slugs: Desired slugs, in order
+            reserved: Optional set of slugs already handed out by the caller;
+                      updated in place with the allocated slugs
+            ignore: Stored slugs to treat as free (e.g. the current slug of
+                    the product being renamed)
+
+        Returns:
+            List of unique slugs, one per base slug
+        """
+        reserved = set() if reserved is None else reserved
+        bases = {base for base in base_slugs if base not in reserved}
+
+        # One query for the bases themselves; only bases that are already taken
+        # need a second query for their numbered variants
+        taken = set()
+        if bases:
+            taken = {row[0] for row in db.session.query(cls.slug).filter(cls.slug.in_(bases)).all()}
+        collided = bases & taken
+        if collided:
+            # Binary-ordered range of "base-*" (index friendly, unlike LIKE)
+            slug_column = cls.slug.collate('C') if db.engine.dialect.name == 'postgresql' else cls.slug
+            taken |= {row[0] for row in db.session.query(cls.slug).filter(db.or_(*[
+                db.and_(slug_column > f"{base}-", slug_column < f"{base}.") for base in collided
+            ])).all()}
+        taken = (taken - set(ignore)) | reserved
+
+        slugs = []
+        for base in base_slugs:
+            slug, counter = base, 1
+            while slug in taken:
+                slug = f"{base}-{counter}"
                 counter += 1
-            
-            self.slug = slug
+            taken.add(slug)
+            reserved.add(slug)
+            slugs.append(slug)
+        return slugs
     
-    @property
+    @hybrid_property
     def is_on_sale(self):
         """Check if product is on sale"""
         return self.original_price and self.price < self.original_price
     
-    @property
+    @is_on_sale.expression
+    def is_on_sale(cls):
+        return and_(cls.original_price.isnot(None), cls.price < cls.original_price)
+    
+    @hybrid_property
     def discount_percentage(self):
         """Calculate discount percentage"""
         if self.is_on_sale:
             return int(((self.original_price - self.price) / self.original_price) * 100)
         return 0
     
+    @discount_percentage.expression
+    def discount_percentage(cls):
+        # Unrounded in SQL; orders the same way as the truncated Python value
+        return discount_expression(cls.price, cls.original_price)
+    
+    @property
+    def current_trending_score(self):
+        """Units sold, decayed to now (the stored column is only meaningful for ordering)"""
+        from services.trending import trending_scores
+        return round(trending_scores.decayed(self.trending_score), 2)
+    
     @property
     def is_in_stock(self):
         """Check if product is in stock"""
@@ -185,42 +296,127 @@ class Product(db.Model):
             }
     
     def get_gallery_images_list(self):
-        """Parse gallery_images JSON string to list"""
-        if not self.gallery_images:
-            return []
-        try:
-            import json
-            return json.loads(self.gallery_images) if isinstance(self.gallery_images, str) else self.gallery_images
-        except (json.JSONDecodeError, TypeError):
-            return []
+        """Gallery image URLs as a list"""
+        return _as_list(self.gallery_images)
     
     def get_gallery_items_list(self):
-        """Parse gallery_items JSON string to list of objects with image, title, description"""
-        if not self.gallery_items:
-            return []
-        try:
-            import json
-            return json.loads(self.gallery_items) if isinstance(self.gallery_items, str) else self.gallery_items
-        except (json.JSONDecodeError, TypeError):
-            return []
+        """Gallery items as a list of objects with image, title, description"""
+        return _as_list(self.gallery_items)
+    
+    def get_srcset(self):
+        """srcset strings per format for the primary and secondary images (None when not uploaded here)"""
+        from services.image_pipeline import srcset_for
+        return {
+            'primary_image': srcset_for(self.primary_image),
+            'secondary_image': srcset_for(self.secondary_image),
+        }
+    
+    def get_gallery_srcset_list(self):
+        """srcset maps aligned with get_gallery_images_list()"""
+        from services.image_pipeline import srcset_for
+        return [srcset_for(url) if isinstance(url, str) else None for url in self.get_gallery_images_list()]
     
     def get_badge_ids_list(self):
-        """Parse badge_ids JSON string to list"""
-        badge_ids = getattr(self, 'badge_ids', None)
+        """Badge IDs as a list"""
+        return _as_list(getattr(self, 'badge_ids', None))
+    
+    @staticmethod
+    def load_badge_map(products):
+        """Load the active badges referenced by several products with a single query"""
+        badge_ids = set()
+        for product in products:
+            for badge_id in product.get_badge_ids_list():
+                try:
+                    badge_ids.add(int(badge_id))
+                except (TypeError, ValueError):
+                    continue
         if not badge_ids:
-            return []
+            return {}
+        
+        # Import here to avoid circular imports
+        from models.badge import Badge
         try:
-            import json
-            return json.loads(badge_ids) if isinstance(badge_ids, str) else badge_ids
-        except (json.JSONDecodeError, TypeError):
+            badges = Badge.query.filter(Badge.id.in_(badge_ids), Badge.is_active == True).all()
+        except Exception as e:
+            print(f"Error fetching badges: {e}")
+            return {}
+        return {badge.id: badge for badge in badges}
+    
+    @classmethod
+    def serialize_many(cls, products, fields=None):
+        """Convert a list of products to dictionaries, resolving badges once for the whole list"""
+        if fields is not None and 'badges' not in fields:
+            badge_map = {}
+        else:
+            badge_map = cls.load_badge_map(products)
+        return [product.to_dict(badge_map=badge_map, fields=fields) for product in products]
+    
+    @classmethod
+    def resolve_fields(cls, view=None, fields=None, compact=False):
+        """
+        Resolve the ?view= / ?fields= / ?compact= request parameters into a tuple of field names
+        
+        Returns None for the full (detail) representation. An explicit fields
+        list takes precedence over the view. compact drops the raw JSON string
+        duplicates of the parsed *_list fields. Raises ValueError for unknown names.
+        """
+        if fields:
+            requested = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+            unknown = [field for field in requested if field not in cls.field_names()]
+            if unknown:
+                raise ValueError(f"Unknown product fields: {', '.join(unknown)}")
+            # Always include the id so clients can key the results
+            return requested if 'id' in requested else ('id',) + requested
+        
+        if not view or view == 'detail':
+            selected = None
+        elif view in cls.VIEW_FIELDS:
+            selected = cls.VIEW_FIELDS[view]
+        else:
+            raise ValueError(f"Unknown product view: {view}")
+        
+        if compact:
+            selected = tuple(field for field in (selected or cls.field_names()) if field not in RAW_JSON_FIELDS)
+        return selected
+    
+    @classmethod
+    def field_names(cls):
+        """Serialized field names in response order, read off the to_dict() literal"""
+        if cls._field_names is None:
+            cls._field_names = tuple(cls(price=0).to_dict(badge_map={}))
+        return cls._field_names
+    
+    @classmethod
+    def load_options(cls, fields=None):
+        """Query options deferring the large Text columns the requested fields do not need"""
+        if fields is None:
             return []
+        needed = set(fields)
+        for field in fields:
+            needed.update(DERIVED_FIELD_COLUMNS.get(field, ()))
+        return [defer(getattr(cls, column)) for column in DEFERRABLE_COLUMNS if column not in needed]
     
-    def get_badges(self):
-        """Get actual badge objects for this product"""
+    def get_badges(self, badge_map=None):
+        """Get actual badge objects for this product
+        
+        When a badge_map from load_badge_map() is given the badges are looked
+        up in it instead of querying the database.
+        """
         badge_ids = self.get_badge_ids_list()
         if not badge_ids:
             return []
         
+        if badge_map is not None:
+            badges = []
+            for badge_id in badge_ids:
+                try:
+                    badge = badge_map.get(int(badge_id))
+                except (TypeError, ValueError):
+                    continue
+                if badge is not None:
+                    badges.append(badge)
+            return badges
+        
         # Import here to avoid circular imports
         from models.badge import Badge
         try:
@@ -229,23 +425,31 @@ class Product(db.Model):
             print(f"Error fetching badges: {e}")
             return []
     
-    def to_dict(self):
-        """Convert product to dictionary for JSON responses"""
-        return {
+    def to_dict(self, badge_map=None, fields=None):
+        """Convert product to dictionary for JSON responses
+        
+        Pass a badge_map (see load_badge_map) when serializing many products
+        so badges are not queried once per product, and a tuple of field names
+        (see resolve_fields) to build a sparse representation. Columns that
+        load_options left unloaded serialize as empty rather than being loaded.
+        """
+        unloaded = inspect(self).unloaded if fields is not None else ()
+        column = lambda name: None if name in unloaded else getattr(self, name)
+        data = {
             'id': self.id,
             'name': self.name,
             'slug': self.slug,
-            'description': self.description,
+            'description': column('description'),
             'short_description': self.short_description,
             'price': float(self.price),
             'original_price': float(self.original_price) if self.original_price else None,
             'cost_price': float(self.cost_price) if self.cost_price else None,
             'category': self.category,
             'skin_type': self.skin_type,
-            'ingredients': self.ingredients,
-            'usage_instructions': self.usage_instructions,
-            'benefits': self.benefits,
-            'more_details': self.more_details,
+            'ingredients': column('ingredients'),
+            'usage_instructions': column('usage_instructions'),
+            'benefits': column('benefits'),
+            'more_details': column('more_details'),
             'size': self.size,
             'stock_quantity': self.stock_quantity,
             'low_stock_threshold': self.low_stock_threshold,
@@ -263,14 +467,16 @@ class Product(db.Model):
             'meta_description': self.meta_description,
             'primary_image': self.primary_image,
             'secondary_image': self.secondary_image,
-            'gallery_images': self.gallery_images,
-            'gallery_images_list': self.get_gallery_images_list(),
-            'gallery_items': self.gallery_items,
-            'gallery_items_list': self.get_gallery_items_list(),
+            'srcset': self.get_srcset(),
+            'gallery_images': _as_json_text(column('gallery_images')),
+            'gallery_images_list': _as_list(column('gallery_images')),
+            'gallery_srcset_list': self.get_gallery_srcset_list() if 'gallery_images' not in unloaded else [],
+            'gallery_items': _as_json_text(column('gallery_items')),
+            'gallery_items_list': _as_list(column('gallery_items')),
             'video_url': self.video_url,
-            'badge_ids': getattr(self, 'badge_ids', None),
+            'badge_ids': _as_json_text(getattr(self, 'badge_ids', None)),
             'badge_ids_list': self.get_badge_ids_list(),
-            'badges': [badge.to_dict() for badge in self.get_badges()],
+            'badges': [badge.to_dict() for badge in self.get_badges(badge_map)] if not fields or 'badges' in fields else [],
             'tags': self.tags,
             'is_on_sale': self.is_on_sale,
             'discount_percentage': self.discount_percentage,
@@ -278,6 +484,44 @@ class Product(db.Model):
             'is_low_stock': self.is_low_stock,
             'view_count': self.view_count,
             'sales_count': self.sales_count,
+            'trending_score': self.current_trending_score,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+        return data if fields is None else {field: data[field] for field in fields}
+
+
+def _as_list(value):
+    """JSON column value as a list (tolerates JSON text assigned before a flush)"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def _as_json_text(value):
+    """Legacy raw JSON string form of a JSON column, kept for non-compact responses"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+# Raw JSON string fields duplicated by their parsed *_list counterparts
+RAW_JSON_FIELDS = ('gallery_images', 'gallery_items', 'badge_ids')
+
+# Large columns that listing queries can leave unloaded
+DEFERRABLE_COLUMNS = (
+    'description', 'ingredients', 'usage_instructions', 'benefits', 'more_details',
+    'gallery_images', 'gallery_items'
+)
+
+# Serialized fields computed from a deferrable column of a different name
+DERIVED_FIELD_COLUMNS = {
+    'gallery_images_list': ('gallery_images',),
+    'gallery_srcset_list': ('gallery_images',),
+    'gallery_items_list': ('gallery_items',),
+}
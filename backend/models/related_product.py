@@ -0,0 +1,39 @@
+from datetime import datetime
+from extensions import db
+
+class RelatedProduct(db.Model):
+    """Precomputed related-product recommendations (one row per product pair and direction)"""
+    
+    __tablename__ = 'related_products'
+    
+    # Composite Primary Key
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    related_product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    
+    # Ranking
+    score = db.Column(db.Float, nullable=False, default=0)
+    co_purchase_count = db.Column(db.Integer, nullable=False, default=0)  # Orders containing both products
+    same_category = db.Column(db.Boolean, nullable=False, default=False)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Serves the related-products lookup: WHERE product_id = ? ORDER BY score DESC, related_product_id
+        db.Index('ix_related_products_ranked', product_id, score.desc(), related_product_id),
+    )
+    
+    # Score weights
+    CO_PURCHASE_WEIGHT = 10.0
+    SAME_CATEGORY_WEIGHT = 5.0
+    
+    def __repr__(self):
+        return f'<RelatedProduct {self.product_id} -> {self.related_product_id}>'
+    
+    @classmethod
+    def compute_score(cls, co_purchase_count, same_category):
+        """Relevance score: co-purchases dominate, same category breaks ties"""
+        return co_purchase_count * cls.CO_PURCHASE_WEIGHT + (cls.SAME_CATEGORY_WEIGHT if same_category else 0)
+    
+    def update_score(self):
+        self.score = self.compute_score(self.co_purchase_count, self.same_category)
@@ -0,0 +1,31 @@
+from datetime import datetime
+from extensions import db
+
+class StockReservation(db.Model):
+    """Stock held for a checkout in progress (already taken off products.stock_quantity)"""
+    
+    __tablename__ = 'stock_reservations'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # One token per checkout; a checkout holds one row per tracked product
+    token = db.Column(db.String(36), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    
+    # held -> committed (order placed) or released (payment failed / expired)
+    status = db.Column(db.String(20), nullable=False, default='held')
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        # Serves the expiry sweep: WHERE status = 'held' AND expires_at < ?
+        db.Index('ix_stock_reservations_status_expires', status, expires_at),
+    )
+    
+    def __repr__(self):
+        return f'<StockReservation {self.token} product={self.product_id} x{self.quantity} {self.status}>'
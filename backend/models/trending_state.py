@@ -0,0 +1,19 @@
+from datetime import datetime
+from extensions import db
+
+class TrendingState(db.Model):
+    """Reference point of the stored trending scores (a single row, id 1)"""
+    
+    __tablename__ = 'trending_state'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # products.trending_score is a sum of 2^((sold_at - epoch) / half_life); see services/trending.py
+    epoch = db.Column(db.DateTime, nullable=False)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TrendingState epoch={self.epoch}>'
@@ -0,0 +1,43 @@
+import json
+from sqlalchemy.types import TypeDecorator, Text
+from sqlalchemy.dialects.postgresql import JSONB
+
+def parse_json_text(value):
+    """Parse JSON text (blank text is None); other values pass through. Raises ValueError if malformed"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value) if value.strip() else None
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Malformed JSON: {e}')
+
+class JSONValue(TypeDecorator):
+    """JSON column: native JSONB on PostgreSQL, JSON text elsewhere
+    
+    Values are parsed once when a row is loaded, so model code works with
+    plain Python lists/dicts. JSON text assigned by older callers is parsed
+    before saving; malformed text raises ValueError rather than being saved as
+    NULL. Malformed legacy text already stored loads as None instead of failing.
+    """
+    
+    impl = Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+    
+    def process_bind_param(self, value, dialect):
+        value = parse_json_text(value)
+        if dialect.name == 'postgresql' or value is None:
+            return value
+        return json.dumps(value, separators=(',', ':'))
+    
+    def process_result_value(self, value, dialect):
+        if not isinstance(value, str) or dialect.name == 'postgresql':
+            return value
+        try:
+            return json.loads(value) if value.strip() else None
+        except json.JSONDecodeError:
+            return None
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_required, current_user
 from extensions import db
-from models import Product
+from services.catalog_snapshot import catalog_snapshot
 import json
 
 # Create cart blueprint
@@ -29,10 +29,11 @@ def get_cart():
         cart_data = []
         total_amount = 0
         total_items = 0
+        catalog = catalog_snapshot.current()
         
         for item in cart_items:
-            # Get current product data
-            product = Product.query.get(item['id'])
+            # Get current product data (stock shown here is advisory)
+            product = catalog.get(item['id'])
             if product and product.is_active:
                 # Check if price has changed
                 current_price = float(product.price)
@@ -98,8 +99,8 @@ def add_to_cart():
         product_id = data['product_id']
         quantity = data.get('quantity', 1)
         
-        # Validate product
-        product = Product.query.get(product_id)
+        # Validate product (stock is re-checked against the database at checkout)
+        product = catalog_snapshot.get(product_id)
         if not product or not product.is_active:
             return jsonify({
                 'status': 'error',
@@ -203,7 +204,7 @@ def update_cart_item():
             message = f'Removed {removed_item["name"]} from cart'
         else:
             # Validate stock
-            product = Product.query.get(product_id)
+            product = catalog_snapshot.get(product_id)
             if product and product.track_inventory and product.stock_quantity < new_quantity:
                 return jsonify({
                     'status': 'error',
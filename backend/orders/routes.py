@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from extensions import db
-from models import Order, OrderItem, Product, User
-from datetime import datetime
-import uuid
+from auth.routes import admin_required
+from models import Order, User
+from services.checkout import checkout_pipeline
+from services.omise_service import omise_service
+from services.order_ids import NUMBER_LENGTH, order_ids
+from services.payments import RETRY_AFTER, payment_jobs
+from services.stock_reservations import stock_reservations
 import logging
 
 # Set up logging
@@ -12,12 +17,6 @@ logger = logging.getLogger(__name__)
 # Create orders blueprint
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
-def generate_order_number():
-    """Generate a unique order number"""
-    timestamp = datetime.now().strftime('%Y%m%d')
-    unique_id = str(uuid.uuid4())[:8].upper()
-    return f"GJ{timestamp}{unique_id}"
-
 def validate_shipping_info(shipping_info):
     """Validate shipping information"""
     required_fields = [
@@ -35,93 +34,87 @@ def validate_shipping_info(shipping_info):
     
     return True, None
 
-def calculate_order_totals(cart_items, promo_code=None):
-    """Calculate order totals including tax, shipping, and discounts"""
-    subtotal = 0
-    
-    # Calculate subtotal
-    for item in cart_items:
-        product = Product.query.get(item['id'])
-        if not product or not product.is_active:
-            raise ValueError(f"Product not available: {item.get('name', 'Unknown')}")
-        
-        # Check stock if product tracks inventory
-        if hasattr(product, 'track_inventory') and product.track_inventory:
-            if hasattr(product, 'stock_quantity') and product.stock_quantity < item['quantity']:
-                raise ValueError(f"Insufficient stock for {product.name}. Available: {product.stock_quantity}")
-        
-        item_total = float(product.price) * item['quantity']
-        subtotal += item_total
-    
-    # Calculate shipping (free over ฿1500)
-    shipping_amount = 0 if subtotal >= 1500 else 100
-    
-    # Calculate discount
-    discount_amount = 0
-    if promo_code:
-        discount_codes = {
-            'welcome15': 0.15,
-            'save10': 0.10,
-            'newcustomer': 0.20
-        }
-        if promo_code.lower() in discount_codes:
-            discount_amount = subtotal * discount_codes[promo_code.lower()]
+def get_idempotency_key(data):
+    """Idempotency key from the Idempotency-Key header or the request body"""
+    key = (request.headers.get('Idempotency-Key') or data.get('idempotency_key') or '').strip()
+    if len(key) > 100:
+        raise ValueError('Idempotency key must be at most 100 characters')
+    return key or None
+
+def order_created_response(order, payment_job=None, status_code=201):
+    """Response for a placed (or replayed) order"""
+    order_data = {
+        'order_number': order.order_number,
+        'id': order.id,
+        'total_amount': float(order.total_amount),
+        'payment_status': order.payment_status,
+        'status': order.status
+    }
+    if payment_job:
+        # The charge runs in the background; clients poll this URL for the result
+        order_data['payment'] = payment_job.to_dict()
+        order_data['payment_url'] = f'/api/orders/{order.order_number}/payment'
+    return jsonify({
+        'status': 'success',
+        'message': 'Order created successfully!',
+        'order': order_data
+    }), status_code
+
+def replay_order(idempotency_key, user_id=None, email=None):
+    """
+    Response for a checkout retried with an idempotency key that already has
+    an order, or None when the key is new
+    """
+    payment_job = payment_jobs.find(idempotency_key)
+    if not payment_job:
+        return None
+    order = payment_job.order
+    if (user_id is not None and order.user_id != user_id) or (
+            email is not None and (order.customer.email or '').lower() != email.lower()):
+        return jsonify({
+            'status': 'error',
+            'message': 'Idempotency key was already used for another order'
+        }), 409
+    return order_created_response(order, payment_job, 200)
+
+def find_order(order_number):
+    """
+    Look up an order the current user may see
+
+    Returns:
+        (order, None) or (None, error response)
+    """
+    order_number = order_ids.normalize(order_number)
+    # Mistyped new-style numbers fail their check character without a query
+    if len(order_number) == NUMBER_LENGTH and not order_ids.is_valid(order_number):
+        order = None
+    else:
+        order = Order.query.filter_by(order_number=order_number).first()
     
-    # Calculate tax (7% VAT on discounted subtotal)
-    discounted_subtotal = subtotal - discount_amount
-    tax_amount = discounted_subtotal * 0.07
+    if not order:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'Order not found'
+        }), 404)
     
-    # Final total
-    total_amount = discounted_subtotal + shipping_amount + tax_amount
+    # Check if user has access to this order
+    if current_user.is_authenticated:
+        if order.user_id != current_user.id and not getattr(current_user, 'is_admin', False):
+            return None, (jsonify({
+                'status': 'error',
+                'message': 'Access denied'
+            }), 403)
+    else:
+        # For guest users, allow access to anyone with the order number
+        pass
     
-    return {
-        'subtotal': subtotal,
-        'discount_amount': discount_amount,
-        'shipping_amount': shipping_amount,
-        'tax_amount': tax_amount,
-        'total_amount': total_amount
-    }
-
-def process_card_payment(amount, token_id, description):
-    """Process credit card payment using Omise"""
-    try:
-        # Try to import and use Omise service
-        try:
-            from services.omise_service import omise_service
-            
-            # Convert amount to satang (smallest unit for THB)
-            amount_satang = omise_service.convert_to_satang(amount)
-            
-            # Create charge
-            success, charge_data, error = omise_service.create_charge(
-                amount=amount_satang,
-                currency='THB',
-                token_id=token_id,
-                description=description,
-                metadata={
-                    'source': 'gaojie_skincare',
-                    'platform': 'web'
-                }
-            )
-            
-            return success, charge_data, error
-            
-        except ImportError:
-            logger.warning("Omise service not available - using mock payment")
-            # Mock successful payment for development
-            return True, {
-                'id': f'chrg_test_mock_{uuid.uuid4().hex[:8]}',
-                'paid': True,
-                'amount': int(amount * 100)
-            }, None
-        
-    except Exception as e:
-        logger.error(f"Payment processing failed: {e}")
-        return False, None, str(e)
+    return order, None
 
 @orders_bp.route('/guest/create', methods=['POST'])
 def create_guest_order():
     """Create an order for guest users (no authentication required)"""
+    reservation_token = None
+    idempotency_key = None
     try:
         data = request.get_json()
         
@@ -158,6 +151,19 @@ def create_guest_order():
                 'message': 'Guest email is required'
             }), 400
         
+        # A retried checkout gets its original order back instead of a second order and charge
+        try:
+            idempotency_key = get_idempotency_key(data)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        if idempotency_key:
+            replayed = replay_order(idempotency_key, email=guest_info['email'])
+            if replayed:
+                return replayed
+        
         # Validate shipping info
         is_valid, error_msg = validate_shipping_info(shipping_info)
         if not is_valid:
@@ -166,36 +172,33 @@ def create_guest_order():
                 'message': error_msg
             }), 400
         
-        # Calculate totals
+        # Validate and price the cart (one product query)
         try:
-            totals = calculate_order_totals(cart_items, data.get('promo_code'))
+            plan = checkout_pipeline.prepare(cart_items, data.get('promo_code'))
         except ValueError as e:
             return jsonify({
                 'status': 'error',
                 'message': str(e)
             }), 400
+        totals = plan.totals
         
-        # Process payment if payment method is credit card
+        # Card payments are charged in the background once the order is placed
         payment_method = payment_info.get('method', 'pending')
-        payment_status = 'pending'
-        payment_reference = None
-        
-        if payment_method == 'card' and 'token' in payment_info:
-            # Process credit card payment
-            success, charge_data, error = process_card_payment(
-                totals['total_amount'], 
-                payment_info['token'],
-                f"Order payment for {guest_info['email']}"
-            )
-            
-            if success:
-                payment_status = 'completed' if charge_data.get('paid') else 'processing'
-                payment_reference = charge_data['id']
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Payment failed: {error}'
-                }), 400
+        card_token = payment_info.get('token') if payment_method == 'card' else None
+        if card_token and not payment_jobs.accepts_cards():
+            return jsonify({
+                'status': 'error',
+                'message': 'Card payments are currently unavailable'
+            }), 503
+        
+        # Hold stock before taking payment; released again if the order is not placed
+        try:
+            reservation_token = checkout_pipeline.reserve(plan)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         
         # Create guest user or find existing
         guest_user = User.query.filter_by(email=guest_info['email']).first()
@@ -215,9 +218,9 @@ def create_guest_order():
         
         # Create order
         order = Order(
-            order_number=generate_order_number(),
+            order_number=order_ids.order_number(),
             user_id=guest_user.id,
-            status='confirmed' if payment_status == 'completed' else 'pending',
+            status='pending',
             
             # Financial details
             subtotal=totals['subtotal'],
@@ -240,62 +243,48 @@ def create_guest_order():
             
             # Payment information
             payment_method=payment_method,
-            payment_status=payment_status,
-            payment_reference=payment_reference,
+            payment_status='pending',
             
             # Notes
             order_notes=data.get('notes', '').strip()
         )
         
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Generate tracking number
-        order.tracking_number = Order.generate_tracking_number(order.order_number)
-        
-        # Create order items
-        for cart_item in cart_items:
-            product = Product.query.get(cart_item['id'])
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                quantity=cart_item['quantity'],
-                unit_price=float(product.price),
-                total_price=float(product.price) * cart_item['quantity'],
-                product_name=product.name,
-                product_sku=getattr(product, 'sku', f'PROD-{product.id}')
+        # The pending charge is stored with the order, under the checkout's idempotency key
+        payment_job = None
+        if card_token:
+            payment_job = payment_jobs.create(
+                order, card_token, idempotency_key, f"Order payment for {guest_info['email']}"
             )
-            db.session.add(order_item)
-            
-            # Update product stock if tracking inventory
-            if hasattr(product, 'track_inventory') and product.track_inventory:
-                if hasattr(product, 'stock_quantity'):
-                    product.stock_quantity -= cart_item['quantity']
-            
-            # Update sales count if available
-            if hasattr(product, 'sales_count'):
-                product.sales_count += cart_item['quantity']
         
-        db.session.commit()
+        # Insert the order and its items, record the sales and commit
+        checkout_pipeline.place_order(plan, order, reservation_token)
+        
+        if payment_job:
+            payment_jobs.submit(payment_job.id)
         
         logger.info(f"Guest order created successfully: {order.order_number}")
         
+        return order_created_response(order, payment_job)
+        
+    except IntegrityError as e:
+        db.session.rollback()
+        if reservation_token:
+            stock_reservations.release(reservation_token)
+        # A concurrent retry with the same idempotency key placed the order first
+        replayed = replay_order(idempotency_key, email=guest_info['email']) if idempotency_key else None
+        if replayed:
+            return replayed
+        logger.error(f"Guest order creation failed: {e}")
         return jsonify({
-            'status': 'success',
-            'message': 'Order created successfully!',
-            'order': {
-                'order_number': order.order_number,
-                'id': order.id,
-                'total_amount': float(order.total_amount),
-                'payment_status': order.payment_status,
-                'status': order.status
-            }
-        }), 201
+            'status': 'error',
+            'message': 'Order creation failed. Please try again.'
+        }), 500
         
     except Exception as e:
         db.session.rollback()
         logger.error(f"Guest order creation failed: {e}")
+        if reservation_token:
+            stock_reservations.release(reservation_token)
         return jsonify({
             'status': 'error',
             'message': 'Order creation failed. Please try again.'
@@ -305,6 +294,8 @@ def create_guest_order():
 @login_required
 def create_authenticated_order():
     """Create an order for authenticated users"""
+    reservation_token = None
+    idempotency_key = None
     try:
         data = request.get_json()
         
@@ -333,6 +324,19 @@ def create_authenticated_order():
                 'message': 'Cart is empty'
             }), 400
         
+        # A retried checkout gets its original order back instead of a second order and charge
+        try:
+            idempotency_key = get_idempotency_key(data)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        if idempotency_key:
+            replayed = replay_order(idempotency_key, user_id=current_user.id)
+            if replayed:
+                return replayed
+        
         # Validate shipping info
         is_valid, error_msg = validate_shipping_info(shipping_info)
         if not is_valid:
@@ -341,42 +345,39 @@ def create_authenticated_order():
                 'message': error_msg
             }), 400
         
-        # Calculate totals
+        # Validate and price the cart (one product query)
         try:
-            totals = calculate_order_totals(cart_items, data.get('promo_code'))
+            plan = checkout_pipeline.prepare(cart_items, data.get('promo_code'))
         except ValueError as e:
             return jsonify({
                 'status': 'error',
                 'message': str(e)
             }), 400
+        totals = plan.totals
         
-        # Process payment if payment method is credit card
+        # Card payments are charged in the background once the order is placed
         payment_method = payment_info.get('method', 'pending')
-        payment_status = 'pending'
-        payment_reference = None
-        
-        if payment_method == 'card' and 'token' in payment_info:
-            # Process credit card payment
-            success, charge_data, error = process_card_payment(
-                totals['total_amount'], 
-                payment_info['token'],
-                f"Order payment for {current_user.email}"
-            )
-            
-            if success:
-                payment_status = 'completed' if charge_data.get('paid') else 'processing'
-                payment_reference = charge_data['id']
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Payment failed: {error}'
-                }), 400
+        card_token = payment_info.get('token') if payment_method == 'card' else None
+        if card_token and not payment_jobs.accepts_cards():
+            return jsonify({
+                'status': 'error',
+                'message': 'Card payments are currently unavailable'
+            }), 503
+        
+        # Hold stock before taking payment; released again if the order is not placed
+        try:
+            reservation_token = checkout_pipeline.reserve(plan)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         
         # Create order for authenticated user
         order = Order(
-            order_number=generate_order_number(),
+            order_number=order_ids.order_number(),
             user_id=current_user.id,
-            status='confirmed' if payment_status == 'completed' else 'pending',
+            status='pending',
             
             # Financial details
             subtotal=totals['subtotal'],
@@ -399,58 +400,48 @@ def create_authenticated_order():
             
             # Payment information
             payment_method=payment_method,
-            payment_status=payment_status,
-            payment_reference=payment_reference,
+            payment_status='pending',
             
             # Notes
             order_notes=data.get('notes', '').strip()
         )
         
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Generate tracking number
-        order.tracking_number = Order.generate_tracking_number(order.order_number)
-        
-        # Create order items
-        for cart_item in cart_items:
-            product = Product.query.get(cart_item['id'])
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                quantity=cart_item['quantity'],
-                unit_price=float(product.price),
-                total_price=float(product.price) * cart_item['quantity'],
-                product_name=product.name,
-                product_sku=getattr(product, 'sku', f'PROD-{product.id}')
+        # The pending charge is stored with the order, under the checkout's idempotency key
+        payment_job = None
+        if card_token:
+            payment_job = payment_jobs.create(
+                order, card_token, idempotency_key, f"Order payment for {current_user.email}"
             )
-            db.session.add(order_item)
-            
-            # Update product stock if tracking inventory
-            if hasattr(product, 'track_inventory') and product.track_inventory:
-                if hasattr(product, 'stock_quantity'):
-                    product.stock_quantity -= cart_item['quantity']
         
-        db.session.commit()
+        # Insert the order and its items, record the sales and commit
+        checkout_pipeline.place_order(plan, order, reservation_token)
+        
+        if payment_job:
+            payment_jobs.submit(payment_job.id)
         
         logger.info(f"Authenticated order created successfully: {order.order_number}")
         
+        return order_created_response(order, payment_job)
+        
+    except IntegrityError as e:
+        db.session.rollback()
+        if reservation_token:
+            stock_reservations.release(reservation_token)
+        # A concurrent retry with the same idempotency key placed the order first
+        replayed = replay_order(idempotency_key, user_id=current_user.id) if idempotency_key else None
+        if replayed:
+            return replayed
+        logger.error(f"Authenticated order creation failed: {e}")
         return jsonify({
-            'status': 'success',
-            'message': 'Order created successfully!',
-            'order': {
-                'order_number': order.order_number,
-                'id': order.id,
-                'total_amount': float(order.total_amount),
-                'payment_status': order.payment_status,
-                'status': order.status
-            }
-        }), 201
+            'status': 'error',
+            'message': 'Order creation failed. Please try again.'
+        }), 500
         
     except Exception as e:
         db.session.rollback()
         logger.error(f"Authenticated order creation failed: {e}")
+        if reservation_token:
+            stock_reservations.release(reservation_token)
         return jsonify({
             'status': 'error',
             'message': 'Order creation failed. Please try again.'
@@ -460,35 +451,90 @@ def create_authenticated_order():
 def get_order(order_number):
     """Get order details by order number"""
     try:
-        order = Order.query.filter_by(order_number=order_number).first()
+        order, error_response = find_order(order_number)
+        if error_response:
+            return error_response
         
-        if not order:
+        return jsonify({
+            'status': 'success',
+            'order': order.to_dict(include_items=True, include_customer=True)
+        })
+        
+    except Exception as e:
+        logger.error(f"Failed to retrieve order {order_number}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to retrieve order'
+        }), 500
+
+@orders_bp.route('/<order_number>/payment', methods=['GET'])
+def get_order_payment(order_number):
+    """
+    Payment status of an order
+    
+    Query Parameters:
+        wait: seconds to wait for a pending charge to settle (max 2)
+    
+    While the charge is pending the response carries a Retry-After header;
+    poll again after that many seconds.
+    """
+    try:
+        order, error_response = find_order(order_number)
+        if error_response:
+            return error_response
+        
+        try:
+            wait = max(0.0, float(request.args.get('wait', 0)))
+        except ValueError:
             return jsonify({
                 'status': 'error',
-                'message': 'Order not found'
-            }), 404
+                'message': 'wait must be a number of seconds'
+            }), 400
         
-        # Check if user has access to this order
-        if current_user.is_authenticated:
-            if order.user_id != current_user.id and not getattr(current_user, 'is_admin', False):
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Access denied'
-                }), 403
-        else:
-            # For guest users, allow access to anyone with the order number
-            pass
+        payment_job = payment_jobs.for_order(order.id)
+        if payment_job and not payment_job.is_final:
+            # Backs up the background sweep for a job that is waiting to be retried
+            payment_jobs.resume_stalled()
+            if wait:
+                payment_job = payment_jobs.wait(payment_job.id, wait)
+                order = payment_job.order
+        
+        response = jsonify({
+            'status': 'success',
+            'payment': {
+                'order_number': order.order_number,
+                'order_status': order.status,
+                'payment_status': order.payment_status,
+                'job': payment_job.to_dict() if payment_job else None
+            }
+        })
+        if payment_job and not payment_job.is_final:
+            response.headers['Retry-After'] = str(RETRY_AFTER)
+        return response
         
+    except Exception as e:
+        logger.error(f"Failed to retrieve payment for order {order_number}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to retrieve payment status'
+        }), 500
+
+@orders_bp.route('/admin/payment-gateway', methods=['GET'])
+@admin_required
+def admin_payment_gateway():
+    """Gateway circuit state, per-call latency metrics and payment job counts"""
+    try:
         return jsonify({
             'status': 'success',
-            'order': order.to_dict(include_items=True, include_customer=True)
+            'gateway': omise_service.stats(),
+            'jobs': payment_jobs.counts()
         })
         
     except Exception as e:
-        logger.error(f"Failed to retrieve order {order_number}: {e}")
+        logger.error(f"Failed to read payment gateway stats: {e}")
         return jsonify({
             'status': 'error',
-            'message': 'Failed to retrieve order'
+            'message': 'Failed to read payment gateway stats'
         }), 500
 
 @orders_bp.route('/test', methods=['GET'])
@@ -504,6 +550,8 @@ def test_orders():
                 '/api/orders/guest/create',
                 '/api/orders/create',
                 '/api/orders/<order_number>',
+                '/api/orders/<order_number>/payment',
+                '/api/orders/admin/payment-gateway',
                 '/api/orders/test'
             ]
         })
@@ -1,28 +1,135 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from extensions import db
 from models import Product
-from sqlalchemy import or_
+from models.types import parse_json_text
+from services.search_index import product_search
+from utils.pagination import keyset_paginate, InvalidCursor
+from services.catalog_cache import cached_catalog_response, catalog_version
+from services.view_counter import view_counter
+from services.related_products import related_products_index
+from services.admin_stats import catalog_stats
+from services.product_io import product_io, SUPPORTED_FORMATS
+from services.facets import product_facets
+from services.suggest_index import suggest_index
+from services.trending import trending_scores
+from services.bulk_update import product_bulk_update
+from services.image_pipeline import image_pipeline
 from datetime import datetime
+from functools import wraps
+from sqlalchemy import select, union
 import re
 
 # Create products blueprint
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+def record_slug_view(slug):
+    """Count a product page view served from the response cache"""
+    view_counter.record_slug(slug)
+
+def get_flag(name):
+    """Read an on/off query arg: 1/true/yes/on is True, anything else (or missing) False"""
+    return request.args.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_optional_flag(name):
+    """Like get_flag, but None when the arg is missing (so ?featured=false can filter)"""
+    return get_flag(name) if name in request.args else None
+
+# Search results are ordered by relevance, which keyset cursors cannot resume from
+SEARCH_CURSOR_ERROR = 'cursor pagination is not available with search; use page instead'
+
+def get_requested_fields():
+    """Read ?view=card|detail|admin, ?fields=a,b,c and ?compact=1 (None means the full product)"""
+    return Product.resolve_fields(
+        request.args.get('view'),
+        request.args.get('fields'),
+        compact=get_flag('compact')
+    )
+
+# Product columns stored as JSON; admin forms may send them as JSON text
+JSON_FIELDS = ('gallery_images', 'gallery_items', 'badge_ids')
+
+def validate_json_fields(data):
+    """Return a 400 response naming the first JSON field sent as malformed text, else None"""
+    for field in JSON_FIELDS:
+        try:
+            parse_json_text(data.get(field))
+        except ValueError as e:
+            return jsonify({
+                'message': f'Invalid {field}: {e}',
+                'status': 'error'
+            }), 400
+    return None
+
+def with_requested_fields(view):
+    """Resolve the field selection before the view runs and pass it as `fields` (400 if invalid)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            fields = get_requested_fields()
+        except ValueError as e:
+            return jsonify({
+                'message': str(e),
+                'status': 'error'
+            }), 400
+        return view(*args, fields=fields, **kwargs)
+    return wrapper
+
+# ?sort= options for the storefront listing: key -> (cursor key, column, descending)
+LISTING_SORTS = {
+    'newest': ('created_at', Product.created_at, True),
+    'price_asc': ('price_asc', Product.price, False),
+    'price_desc': ('price_desc', Product.price, True),
+    'discount': ('discount', Product.discount_percentage, True),
+    'popular': ('popular', Product.sales_count, True),
+}
+
+def get_price_filter(name):
+    """Read an optional non-negative price bound from the query string"""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if price < 0:
+        raise ValueError(f'{name} must not be negative')
+    return price
+
 @products_bp.route('/', methods=['GET'])
-def get_products():
+@cached_catalog_response()
+@with_requested_fields
+def get_products(fields):
     """Get all products with optional filtering and pagination"""
     try:
         # Get query parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 12, type=int)  # 12 products per page
         category = request.args.get('category')
-        featured = request.args.get('featured', type=bool)
-        bestseller = request.args.get('bestseller', type=bool)
-        new = request.args.get('new', type=bool)
+        featured = get_optional_flag('featured')
+        bestseller = get_optional_flag('bestseller')
+        new = get_optional_flag('new')
         search = request.args.get('search')
+        sort = request.args.get('sort')
+        on_sale = request.args.get('on_sale')
+        
+        try:
+            min_price = get_price_filter('min_price')
+            max_price = get_price_filter('max_price')
+            if sort is not None and sort not in LISTING_SORTS:
+                raise ValueError(f"Invalid sort. Must be one of: {', '.join(LISTING_SORTS)}")
+            if on_sale is not None and on_sale.lower() not in ('1', 'true', '0', 'false'):
+                raise ValueError('on_sale must be true or false')
+            if search and 'cursor' in request.args:
+                raise ValueError(SEARCH_CURSOR_ERROR)
+        except ValueError as e:
+            return jsonify({
+                'message': str(e),
+                'status': 'error'
+            }), 400
         
         # Build query
-        query = Product.query.filter_by(is_active=True)
+        query = Product.query.filter_by(is_active=True).options(*Product.load_options(fields))
         
         # Apply filters
         if category:
@@ -31,46 +138,208 @@ def get_products():
         if featured is not None:
             query = query.filter(Product.is_featured == featured)
             
-        if bestseller is not None:
+        if bestseller:
+            # Flagged bestsellers plus anything currently selling
+            query = query.filter(db.or_(Product.is_bestseller == True, Product.trending_score > 0))
+        elif bestseller is not None:
             query = query.filter(Product.is_bestseller == bestseller)
             
         if new is not None:
             query = query.filter(Product.is_new == new)
+        
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
+        
+        if on_sale is not None:
+            query = query.filter(Product.is_on_sale if on_sale.lower() in ('1', 'true') else ~Product.is_on_sale)
             
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term),
-                    Product.tags.ilike(search_term)
+            # Full-text match, ordered by relevance (ties broken by the ordering below)
+            query = product_search.apply(query, search)
+        
+        # Explicit ?sort=, else trending score for bestsellers, else newest first
+        if sort:
+            sort_key, sort_column, descending = LISTING_SORTS[sort]
+        elif bestseller:
+            sort_key, sort_column, descending = 'trending_score', Product.trending_score, True
+        else:
+            sort_key, sort_column, descending = LISTING_SORTS['newest']
+        if descending:
+            query = query.order_by(sort_column.desc(), Product.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), Product.id.asc())
+        
+        if 'cursor' in request.args:
+            # Keyset pagination (?cursor= for the first page); total only on request
+            try:
+                products, pagination = keyset_paginate(
+                    query, sort_key, sort_column, Product.id,
+                    cursor=request.args.get('cursor'),
+                    per_page=per_page,
+                    include_total=get_flag('include_total'),
+                    descending=descending
                 )
+            except InvalidCursor as e:
+                return jsonify({
+                    'message': str(e),
+                    'status': 'error'
+                }), 400
+        else:
+            # Paginate results
+            products_pagination = query.paginate(
+                page=page, 
+                per_page=per_page, 
+                error_out=False
             )
+            
+            products = products_pagination.items
+            pagination = {
+                'page': page,
+                'per_page': per_page,
+                'total': products_pagination.total,
+                'pages': products_pagination.pages,
+                'has_next': products_pagination.has_next,
+                'has_prev': products_pagination.has_prev
+            }
         
-        # Order by created_at (newest first) or by sales_count for bestsellers
-        if bestseller:
-            query = query.order_by(Product.sales_count.desc())
-        else:
-            query = query.order_by(Product.created_at.desc())
+        return jsonify({
+            'products': Product.serialize_many(products, fields=fields),
+            'pagination': pagination,
+            'status': 'success'
+        })
         
-        # Paginate results
-        products_pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+    except Exception as e:
+        return jsonify({
+            'message': 'Error fetching products',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@products_bp.route('/facets', methods=['GET'])
+@cached_catalog_response()
+@with_requested_fields
+def get_product_facets(fields):
+    """Get a filtered product page together with facet counts for the filter UI"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 12, type=int)
+        search = request.args.get('search')
         
-        products = products_pagination.items
+        try:
+            filters = product_facets.parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({
+                'message': str(e),
+                'status': 'error'
+            }), 400
+        
+        query = Product.query.filter_by(is_active=True)
+        if search:
+            query = product_search.apply(query, search)
+        query = query.order_by(Product.created_at.desc(), Product.id.desc())
+        
+        query, total, facets = product_facets.compute(query, filters)
+        
+        # Load only the requested page, keeping the listing order
+        products = query.options(*Product.load_options(fields)).offset((page - 1) * per_page).limit(per_page).all() \
+            if total and page > 0 and per_page > 0 else []
+        pages = (total + per_page - 1) // per_page if per_page > 0 else 0
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
+            'products': Product.serialize_many(products, fields=fields),
+            'facets': facets,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': products_pagination.total,
-                'pages': products_pagination.pages,
-                'has_next': products_pagination.has_next,
-                'has_prev': products_pagination.has_prev
+                'total': total,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            },
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'message': 'Error fetching product facets',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@products_bp.route('/suggest', methods=['GET'])
+def get_search_suggestions():
+    """Get search-as-you-type suggestions (id, name, slug, thumbnail) for ?q="""
+    try:
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 8, type=int)
+        
+        return jsonify({
+            'suggestions': suggest_index.suggest(query, limit=limit),
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'message': 'Error fetching suggestions',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+# Upper bound on ids + slugs per /batch request
+MAX_BATCH_SIZE = 200
+
+@products_bp.route('/batch', methods=['GET'])
+@cached_catalog_response()
+@with_requested_fields
+def get_products_batch(fields):
+    """Get many active products by ?ids=1,2,3 and/or ?slugs=a,b in one query (no view counting)"""
+    try:
+        try:
+            ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return jsonify({
+                'message': 'ids must be integers',
+                'status': 'error'
+            }), 400
+        slugs = [value.strip() for value in request.args.get('slugs', '').split(',') if value.strip()]
+        
+        if len(ids) + len(slugs) > MAX_BATCH_SIZE:
+            return jsonify({
+                'message': f'At most {MAX_BATCH_SIZE} ids and slugs per request',
+                'status': 'error'
+            }), 400
+        
+        products = []
+        if ids or slugs:
+            # Resolve slugs to ids in a subquery so every row is a key lookup, not a range over is_active
+            keys = []
+            if slugs:
+                keys.append(select(Product.id).where(Product.slug.in_(set(slugs))))
+                if ids:
+                    keys.insert(0, select(Product.id).where(Product.id.in_(set(ids))))
+            matched = set(ids) if not keys else (union(*keys) if len(keys) > 1 else keys[0])
+            products = Product.query.filter(
+                Product.id.in_(matched), Product.is_active == True
+            ).options(*Product.load_options(fields)).all()
+        
+        by_id = {product.id: product for product in products}
+        by_slug = {product.slug: product for product in products}
+        
+        # Request order: ids first, then slugs; each product once
+        ordered, seen = [], set()
+        for product in [by_id.get(product_id) for product_id in ids] + [by_slug.get(slug) for slug in slugs]:
+            if product is not None and product.id not in seen:
+                seen.add(product.id)
+                ordered.append(product)
+        
+        return jsonify({
+            'products': Product.serialize_many(ordered, fields=fields),
+            'missing': {
+                'ids': [product_id for product_id in ids if product_id not in by_id],
+                'slugs': [slug for slug in slugs if slug not in by_slug]
             },
             'status': 'success'
         })
@@ -83,7 +352,8 @@ def get_products():
         }), 500
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
-def get_product(product_id):
+@with_requested_fields
+def get_product(product_id, fields):
     """Get a single product by ID"""
     try:
         product = Product.query.filter_by(id=product_id, is_active=True).first()
@@ -94,12 +364,11 @@ def get_product(product_id):
                 'status': 'error'
             }), 404
         
-        # Increment view count
-        product.view_count += 1
-        db.session.commit()
+        # Count the view (written to the database in batches)
+        view_counter.record(product.id)
         
         return jsonify({
-            'product': product.to_dict(),
+            'product': product.to_dict(fields=fields),
             'status': 'success'
         })
         
@@ -111,7 +380,9 @@ def get_product(product_id):
         }), 500
 
 @products_bp.route('/slug/<string:slug>', methods=['GET'])
-def get_product_by_slug(slug):
+@cached_catalog_response(on_hit=record_slug_view)
+@with_requested_fields
+def get_product_by_slug(slug, fields):
     """Get a single product by slug (SEO-friendly URLs)"""
     try:
         product = Product.query.filter_by(slug=slug, is_active=True).first()
@@ -122,12 +393,11 @@ def get_product_by_slug(slug):
                 'status': 'error'
             }), 404
         
-        # Increment view count
-        product.view_count += 1
-        db.session.commit()
+        # Count the view (written to the database in batches)
+        view_counter.record(product.id)
         
         return jsonify({
-            'product': product.to_dict(),
+            'product': product.to_dict(fields=fields),
             'status': 'success'
         })
         
@@ -139,8 +409,9 @@ def get_product_by_slug(slug):
         }), 500
 
 @products_bp.route('/related/<int:product_id>', methods=['GET'])
-def get_related_products(product_id):
-    """Get related products for a given product (same category first, then random)"""
+@with_requested_fields
+def get_related_products(product_id, fields):
+    """Get related products for a given product (co-purchased and same category first, then popular)"""
     try:
         # Get the current product to find its category
         current_product = Product.query.get(product_id)
@@ -151,18 +422,13 @@ def get_related_products(product_id):
             }), 404
         
         limit = request.args.get('limit', 4, type=int)
-        category = current_product.category
-        
-        # First, try to get products from the same category (excluding current product)
-        same_category_products = Product.query.filter(
-            Product.id != product_id,
-            Product.category == category,
-            Product.is_active == True
-        ).order_by(db.func.random()).limit(limit).all()
         
-        related_products = same_category_products
+        # Precomputed recommendations (co-purchases and same category)
+        related_products = related_products_index.get_related(
+            product_id, limit, options=Product.load_options(fields)
+        )
         
-        # If we don't have enough products from the same category, fill with random products
+        # If we don't have enough related products, fill with popular products
         if len(related_products) < limit:
             needed = limit - len(related_products)
             existing_ids = [p.id for p in related_products] + [product_id]
@@ -170,12 +436,14 @@ def get_related_products(product_id):
             additional_products = Product.query.filter(
                 ~Product.id.in_(existing_ids),
                 Product.is_active == True
-            ).order_by(db.func.random()).limit(needed).all()
+            ).options(*Product.load_options(fields)).order_by(
+                Product.sales_count.desc(), Product.id.desc()
+            ).limit(needed).all()
             
             related_products.extend(additional_products)
         
         return jsonify({
-            'products': [product.to_dict() for product in related_products],
+            'products': Product.serialize_many(related_products, fields=fields),
             'total': len(related_products),
             'status': 'success'
         })
@@ -188,6 +456,7 @@ def get_related_products(product_id):
         }), 500
 
 @products_bp.route('/categories', methods=['GET'])
+@cached_catalog_response()
 def get_categories():
     """Get all unique product categories"""
     try:
@@ -207,7 +476,9 @@ def get_categories():
         }), 500
 
 @products_bp.route('/featured', methods=['GET'])
-def get_featured_products():
+@cached_catalog_response()
+@with_requested_fields
+def get_featured_products(fields):
     """Get featured products"""
     try:
         limit = request.args.get('limit', 4, type=int)
@@ -215,10 +486,10 @@ def get_featured_products():
         products = Product.query.filter_by(
             is_active=True, 
             is_featured=True
-        ).order_by(Product.created_at.desc()).limit(limit).all()
+        ).options(*Product.load_options(fields)).order_by(Product.created_at.desc()).limit(limit).all()
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
+            'products': Product.serialize_many(products, fields=fields),
             'status': 'success'
         })
         
@@ -230,18 +501,23 @@ def get_featured_products():
         }), 500
 
 @products_bp.route('/bestsellers', methods=['GET'])
-def get_bestsellers():
+@cached_catalog_response()
+@with_requested_fields
+def get_bestsellers(fields):
     """Get bestselling products"""
     try:
         limit = request.args.get('limit', 4, type=int)
         
-        products = Product.query.filter_by(
-            is_active=True, 
-            is_bestseller=True
-        ).order_by(Product.sales_count.desc()).limit(limit).all()
+        # Trending products first; flagged bestsellers fill in when little is selling
+        products = Product.query.filter(
+            Product.is_active == True,
+            db.or_(Product.is_bestseller == True, Product.trending_score > 0)
+        ).options(*Product.load_options(fields)).order_by(
+            Product.trending_score.desc(), Product.id.desc()
+        ).limit(limit).all()
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
+            'products': Product.serialize_many(products, fields=fields),
             'status': 'success'
         })
         
@@ -295,15 +571,8 @@ def debug_admin_get_products():
                 query = query.filter(Product.stock_quantity == 0)
         
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term),
-                    Product.slug.ilike(search_term),
-                    Product.tags.ilike(search_term)
-                )
-            )
+            # Full-text match, ordered by relevance (ties broken by the ordering below)
+            query = product_search.apply(query, search)
         
         # Order by updated_at (most recently updated first)
         query = query.order_by(Product.updated_at.desc())
@@ -319,19 +588,17 @@ def debug_admin_get_products():
         print(f"🔧 DEBUG: Found {len(products)} products")
         
         # Get category counts for admin
-        category_counts = {}
-        all_categories = db.session.query(Product.category).distinct().all()
-        for cat in all_categories:
-            if cat[0]:
-                category_counts[cat[0]] = Product.query.filter_by(category=cat[0]).count()
+        stats = catalog_stats.get()
+        category_counts = stats['category_counts']
         
         print(f"🔧 DEBUG: Category counts: {category_counts}")
         
-        # Convert to dict
+        # Convert to dict (badges resolved once for the whole page)
+        badge_map = Product.load_badge_map(products)
         product_dicts = []
         for product in products:
             try:
-                product_dict = product.to_dict()
+                product_dict = product.to_dict(badge_map=badge_map)
                 product_dicts.append(product_dict)
             except Exception as e:
                 print(f"🔧 DEBUG: Error converting {product.name}: {e}")
@@ -350,7 +617,7 @@ def debug_admin_get_products():
                 'has_prev': products_pagination.has_prev
             },
             'category_counts': category_counts,
-            'total_products': Product.query.count(),
+            'total_products': stats['total_products'],
             'status': 'success'
         }
         
@@ -368,7 +635,9 @@ def debug_admin_get_products():
         }), 500
 
 @products_bp.route('/new', methods=['GET'])
-def get_new_products():
+@cached_catalog_response()
+@with_requested_fields
+def get_new_products(fields):
     """Get new products"""
     try:
         limit = request.args.get('limit', 4, type=int)
@@ -376,10 +645,10 @@ def get_new_products():
         products = Product.query.filter_by(
             is_active=True, 
             is_new=True
-        ).order_by(Product.created_at.desc()).limit(limit).all()
+        ).options(*Product.load_options(fields)).order_by(Product.created_at.desc()).limit(limit).all()
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
+            'products': Product.serialize_many(products, fields=fields),
             'status': 'success'
         })
         
@@ -436,7 +705,8 @@ def admin_required(f):
 
 @products_bp.route('/admin', methods=['GET'])
 @admin_required
-def admin_get_products():
+@with_requested_fields
+def admin_get_products(fields):
     """Get all products for admin (including inactive ones)"""
     try:
         # Get query parameters
@@ -447,8 +717,14 @@ def admin_get_products():
         stock = request.args.get('stock')    # 'in-stock', 'low-stock', 'out-of-stock', 'all'
         search = request.args.get('search')
         
+        if search and 'cursor' in request.args:
+            return jsonify({
+                'message': SEARCH_CURSOR_ERROR,
+                'status': 'error'
+            }), 400
+        
         # Build query (admin sees all products including inactive)
-        query = Product.query
+        query = Product.query.options(*Product.load_options(fields))
         
         # Apply filters
         if category and category != 'all':
@@ -472,47 +748,54 @@ def admin_get_products():
                 query = query.filter(Product.stock_quantity == 0)
         
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term),
-                    Product.slug.ilike(search_term),
-                    Product.tags.ilike(search_term)
-                )
-            )
+            # Full-text match, ordered by relevance (ties broken by the ordering below)
+            query = product_search.apply(query, search)
         
         # Order by updated_at (most recently updated first)
         query = query.order_by(Product.updated_at.desc())
         
-        # Paginate results
-        products_pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        products = products_pagination.items
-        
-        # Get category counts for admin
-        category_counts = {}
-        all_categories = db.session.query(Product.category).distinct().all()
-        for cat in all_categories:
-            if cat[0]:
-                category_counts[cat[0]] = Product.query.filter_by(category=cat[0]).count()
-        
-        return jsonify({
-            'products': [product.to_dict() for product in products],
-            'pagination': {
+        if 'cursor' in request.args:
+            # Keyset pagination (?cursor= for the first page); total only on request
+            try:
+                products, pagination = keyset_paginate(
+                    query, 'updated_at', Product.updated_at, Product.id,
+                    cursor=request.args.get('cursor'),
+                    per_page=per_page,
+                    include_total=get_flag('include_total')
+                )
+            except InvalidCursor as e:
+                return jsonify({
+                    'message': str(e),
+                    'status': 'error'
+                }), 400
+        else:
+            # Paginate results
+            products_pagination = query.paginate(
+                page=page, 
+                per_page=per_page, 
+                error_out=False
+            )
+            
+            products = products_pagination.items
+            pagination = {
                 'page': page,
                 'per_page': per_page,
                 'total': products_pagination.total,
                 'pages': products_pagination.pages,
                 'has_next': products_pagination.has_next,
                 'has_prev': products_pagination.has_prev
-            },
-            'category_counts': category_counts,
-            'total_products': Product.query.count(),
+            }
+        
+        # Get category/status/stock counters for admin (one aggregate query, cached)
+        stats = catalog_stats.get()
+        
+        return jsonify({
+            'products': Product.serialize_many(products, fields=fields),
+            'pagination': pagination,
+            'category_counts': stats['category_counts'],
+            'status_counts': stats['status_counts'],
+            'stock_counts': stats['stock_counts'],
+            'total_products': stats['total_products'],
             'status': 'success'
         })
         
@@ -523,9 +806,209 @@ def admin_get_products():
             'status': 'error'
         }), 500
 
+@products_bp.route('/admin/stats', methods=['GET'])
+@admin_required
+def admin_get_stats():
+    """Get all admin catalog counters (per category, status, stock band and badge totals)"""
+    try:
+        stats = catalog_stats.get(use_cache=not get_flag('refresh'))
+        
+        return jsonify({
+            'stats': stats,
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'message': 'Error fetching admin stats',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@products_bp.route('/admin/trending/rebuild', methods=['POST'])
+@admin_required
+def admin_rebuild_trending():
+    """Recompute trending scores from recent order history"""
+    try:
+        scored = trending_scores.rebuild(request.args.get('window_days', type=int))
+        catalog_version.bump()
+        
+        return jsonify({
+            'message': f'Trending scores rebuilt for {scored} products',
+            'scored_products': scored,
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'message': 'Error rebuilding trending scores',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@products_bp.route('/admin/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_update_products():
+    """Apply one operation to every product matching a selector in a single UPDATE"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            updated, refresh_ids = product_bulk_update.apply(data.get('selector'), data.get('operation'))
+        except ValueError as e:
+            return jsonify({
+                'message': str(e),
+                'status': 'error'
+            }), 400
+        
+        if updated:
+            catalog_version.bump()
+        related_products_index.mark_stale(refresh_ids)
+        
+        return jsonify({
+            'message': f'{updated} products updated',
+            'updated': updated,
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'message': 'Error updating products',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+def get_transfer_format(filename=None):
+    """Resolve the import/export format from ?format=, the file extension or the content type"""
+    fmt = request.args.get('format')
+    if not fmt and filename and '.' in filename:
+        fmt = filename.rsplit('.', 1)[1]
+    if not fmt and request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        fmt = 'jsonl'
+    fmt = (fmt or 'csv').lower()
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}' (use csv or jsonl)")
+    return fmt
+
+@products_bp.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import_products():
+    """Import products from a CSV or JSONL upload (multipart 'file' field or raw request body)"""
+    try:
+        upload = request.files.get('file')
+        try:
+            fmt = get_transfer_format(upload.filename if upload else None)
+        except ValueError as e:
+            return jsonify({'message': str(e), 'status': 'error'}), 400
+        
+        result = product_io.import_stream(upload.stream if upload else request.stream, fmt)
+        if result['imported'] or result['updated']:
+            catalog_version.bump()
+        
+        return jsonify({
+            'message': f"Imported {result['imported']} products, updated {result['updated']}",
+            **result,
+            'status': 'success'
+        }), 201 if result['imported'] else 200
+        
+    except ValueError as e:
+        # Unreadable file (e.g. not UTF-8)
+        return jsonify({
+            'message': str(e),
+            'status': 'error'
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            'message': 'Error importing products',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@products_bp.route('/admin/export', methods=['GET'])
+@admin_required
+def admin_export_products():
+    """Stream the whole catalog as CSV or JSONL"""
+    try:
+        fmt = get_transfer_format()
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+    
+    filename = f"products-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(product_io.export_lines(fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Product image slots an upload can be attached to
+IMAGE_SLOTS = ('primary', 'secondary', 'gallery')
+
+@products_bp.route('/admin/images', methods=['POST'])
+@admin_required
+def admin_upload_image():
+    """Upload a product image (multipart 'file') and render its resized derivatives
+    
+    Optional form fields product_id and slot (primary, secondary or gallery)
+    attach the image to a product.
+    """
+    try:
+        product_id = request.form.get('product_id', type=int)
+        slot = request.form.get('slot', 'primary' if product_id else None)
+        if slot is not None and slot not in IMAGE_SLOTS:
+            return jsonify({
+                'message': f"Invalid slot. Must be one of: {', '.join(IMAGE_SLOTS)}",
+                'status': 'error'
+            }), 400
+        
+        product = None
+        if product_id:
+            product = db.session.get(Product, product_id)
+            if not product:
+                return jsonify({
+                    'message': 'Product not found',
+                    'status': 'error'
+                }), 404
+        
+        try:
+            image = image_pipeline.save_upload(request.files.get('file'))
+        except ValueError as e:
+            return jsonify({
+                'message': str(e),
+                'status': 'error'
+            }), 400
+        
+        if product:
+            if slot == 'gallery':
+                product.gallery_images = product.get_gallery_images_list() + [image['url']]
+            else:
+                setattr(product, f'{slot}_image', image['url'])
+            product.updated_at = datetime.utcnow()
+            db.session.commit()
+            catalog_version.bump()
+        
+        return jsonify({
+            'message': 'Image uploaded successfully',
+            'image': image,
+            'product_id': product.id if product else None,
+            'status': 'success'
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'message': 'Error uploading image',
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
 @products_bp.route('/admin/<int:product_id>', methods=['GET'])
 @admin_required
-def admin_get_product(product_id):
+@with_requested_fields
+def admin_get_product(product_id, fields):
     """Get a single product by ID for admin (including inactive)"""
     try:
         product = Product.query.get(product_id)
@@ -537,7 +1020,7 @@ def admin_get_product(product_id):
             }), 404
         
         return jsonify({
-            'product': product.to_dict(),
+            'product': product.to_dict(fields=fields),
             'status': 'success'
         })
         
@@ -555,6 +1038,10 @@ def admin_create_product():
     try:
         data = request.get_json()
         
+        error_response = validate_json_fields(data)
+        if error_response:
+            return error_response
+        
         # NO REQUIRED FIELDS - allow saving with any data
         
         # Set default stock_quantity if not provided
@@ -570,34 +1057,8 @@ def admin_create_product():
             from datetime import datetime
             slug = f"product-{int(datetime.now().timestamp())}"
         
-        # Check if slug already exists
-        existing_product = Product.query.filter_by(slug=slug).first()
-        if existing_product:
-            # Add number suffix to make it unique
-            counter = 1
-            while existing_product:
-                new_slug = f"{slug}-{counter}"
-                existing_product = Product.query.filter_by(slug=new_slug).first()
-                counter += 1
-            slug = new_slug
-        
-        # Handle gallery images (convert list to JSON string if provided)
-        gallery_images = data.get('gallery_images')
-        if isinstance(gallery_images, list):
-            import json
-            gallery_images = json.dumps(gallery_images)
-        
-        # Handle gallery items (convert list to JSON string if provided)
-        gallery_items = data.get('gallery_items')
-        if isinstance(gallery_items, list):
-            import json
-            gallery_items = json.dumps(gallery_items)
-        
-        # Handle badge IDs (convert list to JSON string if provided)
-        badge_ids = data.get('badge_ids')
-        if isinstance(badge_ids, list):
-            import json
-            badge_ids = json.dumps(badge_ids)
+        # Add a number suffix if the slug already exists
+        slug = Product.allocate_slugs([slug])[0]
         
         # Create new product with defaults for missing fields
         product = Product(
@@ -626,14 +1087,16 @@ def admin_create_product():
             tags=data.get('tags'),
             primary_image=data.get('primary_image'),
             secondary_image=data.get('secondary_image'),
-            gallery_images=gallery_images,
-            gallery_items=gallery_items,
+            gallery_images=data.get('gallery_images'),
+            gallery_items=data.get('gallery_items'),
             video_url=data.get('video_url'),
-            badge_ids=badge_ids
+            badge_ids=data.get('badge_ids')
         )
         
         db.session.add(product)
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(product.id)
         
         return jsonify({
             'message': 'Product created successfully',
@@ -664,6 +1127,10 @@ def admin_update_product(product_id):
         
         data = request.get_json()
         
+        error_response = validate_json_fields(data)
+        if error_response:
+            return error_response
+        
         # Update fields if provided
         if 'name' in data:
             product.name = data['name']
@@ -678,17 +1145,9 @@ def admin_update_product(product_id):
         else:
             new_slug = product.slug  # Keep existing slug
             
-        # Check if slug needs to be updated and is unique
+        # Add a number suffix if the slug is taken by another product
         if new_slug != product.slug:
-            existing_product = Product.query.filter_by(slug=new_slug).filter(Product.id != product_id).first()
-            if existing_product:
-                counter = 1
-                while existing_product:
-                    numbered_slug = f"{new_slug}-{counter}"
-                    existing_product = Product.query.filter_by(slug=numbered_slug).filter(Product.id != product_id).first()
-                    counter += 1
-                new_slug = numbered_slug
-            product.slug = new_slug
+            product.slug = Product.allocate_slugs([new_slug], ignore=[product.slug])[0]
         
         # Update other fields
         updateable_fields = [
@@ -704,23 +1163,13 @@ def admin_update_product(product_id):
                     setattr(product, field, float(data[field]))
                 elif field in ['stock_quantity', 'low_stock_threshold'] and data[field] is not None:
                     setattr(product, field, int(data[field]))
-                elif field == 'gallery_images' and isinstance(data[field], list):
-                    # Convert list to JSON string for gallery_images
-                    import json
-                    setattr(product, field, json.dumps(data[field]))
-                elif field == 'gallery_items' and isinstance(data[field], list):
-                    # Convert list to JSON string for gallery_items
-                    import json
-                    setattr(product, field, json.dumps(data[field]))
-                elif field == 'badge_ids' and isinstance(data[field], list):
-                    # Convert list to JSON string for badge_ids
-                    import json
-                    setattr(product, field, json.dumps(data[field]))
                 else:
                     setattr(product, field, data[field])
         
         product.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(product.id)
         
         return jsonify({
             'message': 'Product updated successfully',
@@ -754,6 +1203,8 @@ def admin_delete_product(product_id):
         product.is_active = False
         product.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(product.id)
         
         return jsonify({
             'message': 'Product deleted successfully',
@@ -786,14 +1237,7 @@ def admin_duplicate_product(product_id):
         duplicate_slug = generate_slug(duplicate_name)
         
         # Ensure unique slug
-        existing_product = Product.query.filter_by(slug=duplicate_slug).first()
-        if existing_product:
-            counter = 1
-            while existing_product:
-                new_slug = f"{duplicate_slug}-{counter}"
-                existing_product = Product.query.filter_by(slug=new_slug).first()
-                counter += 1
-            duplicate_slug = new_slug
+        duplicate_slug = Product.allocate_slugs([duplicate_slug])[0]
         
         # Create duplicate product
         duplicate_product = Product(
@@ -825,6 +1269,8 @@ def admin_duplicate_product(product_id):
         
         db.session.add(duplicate_product)
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(duplicate_product.id)
         
         return jsonify({
             'message': 'Product duplicated successfully',
@@ -856,6 +1302,8 @@ def admin_toggle_product_status(product_id):
         product.is_active = not product.is_active
         product.updated_at = datetime.utcnow()
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(product.id)
         
         status_text = 'activated' if product.is_active else 'deactivated'
         
@@ -879,6 +1327,10 @@ def create_product():
     try:
         data = request.get_json()
         
+        error_response = validate_json_fields(data)
+        if error_response:
+            return error_response
+        
         # Create new product
         product = Product(
             name=data.get('name'),
@@ -909,11 +1361,12 @@ def create_product():
         # Handle badge assignment
         badge_ids = data.get('badge_ids', [])
         if badge_ids:
-            import json
-            product.badge_ids = json.dumps(badge_ids)
+            product.badge_ids = badge_ids
         
         db.session.add(product)
         db.session.commit()
+        catalog_version.bump()
+        related_products_index.refresh_product(product.id)
         
         return jsonify({
             'product': product.to_dict(),
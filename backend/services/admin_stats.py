@@ -0,0 +1,92 @@
+"""
+Admin dashboard counters
+Computes product counts per category, status and stock band plus badge totals
+with one grouped aggregate query per table, cached until the catalog changes
+"""
+
+import threading
+import time
+from flask import current_app
+from sqlalchemy import case, func
+from extensions import db
+from services.catalog_cache import catalog_version
+
+
+def _count_where(condition):
+    """SUM(CASE WHEN condition THEN 1 ELSE 0 END)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+class CatalogStats:
+    """Aggregated catalog counters for the admin screens"""
+
+    def __init__(self):
+        self._cached = None  # (catalog version, computed at, stats)
+        self._lock = threading.Lock()
+
+    def get(self, use_cache=True):
+        """
+        Return all admin counters
+
+        Returns:
+            Dict with total_products, category_counts, status_counts,
+            stock_counts and badge_counts
+        """
+        version = catalog_version.current
+        ttl = current_app.config.get('CATALOG_CACHE_TTL', 60)
+        cached = self._cached
+        if use_cache and cached is not None and cached[0] == version and time.monotonic() - cached[1] <= ttl:
+            return cached[2]
+
+        stats = self._compute()
+        with self._lock:
+            self._cached = (version, time.monotonic(), stats)
+        return stats
+
+    def _compute(self):
+        from models import Product, Badge
+
+        rows = db.session.query(
+            Product.category,
+            func.count(Product.id),
+            _count_where(Product.is_active == True),
+            _count_where(Product.stock_quantity > Product.low_stock_threshold),
+            _count_where((Product.stock_quantity <= Product.low_stock_threshold) & (Product.stock_quantity > 0)),
+            _count_where(Product.stock_quantity == 0)
+        ).group_by(Product.category).all()
+
+        category_counts = {}
+        totals = [0, 0, 0, 0, 0]
+        for category, *counts in rows:
+            if category:
+                category_counts[category] = counts[0]
+            totals = [total + int(count) for total, count in zip(totals, counts)]
+        total_products, active, in_stock, low_stock, out_of_stock = totals
+
+        badge_total, badge_active, badge_category = db.session.query(
+            func.count(Badge.id),
+            _count_where(Badge.is_active == True),
+            _count_where(Badge.is_category_badge == True)
+        ).one()
+
+        return {
+            'total_products': total_products,
+            'category_counts': category_counts,
+            'status_counts': {
+                'active': active,
+                'inactive': total_products - active
+            },
+            'stock_counts': {
+                'in-stock': in_stock,
+                'low-stock': low_stock,
+                'out-of-stock': out_of_stock
+            },
+            'badge_counts': {
+                'total': int(badge_total),
+                'active': int(badge_active),
+                'category': int(badge_category)
+            }
+        }
+
+# Global stats instance
+catalog_stats = CatalogStats()
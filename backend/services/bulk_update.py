@@ -0,0 +1,228 @@
+"""
+Set-based bulk product updates
+Applies one admin operation (set fields, percentage price change, stock delta,
+activate/deactivate) to every product matched by a selector as a single
+UPDATE statement in one transaction
+"""
+
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import Numeric, and_, case, cast, exists, func, literal, select, true, update
+from sqlalchemy.dialects.postgresql import JSONB
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SELECTOR_KEYS = ('ids', 'category', 'tag', 'badge', 'all')
+OPERATIONS = ('set', 'price_percent', 'stock_delta', 'activate', 'deactivate')
+
+# Fields the 'set' operation may change, by value type
+FLAG_FIELDS = ('is_active', 'is_featured', 'is_bestseller', 'is_new', 'track_inventory')
+PRICE_FIELDS = ('price', 'original_price', 'cost_price')
+COUNT_FIELDS = ('stock_quantity', 'low_stock_threshold')
+TEXT_FIELDS = ('category', 'skin_type')
+
+# Changing these affects related-product rows
+RELATED_FIELDS = ('is_active', 'category')
+
+
+def _flag(name, value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('1', 'true', '0', 'false'):
+        return value.lower() in ('1', 'true')
+    raise ValueError(f'{name} must be true or false')
+
+def _number(name, value, convert):
+    try:
+        number = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if number < 0:
+        raise ValueError(f'{name} must not be negative')
+    return number
+
+
+class ProductBulkUpdate:
+    """Validates bulk requests and runs them as one UPDATE"""
+
+    def selector_clause(self, selector):
+        """
+        Build the WHERE clause for a selector
+
+        Selector keys (combined with AND): ids (list), category, tag, badge
+        (badge id), or all=true to target the whole catalog.
+
+        Raises:
+            ValueError: for an empty or malformed selector
+        """
+        from models import Product
+
+        if not isinstance(selector, dict) or not selector:
+            raise ValueError(f"selector must be an object with one of: {', '.join(SELECTOR_KEYS)}")
+        unknown = set(selector) - set(SELECTOR_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown selector keys: {', '.join(sorted(unknown))}")
+
+        conditions = []
+        if 'ids' in selector:
+            ids = selector['ids']
+            if not isinstance(ids, list) or not ids:
+                raise ValueError('ids must be a non-empty list')
+            try:
+                conditions.append(Product.id.in_({int(product_id) for product_id in ids}))
+            except (TypeError, ValueError):
+                raise ValueError('ids must be product ids')
+        if selector.get('category'):
+            conditions.append(Product.category == selector['category'])
+        if selector.get('tag'):
+            conditions.append(self._tag_clause(str(selector['tag'])))
+        if 'badge' in selector:
+            try:
+                badge_id = int(selector['badge'])
+            except (TypeError, ValueError):
+                raise ValueError('badge must be a badge id')
+            conditions.append(self._badge_clause(badge_id))
+        if selector.get('all') is True and not conditions:
+            conditions.append(true())
+
+        if not conditions:
+            raise ValueError('selector matches nothing; use all=true to target every product')
+        return and_(*conditions)
+
+    @staticmethod
+    def _tag_clause(tag):
+        """Match one entry of the comma-separated tags column (case and spacing insensitive)"""
+        from models import Product
+
+        normalized = tag.replace(' ', '').lower()
+        tags = literal(',') + func.lower(func.replace(func.coalesce(Product.tags, ''), ' ', '')) + literal(',')
+        return tags.contains(f',{normalized},', autoescape=True)
+
+    @staticmethod
+    def _badge_clause(badge_id):
+        """Match products whose badge_ids list contains the badge (legacy string ids included)"""
+        from models import Product
+
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            return (Product.badge_ids.op('@>')(cast(json.dumps([badge_id]), JSONB))
+                    | Product.badge_ids.op('@>')(cast(json.dumps([str(badge_id)]), JSONB)))
+        if dialect == 'sqlite':
+            entries = func.json_each(Product.badge_ids).table_valued('value')
+            return and_(
+                func.json_valid(Product.badge_ids) == 1,
+                exists(select(1).select_from(entries).where(cast(entries.c.value, db.String) == str(badge_id)))
+            )
+        raise ValueError(f'Badge selectors are not supported on {dialect}')
+
+    def values_for(self, operation):
+        """
+        Build the SET values for an operation
+
+        Operations ({'type': ...}):
+            set: {'fields': {...}} for flags, prices, stock counts, category, skin_type
+            price_percent: {'percent': -10, 'as_sale': true} changes prices by a percentage;
+                           as_sale keeps the pre-sale price in original_price
+            stock_delta: {'delta': 5} adds to stock_quantity (never below zero)
+            activate / deactivate
+
+        Raises:
+            ValueError: for unknown operations or invalid values
+        """
+        from models import Product
+
+        if not isinstance(operation, dict) or operation.get('type') not in OPERATIONS:
+            raise ValueError(f"operation.type must be one of: {', '.join(OPERATIONS)}")
+        op = operation['type']
+
+        if op == 'activate':
+            return {'is_active': True}
+        if op == 'deactivate':
+            return {'is_active': False}
+
+        if op == 'stock_delta':
+            try:
+                delta = int(operation.get('delta'))
+            except (TypeError, ValueError):
+                raise ValueError('delta must be a whole number')
+            stock = func.coalesce(Product.stock_quantity, 0) + delta
+            return {'stock_quantity': case((stock < 0, 0), else_=stock)}
+
+        if op == 'price_percent':
+            try:
+                percent = float(operation.get('percent'))
+            except (TypeError, ValueError):
+                raise ValueError('percent must be a number')
+            if percent <= -100:
+                raise ValueError('percent must be greater than -100')
+            # Numeric factor keeps the arithmetic in NUMERIC (PostgreSQL has no round(float, int))
+            factor = literal(Decimal(str(1 + percent / 100)), Numeric(12, 6))
+            values = {'price': func.round(Product.price * factor, 2)}
+            if operation.get('as_sale'):
+                if percent >= 0:
+                    raise ValueError('as_sale needs a negative percent')
+                # Keep an existing higher original price (already on sale), else remember the current one
+                values['original_price'] = case(
+                    (Product.original_price > Product.price, Product.original_price),
+                    else_=Product.price
+                )
+            return values
+
+        fields = operation.get('fields')
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError('fields must be a non-empty object')
+        values = {}
+        for name, value in fields.items():
+            if name in FLAG_FIELDS:
+                values[name] = _flag(name, value)
+            elif name in PRICE_FIELDS:
+                values[name] = None if value is None and name != 'price' else _number(name, value, float)
+            elif name in COUNT_FIELDS:
+                values[name] = _number(name, value, int)
+            elif name in TEXT_FIELDS:
+                values[name] = value or None
+            else:
+                raise ValueError(f'Field {name} cannot be bulk updated')
+        return values
+
+    def apply(self, selector, operation):
+        """
+        Run the operation against every selected product in one UPDATE and commit
+
+        Returns:
+            (number of products updated, ids of products whose related rows need
+            refreshing)
+        """
+        from models import Product
+
+        where = self.selector_clause(selector)
+        values = self.values_for(operation)
+        values['updated_at'] = datetime.utcnow()
+        affects_related = any(name in values for name in RELATED_FIELDS)
+
+        statement = update(Product.__table__).where(where).values(values)
+        try:
+            refresh_ids = []
+            if affects_related and db.engine.dialect.update_returning:
+                refresh_ids = [row[0] for row in db.session.execute(statement.returning(Product.__table__.c.id))]
+                updated = len(refresh_ids)
+            else:
+                if affects_related:
+                    refresh_ids = [row[0] for row in db.session.query(Product.id).filter(where).all()]
+                updated = db.session.execute(statement).rowcount
+            db.session.commit()
+            # Loaded instances may hold the old values
+            db.session.expire_all()
+            return updated, refresh_ids
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Bulk product update failed: {e}")
+            raise
+
+# Global bulk update instance
+product_bulk_update = ProductBulkUpdate()
@@ -0,0 +1,118 @@
+"""
+Catalog versioning and response caching for public catalog endpoints
+Admin writes bump the catalog version, which invalidates every cached response
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request, make_response
+
+
+class CatalogVersion:
+    """Process-wide counter identifying the current state of the catalog"""
+
+    def __init__(self):
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._version
+
+    def bump(self):
+        """Mark the catalog as changed; call after committing product or badge changes"""
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses tagged with the catalog version"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['version'] != version or time.monotonic() - entry['stored_at'] > ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, version, body, mimetype):
+        entry = {
+            'version': version,
+            'stored_at': time.monotonic(),
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha1(body).hexdigest()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global instances
+catalog_version = CatalogVersion()
+response_cache = ResponseCache()
+
+
+def cache_key():
+    """Cache key for the current request: path plus sorted query args"""
+    # Empty values are kept: ?cursor= starts keyset paging and answers differently from no cursor
+    args = sorted((key, value) for key, values in request.args.lists() for value in values)
+    return request.path + '?' + urlencode(args)
+
+
+def cached_catalog_response(on_hit=None):
+    """
+    Cache a public catalog GET endpoint until the catalog version changes
+
+    Responses carry a strong ETag so clients can revalidate with If-None-Match
+    and receive a 304. Only 200 responses are cached. on_hit, if given, is
+    called with the view arguments when a cached response is served.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('CATALOG_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+
+            key = cache_key()
+            version = catalog_version.current
+            ttl = current_app.config.get('CATALOG_CACHE_TTL', 60)
+
+            entry = response_cache.get(key, version, ttl)
+            if entry is not None:
+                if on_hit:
+                    on_hit(*args, **kwargs)
+                response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.set(key, version, response.get_data(), response.mimetype)
+
+            response.set_etag(entry['etag'])
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+
+        return wrapper
+    return decorator
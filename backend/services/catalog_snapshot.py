@@ -0,0 +1,115 @@
+"""
+In-process catalog snapshot
+Compact read-only product records indexed by id and slug for cart and checkout
+hot paths. The snapshot is rebuilt in one query whenever the catalog version
+changes and swapped in atomically, so readers never see a half-built index.
+Stock shown from it is advisory; stock-critical checks still read the database.
+"""
+
+import threading
+import time
+from flask import current_app
+from extensions import db
+from services.catalog_cache import catalog_version
+
+
+class ProductRecord:
+    """Immutable subset of a product row used for price and availability lookups"""
+
+    __slots__ = (
+        'id', 'name', 'slug', 'price', 'original_price', 'category', 'size',
+        'primary_image', 'is_active', 'track_inventory', 'stock_quantity'
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ProductRecord is read-only')
+
+    def __repr__(self):
+        return f'<ProductRecord {self.id} {self.name}>'
+
+    @property
+    def is_in_stock(self):
+        """Same rule as Product.is_in_stock"""
+        if not self.track_inventory:
+            return True
+        return (self.stock_quantity or 0) > 0
+
+
+class CatalogSnapshot:
+    """One consistent view of the catalog"""
+
+    __slots__ = ('version', 'built_at', 'by_id', 'by_slug')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.by_id = {record.id: record for record in records}
+        self.by_slug = {record.slug: record for record in records}
+
+    def get(self, product_id):
+        """Record for a product id (int or numeric string), or None"""
+        try:
+            return self.by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_slug(self, slug):
+        """Record for a product slug, or None"""
+        return self.by_slug.get(slug)
+
+
+class CatalogSnapshotCache:
+    """Holds the current snapshot and rebuilds it when the catalog changes"""
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Return an up-to-date snapshot
+
+        Rebuilt when this process bumped the catalog version, and at least every
+        CATALOG_CACHE_TTL seconds to pick up edits made by other workers.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh(snapshot):
+            return snapshot
+
+        with self._lock:
+            # Another thread may have rebuilt it while we waited
+            snapshot = self._snapshot
+            if snapshot is None or not self._is_fresh(snapshot):
+                snapshot = self._build()
+                self._snapshot = snapshot
+            return snapshot
+
+    def get(self, product_id):
+        """Shortcut for current().get(product_id)"""
+        return self.current().get(product_id)
+
+    def invalidate(self):
+        """Drop the snapshot so the next read rebuilds it"""
+        self._snapshot = None
+
+    @staticmethod
+    def _is_fresh(snapshot):
+        ttl = current_app.config.get('CATALOG_CACHE_TTL', 60)
+        return snapshot.version == catalog_version.current and time.monotonic() - snapshot.built_at <= ttl
+
+    @staticmethod
+    def _build():
+        from models import Product
+
+        # Read the version first: a bump during the query makes the next read rebuild again
+        version = catalog_version.current
+        columns = [getattr(Product, name) for name in ProductRecord.__slots__]
+        rows = db.session.query(*columns).all()
+        return CatalogSnapshot(version, [ProductRecord(**row._asdict()) for row in rows])
+
+# Global catalog snapshot instance
+catalog_snapshot = CatalogSnapshotCache()
@@ -0,0 +1,238 @@
+"""
+Faceted product search
+Counts category, skin type, price band, sale, stock and badge facets for a
+filtered product listing in a single grouped query
+"""
+
+from sqlalchemy import String, and_, case, cast, exists, func, literal, not_, or_, select, true, union_all
+from sqlalchemy.dialects.postgresql import JSONB
+from extensions import db
+
+# (key, min inclusive, max exclusive) in THB
+PRICE_BANDS = (
+    ('under-500', None, 500),
+    ('500-1000', 500, 1000),
+    ('1000-2000', 1000, 2000),
+    ('2000-plus', 2000, None),
+)
+
+FACETS = ('category', 'skin_type', 'price', 'on_sale', 'in_stock', 'badge')
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+def price_band_expression(price):
+    """SQL CASE mapping a price column to its PRICE_BANDS key"""
+    price = func.coalesce(price, 0)
+    whens = []
+    for key, low, high in PRICE_BANDS:
+        bounds = [price >= low] if low is not None else []
+        bounds += [price < high] if high is not None else []
+        whens.append((and_(*bounds), key))
+    return case(*whens, else_=None)
+
+
+def badge_entries(column):
+    """
+    Table-valued function yielding one text `value` per entry of a badge_ids column
+
+    Rows whose badge_ids is not a JSON array yield nothing.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        array = case((func.jsonb_typeof(column) == 'array', column), else_=cast('[]', JSONB))
+        return func.jsonb_array_elements_text(array).table_valued('value').lateral()
+    if dialect == 'sqlite':
+        array = case((func.json_valid(column) == 1, column), else_='[]')
+        return func.json_each(array).table_valued('value')
+    raise ValueError(f'Badge facets are not supported on {dialect}')
+
+
+class ProductFacets:
+    """Filter parsing and facet counting for the /facets endpoint"""
+
+    @staticmethod
+    def parse_filters(args):
+        """
+        Read facet filters from request args
+
+        category, skin_type, price_band and badge accept comma-separated values
+        (any of them may match); on_sale and in_stock accept true/false.
+
+        Raises:
+            ValueError: for unknown price bands, non-numeric badge ids or bad booleans
+        """
+        def values(name):
+            raw = args.get(name)
+            return {value.strip() for value in raw.split(',') if value.strip()} if raw else None
+
+        def boolean(name):
+            raw = args.get(name)
+            if raw is None or raw == '':
+                return None
+            if raw.lower() in TRUE_VALUES:
+                return True
+            if raw.lower() in FALSE_VALUES:
+                return False
+            raise ValueError(f"Invalid value for {name}: {raw}")
+
+        filters = {
+            'category': values('category'),
+            'skin_type': values('skin_type'),
+            'price': values('price_band'),
+            'on_sale': boolean('on_sale'),
+            'in_stock': boolean('in_stock'),
+            'badge': values('badge'),
+        }
+
+        valid_bands = {key for key, _, _ in PRICE_BANDS}
+        if filters['price'] and not filters['price'] <= valid_bands:
+            raise ValueError(f"Unknown price band; use one of: {', '.join(key for key, _, _ in PRICE_BANDS)}")
+        if filters['badge']:
+            try:
+                filters['badge'] = {int(badge_id) for badge_id in filters['badge']}
+            except ValueError:
+                raise ValueError('Badge filters must be badge ids')
+
+        return filters
+
+    @staticmethod
+    def _facet_values():
+        """SQL expression for each facet's value on a product row"""
+        from models import Product
+
+        on_sale = and_(
+            Product.original_price.isnot(None), Product.original_price != 0,
+            func.coalesce(Product.price, 0) < Product.original_price
+        )
+        in_stock = or_(
+            Product.track_inventory.is_(None), Product.track_inventory == False,
+            func.coalesce(Product.stock_quantity, 0) > 0
+        )
+        return {
+            'category': Product.category,
+            'skin_type': Product.skin_type,
+            'price': price_band_expression(Product.price),
+            'on_sale': on_sale,
+            'in_stock': in_stock,
+        }
+
+    def _conditions(self, filters):
+        """SQL condition for each facet filter that is set"""
+        from models import Product
+
+        values = self._facet_values()
+        conditions = {}
+        for facet in ('category', 'skin_type', 'price'):
+            if filters[facet]:
+                conditions[facet] = values[facet].in_(sorted(filters[facet]))
+        for facet in ('on_sale', 'in_stock'):
+            if filters[facet] is not None:
+                conditions[facet] = values[facet] if filters[facet] else not_(values[facet])
+        if filters['badge']:
+            entries = badge_entries(Product.badge_ids)
+            conditions['badge'] = exists(
+                select(1).select_from(entries)
+                .where(cast(entries.c.value, String).in_(sorted(str(badge_id) for badge_id in filters['badge'])))
+            )
+        return conditions
+
+    def compute(self, base_query, filters):
+        """
+        Apply the filters and count every facet in one grouped query
+
+        Each facet is counted over the products matching all the *other*
+        filters, so selecting one category still shows the counts of the rest.
+        The per-facet counts are GROUP BYs over one narrow subquery joined
+        with UNION ALL; each has its own WHERE, which a single GROUPING SETS
+        aggregate could not express.
+
+        Args:
+            base_query: Product query with the non-facet filters (active, search)
+                        and the listing order applied
+            filters: Output of parse_filters
+
+        Returns:
+            (base_query narrowed to the matching products, their count, facets dict)
+        """
+        from models import Product, Badge
+
+        values = self._facet_values()
+        conditions = self._conditions(filters)
+
+        columns = [Product.id, Product.badge_ids]
+        columns += [
+            case((values[facet], 'true'), else_='false').label(facet) if facet in ('on_sale', 'in_stock')
+            else values[facet].label(facet)
+            for facet in values
+        ]
+        columns += [case((condition, 1), else_=0).label(f'matches_{facet}') for facet, condition in conditions.items()]
+        rows = base_query.order_by(None).with_entities(*columns).subquery('facet_rows')
+
+        def others_match(facet):
+            return and_(true(), *(rows.c[f'matches_{other}'] == 1 for other in conditions if other != facet))
+
+        counts = [
+            select(literal(facet).label('facet'), cast(rows.c[facet], String).label('value'), func.count().label('count'))
+            .select_from(rows).where(others_match(facet))
+            .group_by(rows.c[facet])
+            for facet in values
+        ]
+        entries = badge_entries(rows.c.badge_ids)
+        counts.append(
+            select(literal('badge').label('facet'), cast(entries.c.value, String).label('value'),
+                   func.count(rows.c.id.distinct()).label('count'))
+            .select_from(rows).join(entries, true())
+            .where(others_match('badge'))
+            .group_by(cast(entries.c.value, String))
+        )
+        counts.append(
+            select(literal('total').label('facet'), literal(None, String).label('value'), func.count().label('count'))
+            .select_from(rows).where(others_match(None))
+        )
+
+        counted = {facet: {} for facet in FACETS}
+        total = 0
+        for facet, value, count in db.session.execute(union_all(*counts)):
+            if facet == 'total':
+                total = count
+                continue
+            if value is None:
+                continue
+            if facet == 'badge':
+                if not value.isdigit():
+                    continue
+                value = int(value)
+            elif facet in ('on_sale', 'in_stock'):
+                value = value == 'true'
+            counted[facet][value] = counted[facet].get(value, 0) + count
+
+        badges = Badge.query.filter(
+            Badge.id.in_(list(counted['badge'])), Badge.is_active == True
+        ).order_by(Badge.sort_order, Badge.name).all() if counted['badge'] else []
+
+        def ranked(counter):
+            return [
+                {'value': value, 'count': count}
+                for value, count in sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))
+            ]
+
+        facets = {
+            'category': ranked(counted['category']),
+            'skin_type': ranked(counted['skin_type']),
+            'price': [
+                {'value': key, 'min': low, 'max': high, 'count': counted['price'].get(key, 0)}
+                for key, low, high in PRICE_BANDS
+            ],
+            'on_sale': [{'value': value, 'count': counted['on_sale'].get(value, 0)} for value in (True, False)],
+            'in_stock': [{'value': value, 'count': counted['in_stock'].get(value, 0)} for value in (True, False)],
+            'badge': [
+                {'value': badge.id, 'name': badge.name, 'slug': badge.slug, 'count': counted['badge'][badge.id]}
+                for badge in badges
+            ],
+        }
+        return base_query.filter(*conditions.values()), total, facets
+
+# Global facets instance
+product_facets = ProductFacets()
@@ -0,0 +1,271 @@
+"""
+HTTP client for the payment gateway API
+One pooled keep-alive session per client with explicit connect/read timeouts.
+Idempotent calls are retried with jittered exponential backoff, limited by a
+retry budget so retries cannot multiply load during an outage, and a circuit
+breaker fails calls fast while the gateway keeps failing. Per-operation
+latency and outcome counters are kept in memory. Request payloads are never
+logged.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per operation for percentiles
+LATENCY_WINDOW = 512
+
+
+class GatewayError(Exception):
+    """
+    A failed gateway call
+
+    retryable is True for transport failures, timeouts, 429 and 5xx responses,
+    and an open circuit; False for errors the gateway returned on purpose
+    (declined card, invalid request).
+    """
+
+    def __init__(self, message, code=None, status=None, retryable=False):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.retryable = retryable
+
+
+class CircuitOpenError(GatewayError):
+    """Raised without calling the gateway while the circuit breaker is open"""
+
+    def __init__(self, retry_in):
+        super().__init__(f'Payment gateway unavailable; retry in {retry_in:.0f}s', code='circuit_open', retryable=True)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets one probe call through (half-open):
+    success closes it again, failure re-opens it.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout or self._probing:
+                raise CircuitOpenError(max(self.reset_timeout - waited, 0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Payment gateway circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+                if self.opened_at is None:
+                    logger.warning(f"Payment gateway circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class RetryBudget:
+    """Token bucket for retries: every call earns `ratio` of a retry, up to `max_tokens`"""
+
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CallMetrics:
+    """Latency and outcome counters per operation"""
+
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, outcome, attempts=1):
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = {
+                    'calls': 0, 'attempts': 0, 'outcomes': {}, 'total': 0.0, 'max': 0.0,
+                    'samples': deque(maxlen=LATENCY_WINDOW)
+                }
+            stats['calls'] += 1
+            stats['attempts'] += attempts
+            stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['samples'].append(seconds)
+
+    def snapshot(self):
+        """{operation: counts and latency in ms (mean, p50, p95 over recent calls, max)}"""
+        with self._lock:
+            result = {}
+            for operation, stats in self._operations.items():
+                samples = sorted(stats['samples'])
+
+                def percentile(fraction):
+                    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000, 1)
+
+                result[operation] = {
+                    'calls': stats['calls'],
+                    'attempts': stats['attempts'],
+                    'outcomes': dict(stats['outcomes']),
+                    'mean_ms': round(stats['total'] / stats['calls'] * 1000, 1),
+                    'p50_ms': percentile(0.5),
+                    'p95_ms': percentile(0.95),
+                    'max_ms': round(stats['max'] * 1000, 1)
+                }
+            return result
+
+
+class GatewayClient:
+    """JSON-over-HTTPS client with pooling, timeouts, retries and a circuit breaker"""
+
+    def __init__(self, base_url, secret_key, headers=None, connect_timeout=3.05, read_timeout=15.0,
+                 pool_size=10, max_retries=2, backoff=0.25, max_backoff=2.0,
+                 breaker=None, retry_budget=None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.metrics = CallMetrics()
+
+        self.session = requests.Session()
+        self.session.auth = (secret_key, '')
+        self.session.headers.update({'Accept': 'application/json'})
+        self.session.headers.update(headers or {})
+        # Retries are done here, where idempotency is known; urllib3 must not retry on its own
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, operation, method, path, payload=None, idempotent=False, idempotency_key=None):
+        """
+        Call the gateway and return the decoded JSON body
+
+        Args:
+            operation: name the call is counted under in the metrics
+            idempotent: retry transient failures (GETs, or POSTs that carry an idempotency key)
+            idempotency_key: sent as the Idempotency-Key header
+
+        Raises:
+            GatewayError: when the call fails (CircuitOpenError without calling out)
+        """
+        started = time.monotonic()
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        url = urljoin(self.base_url, path.lstrip('/'))
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.metrics.record(operation, time.monotonic() - started, 'circuit_open', attempt - 1)
+                raise
+            try:
+                body = self._send(method, url, payload, headers)
+            except GatewayError as e:
+                if e.retryable:
+                    self.breaker.record_failure()
+                else:
+                    # The gateway answered; it is healthy even if the request was refused
+                    self.breaker.record_success()
+                retry = (e.retryable and idempotent and attempt <= self.max_retries
+                         and self.retry_budget.withdraw())
+                if not retry:
+                    self.metrics.record(operation, time.monotonic() - started, e.code or 'error', attempt)
+                    logger.warning(f"Gateway {operation} failed after {attempt} attempt(s): {e}")
+                    raise
+                # Full jitter keeps retrying clients from hitting the gateway in step
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+                continue
+
+            self.breaker.record_success()
+            elapsed = time.monotonic() - started
+            self.metrics.record(operation, elapsed, 'ok', attempt)
+            logger.info(f"Gateway {operation} ok in {elapsed * 1000:.0f} ms ({attempt} attempt(s))")
+            return body
+
+    def _send(self, method, url, payload, headers):
+        try:
+            response = self.session.request(method, url, json=payload, headers=headers, timeout=self.timeout)
+        except requests.Timeout as e:
+            raise GatewayError(f'Gateway timed out: {e.__class__.__name__}', code='timeout', retryable=True)
+        except requests.RequestException as e:
+            raise GatewayError(f'Gateway connection failed: {e.__class__.__name__}', code='connection_error', retryable=True)
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GatewayError(f'Gateway returned HTTP {response.status_code}', code=f'http_{response.status_code}',
+                               status=response.status_code, retryable=True)
+        if not isinstance(body, dict):
+            raise GatewayError(f'Gateway returned an unreadable response (HTTP {response.status_code})',
+                               code='bad_response', status=response.status_code)
+        if response.status_code >= 400 or body.get('object') == 'error':
+            raise GatewayError(body.get('message') or f'Gateway returned HTTP {response.status_code}',
+                               code=body.get('code'), status=response.status_code)
+        return body
+
+    def stats(self):
+        """Breaker state, retry budget and per-operation metrics"""
+        return {
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'retry_tokens': round(self.retry_budget.tokens, 1),
+            'operations': self.metrics.snapshot()
+        }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,247 @@
+"""
+Product image upload and derivative pipeline
+Uploads are streamed to disk in chunks under a content hash, then a process
+pool renders resized derivatives at fixed widths in every supported format.
+Widths above the source are not rendered; the source width itself is, and it
+is part of the original's file name, so a srcset can be built from an image
+URL alone without touching the filesystem.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from PIL import Image, ImageOps, features
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rendered widths in pixels (those below the source width, plus the source width)
+DERIVATIVE_WIDTHS = (160, 320, 640, 960, 1280)
+
+# Output formats, best compression first; AVIF only where Pillow was built with it
+DERIVATIVE_FORMATS = tuple(
+    fmt for fmt, available in (
+        ('avif', features.check('avif')),
+        ('webp', features.check('webp')),
+        ('jpeg', True),
+    ) if available
+)
+
+FORMAT_QUALITY = {'avif': 55, 'webp': 78, 'jpeg': 82}
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'gif', 'avif'}
+
+CHUNK_SIZE = 64 * 1024
+
+# Uploaded originals: <upload url>/products/<16 hex digest chars>/original-<width>.<ext>
+# (original.<ext> for uploads made before the width was part of the name)
+ORIGINAL_URL = re.compile(r'^(?P<base>.*/products/[0-9a-f]{16})/original(?:-(?P<width>\d+))?\.\w+$')
+
+
+def derivative_name(width, fmt):
+    """File name of one derivative, e.g. w320.webp"""
+    return f"w{width}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+def derivative_widths(source_width):
+    """Widths rendered for a source image: the standard widths below it, then the source width"""
+    widths = [width for width in DERIVATIVE_WIDTHS if width < source_width]
+    if source_width <= DERIVATIVE_WIDTHS[-1]:
+        widths.append(source_width)
+    return widths
+
+@lru_cache(maxsize=4096)
+def _stored_width(path):
+    """Pixel width of an original stored without its width in the name (None if unreadable)"""
+    try:
+        with Image.open(path) as image:
+            return ImageOps.exif_transpose(image).width
+    except Exception:
+        return None
+
+def srcset_for(image_url):
+    """
+    srcset strings per format for an uploaded image URL
+
+    Returns None for images that did not come through the pipeline
+    (external URLs, legacy uploads).
+    """
+    match = ORIGINAL_URL.match(image_url or '')
+    if not match:
+        return None
+    base = match.group('base')
+    if match.group('width'):
+        source_width = int(match.group('width'))
+        files = {width: width for width in derivative_widths(source_width)}
+    else:
+        # Older upload: every standard width was rendered, those above the
+        # source at source size, so read the width from the file once
+        source_width = _stored_width(os.path.join(current_app.root_path, image_url.lstrip('/')))
+        if source_width is None:
+            return None
+        files = {
+            width: min((w for w in DERIVATIVE_WIDTHS if w >= width), default=width)
+            for width in derivative_widths(source_width)
+        }
+    return {
+        fmt: ', '.join(f"{base}/{derivative_name(files[width], fmt)} {width}w" for width in files)
+        for fmt in DERIVATIVE_FORMATS
+    }
+
+def render_derivatives(source_path, fmt, widths):
+    """
+    Write every width of one format next to the source image (runs in a pool worker)
+
+    Returns:
+        List of written file names
+    """
+    written = []
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'jpeg':
+            # JPEG has no alpha channel; flatten onto white
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+        out_dir = os.path.dirname(source_path)
+        for width in sorted(widths, reverse=True):
+            if image.width > width:
+                # Downscale progressively from the previous (larger) size
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            name = derivative_name(width, fmt)
+            tmp_path = os.path.join(out_dir, f'.{name}.tmp')
+            image.save(tmp_path, format=fmt.upper(), quality=FORMAT_QUALITY[fmt], optimize=fmt == 'jpeg')
+            os.replace(tmp_path, os.path.join(out_dir, name))
+            written.append(name)
+    return written
+
+
+class ImagePipeline:
+    """Stores product image uploads and renders their derivatives"""
+
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=current_app.config.get('IMAGE_WORKERS') or None)
+        return self._pool
+
+    @staticmethod
+    def _upload_root():
+        return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+    @staticmethod
+    def _upload_url():
+        return '/' + current_app.config['UPLOAD_FOLDER'].strip('/')
+
+    def save_upload(self, upload):
+        """
+        Stream an uploaded image to disk and render its derivatives
+
+        Identical files map to the same directory, so re-uploads are free.
+
+        Args:
+            upload: werkzeug FileStorage
+
+        Returns:
+            Dict with the original image url, its pixel size and the srcset map
+
+        Raises:
+            ValueError: for missing files, unsupported extensions or unreadable images
+        """
+        if upload is None or not upload.filename:
+            raise ValueError('No image file provided')
+        extension = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+        if extension not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"Unsupported image type; use one of: {', '.join(sorted(ALLOWED_EXTENSIONS))}")
+        if extension == 'jpeg':
+            extension = 'jpg'
+
+        products_dir = os.path.join(self._upload_root(), 'products')
+        os.makedirs(products_dir, exist_ok=True)
+
+        # Stream to a temp file while hashing, then move it under its digest
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=products_dir, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = upload.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            try:
+                with Image.open(tmp_path) as image:
+                    image.verify()
+                with Image.open(tmp_path) as image:
+                    size = ImageOps.exif_transpose(image).size
+            except Exception:
+                raise ValueError('File is not a readable image')
+
+            key = digest.hexdigest()[:16]
+            image_dir = os.path.join(products_dir, key)
+            source_name = f'original-{size[0]}.{extension}'
+            source_path = os.path.join(image_dir, source_name)
+            os.makedirs(image_dir, exist_ok=True)
+            if os.path.exists(source_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, source_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        widths = derivative_widths(size[0])
+        missing = [
+            fmt for fmt in DERIVATIVE_FORMATS
+            if not all(os.path.exists(os.path.join(image_dir, derivative_name(width, fmt))) for width in widths)
+        ]
+        if missing:
+            self.render(source_path, widths, missing)
+
+        url = f'{self._upload_url()}/products/{key}/{source_name}'
+        return {
+            'url': url,
+            'width': size[0],
+            'height': size[1],
+            'srcset': srcset_for(url),
+        }
+
+    def render(self, source_path, widths, formats=DERIVATIVE_FORMATS):
+        """Render the derivatives of one source image, one pool task per format"""
+        futures = [
+            self._executor().submit(render_derivatives, source_path, fmt, widths)
+            for fmt in formats
+        ]
+        for future in futures:
+            future.result()
+        logger.info(f"Rendered {len(formats)} formats for {source_path}")
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+# Global image pipeline instance
+image_pipeline = ImagePipeline()
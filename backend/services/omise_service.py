@@ -1,45 +1,89 @@
 """
 Omise Payment Service for GAOJIE Skincare
 Handles credit card payments, tokens, and charges
+Calls go through a pooled GatewayClient (keep-alive, connect/read timeouts,
+jittered retries for idempotent calls, circuit breaker, latency metrics).
 """
 
-import omise
-from flask import current_app
-from decimal import Decimal
 import logging
+import threading
+import uuid
+from decimal import Decimal
 from typing import Dict, Optional, Tuple
+from flask import current_app, has_app_context
+from services.gateway_client import CircuitBreaker, GatewayClient, GatewayError
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'GaojieSkincare/1.0'
+
 class OmiseService:
     """Service class for handling Omise payments"""
     
     def __init__(self):
         self.secret_key = None
         self.public_key = None
-        self.setup_keys()
+        self.client = None  # api.omise.co, secret key
+        self.vault_client = None  # vault.omise.co, public key (card tokens)
+        self._configured = False
+        self._lock = threading.Lock()
     
-    def setup_keys(self):
-        """Setup Omise API keys from Flask config"""
-        try:
-            self.secret_key = current_app.config.get('OMISE_SECRET_KEY')
-            self.public_key = current_app.config.get('OMISE_PUBLIC_KEY')
-            
-            if not self.secret_key:
-                logger.warning("OMISE_SECRET_KEY not found in config")
-                return False
-                
-            # Set the secret key for omise library
-            omise.api_secret = self.secret_key
-            omise.api_version = current_app.config.get('OMISE_API_VERSION', '2017-11-02')
-            
-            logger.info("Omise service initialized successfully")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to setup Omise keys: {e}")
+    def init_app(self, app):
+        """Read the Omise settings once and open the pooled API clients"""
+        config = app.config
+        self.close()
+        self.secret_key = config.get('OMISE_SECRET_KEY')
+        self.public_key = config.get('OMISE_PUBLIC_KEY')
+        self._configured = True
+        
+        if not self.secret_key:
+            logger.warning("OMISE_SECRET_KEY not found in config")
             return False
+        
+        options = {
+            'headers': {
+                'Omise-Version': config.get('OMISE_API_VERSION', '2017-11-02'),
+                'User-Agent': USER_AGENT
+            },
+            'connect_timeout': config.get('OMISE_CONNECT_TIMEOUT', 3.05),
+            'read_timeout': config.get('OMISE_READ_TIMEOUT', 15.0),
+            'pool_size': config.get('OMISE_POOL_SIZE', 10),
+            'max_retries': config.get('OMISE_MAX_RETRIES', 2)
+        }
+        
+        def breaker():
+            return CircuitBreaker(config.get('OMISE_BREAKER_THRESHOLD', 5), config.get('OMISE_BREAKER_RESET', 30.0))
+        
+        self.client = GatewayClient(
+            config.get('OMISE_API_URL', 'https://api.omise.co'), self.secret_key, breaker=breaker(), **options
+        )
+        if self.public_key:
+            self.vault_client = GatewayClient(
+                config.get('OMISE_VAULT_URL', 'https://vault.omise.co'), self.public_key, breaker=breaker(), **options
+            )
+        
+        logger.info("Omise service initialized successfully")
+        return True
+    
+    def close(self):
+        """Close the pooled connections"""
+        for client in (self.client, self.vault_client):
+            if client is not None:
+                client.close()
+        self.client = None
+        self.vault_client = None
+    
+    def _api(self, vault=False):
+        """Configured client; settings are read from the current app on first use if init_app was not called"""
+        if not self._configured and has_app_context():
+            with self._lock:
+                if not self._configured:
+                    self.init_app(current_app)
+        client = self.vault_client if vault else self.client
+        if client is None:
+            raise GatewayError('Omise not configured', code='not_configured')
+        return client
     
     def create_token(self, card_data: Dict) -> Tuple[bool, Optional[Dict], Optional[str]]:
         """
@@ -47,27 +91,60 @@ class OmiseService:
         This method is here for reference - actual token creation happens on frontend
         """
         try:
-            token = omise.Token.create(
-                card={
+            token = self._api(vault=True).request('create_token', 'post', 'tokens', payload={
+                'card': {
                     'name': card_data['name'],
                     'number': card_data['number'],
                     'expiration_month': card_data['exp_month'],
                     'expiration_year': card_data['exp_year'],
                     'security_code': card_data['cvv']
                 }
-            )
+            })
             
-            if token['object'] == 'token':
+            if token.get('object') == 'token':
                 return True, token, None
             else:
                 return False, None, "Failed to create token"
-                
-        except Exception as e:
+        
+        except GatewayError as e:
             logger.error(f"Token creation failed: {e}")
             return False, None, str(e)
     
-    def create_charge(self, amount: int, currency: str, token_id: str, 
-                     description: str, metadata: Dict = None) -> Tuple[bool, Optional[Dict], Optional[str]]:
+    def charge(self, amount: int, currency: str, token_id: str, description: str,
+               metadata: Dict = None, idempotency_key: str = None) -> Dict:
+        """
+        Create a charge using a token
+        
+        With an idempotency key the call is retried on transient failures;
+        the gateway returns the original charge for a repeated key.
+        
+        Returns:
+            Charge data
+        
+        Raises:
+            GatewayError: declined cards and invalid requests (retryable=False),
+            or an unreachable / failing gateway (retryable=True)
+        """
+        charge = self._api().request('create_charge', 'post', 'charges', payload={
+            'amount': amount,
+            'currency': currency,
+            'card': token_id,
+            'description': description,
+            'metadata': metadata or {}
+        }, idempotent=idempotency_key is not None, idempotency_key=idempotency_key)
+        
+        if charge.get('object') != 'charge':
+            raise GatewayError(charge.get('message', 'Unknown error'), code=charge.get('code'))
+        # Declined cards come back as a charge with status 'failed'
+        if charge.get('status') == 'failed':
+            raise GatewayError(charge.get('failure_message') or 'Card declined', code=charge.get('failure_code'))
+        
+        logger.info(f"Charge created successfully: {charge['id']}")
+        return charge
+    
+    def create_charge(self, amount: int, currency: str, token_id: str,
+                     description: str, metadata: Dict = None,
+                     idempotency_key: str = None) -> Tuple[bool, Optional[Dict], Optional[str]]:
         """
         Create a charge using a token
         
@@ -77,35 +154,14 @@ class OmiseService:
             token_id: Token ID from frontend
             description: Charge description
             metadata: Additional metadata
+            idempotency_key: Makes the call safe to retry
         
         Returns:
             Tuple of (success, charge_data, error_message)
         """
         try:
-            if not self.secret_key:
-                return False, None, "Omise not configured"
-                
-            charge_data = {
-                'amount': amount,
-                'currency': currency,
-                'card': token_id,
-                'description': description,
-                'metadata': metadata or {}
-            }
-            
-            logger.info(f"Creating charge: {charge_data}")
-            
-            charge = omise.Charge.create(**charge_data)
-            
-            if charge['object'] == 'charge':
-                logger.info(f"Charge created successfully: {charge['id']}")
-                return True, charge, None
-            else:
-                error_msg = charge.get('message', 'Unknown error')
-                logger.error(f"Charge creation failed: {error_msg}")
-                return False, None, error_msg
-                
-        except Exception as e:
+            return True, self.charge(amount, currency, token_id, description, metadata, idempotency_key), None
+        except GatewayError as e:
             logger.error(f"Charge creation failed: {e}")
             return False, None, str(e)
     
@@ -115,60 +171,65 @@ class OmiseService:
         
         Args:
             charge_id: Omise charge ID
-            
+        
         Returns:
             Tuple of (success, charge_data, error_message)
         """
         try:
-            if not self.secret_key:
-                return False, None, "Omise not configured"
-                
-            charge = omise.Charge.retrieve(charge_id)
+            charge = self._api().request('get_charge', 'get', f'charges/{charge_id}', idempotent=True)
             
-            if charge['object'] == 'charge':
+            if charge.get('object') == 'charge':
                 return True, charge, None
             else:
                 return False, None, "Charge not found"
-                
-        except Exception as e:
+        
+        except GatewayError as e:
             logger.error(f"Failed to retrieve charge {charge_id}: {e}")
             return False, None, str(e)
     
-    def refund_charge(self, charge_id: str, amount: Optional[int] = None) -> Tuple[bool, Optional[Dict], Optional[str]]:
+    def refund_charge(self, charge_id: str, amount: Optional[int] = None,
+                      idempotency_key: str = None) -> Tuple[bool, Optional[Dict], Optional[str]]:
         """
         Refund a charge (partial or full)
         
         Args:
             charge_id: Omise charge ID
             amount: Amount to refund (None for full refund)
-            
+            idempotency_key: Reuse to retry a refund safely (one is generated per call otherwise)
+        
         Returns:
             Tuple of (success, refund_data, error_message)
         """
         try:
-            if not self.secret_key:
-                return False, None, "Omise not configured"
-                
-            charge = omise.Charge.retrieve(charge_id)
-            
             refund_data = {}
             if amount:
                 refund_data['amount'] = amount
-                
-            refund = charge.refunds.create(**refund_data)
             
-            if refund['object'] == 'refund':
+            refund = self._api().request(
+                'refund_charge', 'post', f'charges/{charge_id}/refunds', payload=refund_data,
+                idempotent=True, idempotency_key=idempotency_key or f'refund-{charge_id}-{uuid.uuid4().hex}'
+            )
+            
+            if refund.get('object') == 'refund':
                 logger.info(f"Refund created successfully: {refund['id']}")
                 return True, refund, None
             else:
                 error_msg = refund.get('message', 'Unknown error')
                 logger.error(f"Refund creation failed: {error_msg}")
                 return False, None, error_msg
-                
-        except Exception as e:
+        
+        except GatewayError as e:
             logger.error(f"Refund creation failed: {e}")
             return False, None, str(e)
     
+    def stats(self) -> Dict:
+        """Circuit state and per-call latency metrics of the API clients"""
+        return {
+            'configured': self.client is not None,
+            'api': self.client.stats() if self.client else None,
+            'vault': self.vault_client.stats() if self.vault_client else None
+        }
+    
     def convert_to_satang(self, amount: float) -> int:
         """Convert Thai Baht to satang (smallest unit)"""
         return int(Decimal(str(amount)) * 100)
@@ -0,0 +1,117 @@
+"""
+Order and tracking number generator
+Numbers are ULID-style: a 48-bit millisecond timestamp and 80 random bits in
+Crockford base32, followed by a check character, e.g.
+GJ01M53FVHA3CA6QGCW07373653WJ. They need no uniqueness lookup (collisions
+need 80 equal random bits in the same millisecond), sort by creation time so
+index inserts stay sequential, and the check character catches mistyped
+numbers before they reach the database.
+"""
+
+import os
+import secrets
+import threading
+import time
+
+ORDER_PREFIX = 'GJ'
+TRACKING_PREFIX = 'TH'
+
+# Crockford base32: no I, L, O or U
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+DECODE = {char: index for index, char in enumerate(ALPHABET)}
+
+TIME_CHARS = 10  # 48 bits
+RANDOM_CHARS = 16  # 80 bits
+RANDOM_MAX = (1 << 80) - 1
+
+# Prefix + ULID + check character
+NUMBER_LENGTH = 2 + TIME_CHARS + RANDOM_CHARS + 1
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+def check_character(body):
+    """Luhn mod 32 check character; catches any single-character error and most adjacent swaps"""
+    total = 0
+    for position, char in enumerate(reversed(body)):
+        value = DECODE[char]
+        if position % 2 == 0:
+            value *= 2
+            value = value // 32 + value % 32
+        total += value
+    return ALPHABET[(32 - total % 32) % 32]
+
+
+class OrderIds:
+    """Monotonic ULID-style ids with a check character"""
+
+    def __init__(self):
+        self._reset()
+        # A forked worker must not continue its parent's sequence
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def ulid(self):
+        """
+        26-character ULID
+
+        Within one millisecond (or if the clock steps back) the random part is
+        incremented instead of redrawn, so ids from one process strictly
+        increase; separate processes draw independent random parts.
+        """
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now > self._last_ms:
+                self._last_ms = now
+                self._last_random = secrets.randbits(80)
+            elif self._last_random < RANDOM_MAX:
+                self._last_random += 1
+            else:
+                # Random space for this millisecond exhausted; borrow the next one
+                self._last_ms += 1
+                self._last_random = secrets.randbits(79)
+            return _encode(self._last_ms, TIME_CHARS) + _encode(self._last_random, RANDOM_CHARS)
+
+    def _number(self, prefix):
+        body = self.ulid()
+        return f'{prefix}{body}{check_character(body)}'
+
+    def order_number(self):
+        """New order number, e.g. GJ01M53FVHA3CA6QGCW07373653WJ"""
+        return self._number(ORDER_PREFIX)
+
+    def tracking_number(self):
+        """New tracking number, e.g. TH01M53FVMNVAAW2N4A482HAJNB17"""
+        return self._number(TRACKING_PREFIX)
+
+    @staticmethod
+    def normalize(number):
+        """Upper-case a number and map Crockford look-alikes (I, L -> 1, O -> 0)"""
+        number = (number or '').strip().upper()
+        if len(number) != NUMBER_LENGTH:
+            return number
+        body = number[2:].translate(str.maketrans('ILO', '110'))
+        return number[:2] + body
+
+    @staticmethod
+    def is_valid(number, prefix=ORDER_PREFIX):
+        """True for a well-formed number of this generator with a matching check character"""
+        if not number or len(number) != NUMBER_LENGTH or not number.startswith(prefix):
+            return False
+        body, check = number[2:-1], number[-1]
+        if any(char not in ALPHABET for char in body):
+            return False
+        return check_character(body) == check
+
+# Global order id generator instance
+order_ids = OrderIds()
@@ -0,0 +1,456 @@
+"""
+Background card payments
+Placing an order stores a PaymentJob, keyed by the checkout's idempotency
+key, in the order's own transaction and returns straight away; a bounded
+thread pool charges the card and settles the order. Clients poll
+GET /api/orders/<order_number>/payment with short requests, spaced by the
+Retry-After header it sends while the charge is pending.
+Jobs left queued (pool full, gateway down, process restarted) or stuck in
+processing are picked up again by a sweep that runs on a background timer, and the gateway gets the same
+idempotency key on every attempt, so a job never charges a card twice.
+A job whose gateway never answered is not failed (the card may have been
+charged); it is held for review with its order and stock left untouched.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import select, update
+from extensions import db
+from services.catalog_cache import catalog_version
+from services.gateway_client import GatewayError
+from services.related_products import related_products_index
+from services.stock_reservations import stock_reservations
+from services.trending import trending_scores
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default seconds between sweeps for stalled jobs (PAYMENT_SWEEP_INTERVAL)
+SWEEP_INTERVAL = 30
+
+# Longest a status poll may block, and how often it re-reads the job while waiting
+MAX_WAIT = 2
+POLL_INTERVAL = 0.5
+
+# Seconds a client should wait before polling a pending payment again (Retry-After)
+RETRY_AFTER = 1
+
+
+class LocalGateway:
+    """
+    In-process stand-in for the card gateway
+
+    Sleeps `latency` seconds per charge so checkout throughput can be measured
+    against a slow gateway. Tokens containing 'fail' are declined. Results are
+    remembered per idempotency key, so a retried charge returns the original
+    result like a real gateway.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.charges = 0  # Charges actually made (replays excluded)
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def charge(self, amount, currency, token_id, description, metadata=None, idempotency_key=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if idempotency_key in self._results:
+                return self._results[idempotency_key]
+            if 'fail' in (token_id or ''):
+                result = (False, None, 'Card declined')
+            else:
+                self.charges += 1
+                result = (True, {
+                    'object': 'charge',
+                    'id': f'chrg_local_{uuid.uuid4().hex[:16]}',
+                    'paid': True,
+                    'amount': amount,
+                    'currency': currency
+                }, None)
+            if idempotency_key:
+                self._results[idempotency_key] = result
+            return result
+
+
+class OmiseGateway:
+    """
+    Charges cards through the Omise API
+
+    Declines are returned as results; transient failures (timeouts, 5xx, open
+    circuit) raise GatewayError so the job is retried rather than failed.
+    """
+
+    def charge(self, amount, currency, token_id, description, metadata=None, idempotency_key=None):
+        from services.omise_service import omise_service
+
+        try:
+            charge = omise_service.charge(
+                amount=amount,
+                currency=currency,
+                token_id=token_id,
+                description=description,
+                metadata=metadata,
+                idempotency_key=idempotency_key
+            )
+        except GatewayError as e:
+            if e.retryable:
+                raise
+            return False, None, str(e)
+        return True, charge, None
+
+
+class PaymentJobs:
+    """Queues, runs and reports background card charges"""
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._gateway = None
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        self.app = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Bind to the app and start the background sweep"""
+        self.app = app
+        if self._thread is None and app.config.get('PAYMENT_SWEEP_INTERVAL', SWEEP_INTERVAL):
+            self._thread = threading.Thread(target=self._sweep_forever, name='payment-sweep', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    @staticmethod
+    def _sweep_interval(app=None):
+        return (app or current_app).config.get('PAYMENT_SWEEP_INTERVAL') or SWEEP_INTERVAL
+
+    def _sweep_forever(self):
+        # Requeued and overflow jobs must not depend on new checkouts to run again
+        while not self._stop.wait(self._sweep_interval(self.app)):
+            try:
+                with self.app.app_context():
+                    self.resume_stalled()
+            except Exception as e:
+                logger.error(f"Payment job sweep failed: {e}")
+
+    def gateway(self):
+        """
+        Configured gateway: PAYMENT_GATEWAY, else Omise when its secret key is set
+
+        The local stand-in approves almost any token, so it is only used when
+        PAYMENT_GATEWAY is 'local'. Raises ValueError when no gateway is configured.
+        """
+        if self._gateway is None:
+            with self._lock:
+                if self._gateway is None:
+                    config = current_app.config
+                    name = config.get('PAYMENT_GATEWAY') or ('omise' if config.get('OMISE_SECRET_KEY') else None)
+                    if name is None:
+                        raise ValueError('No payment gateway configured; set OMISE_SECRET_KEY')
+                    if name == 'omise':
+                        if not config.get('OMISE_SECRET_KEY'):
+                            raise ValueError('PAYMENT_GATEWAY is omise but OMISE_SECRET_KEY is not set')
+                        self._gateway = OmiseGateway()
+                    elif name == 'local':
+                        self._gateway = LocalGateway(config.get('PAYMENT_GATEWAY_LATENCY', 0.0))
+                    else:
+                        raise ValueError(f'Unknown payment gateway: {name}')
+                    logger.info(f"Payment gateway: {name}")
+        return self._gateway
+
+    def accepts_cards(self):
+        """Whether card payments can be taken (a gateway is configured)"""
+        try:
+            self.gateway()
+            return True
+        except ValueError as e:
+            logger.error(f"Card payments refused: {e}")
+            return False
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = current_app.config.get('PAYMENT_WORKERS', 4)
+                    # Running plus waiting jobs; beyond this, jobs wait in the database for the sweep
+                    self._slots = threading.BoundedSemaphore(workers + current_app.config.get('PAYMENT_QUEUE_SIZE', 100))
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment')
+        return self._executor
+
+    @staticmethod
+    def find(idempotency_key):
+        """Payment job for an idempotency key, or None"""
+        from models import PaymentJob
+
+        return PaymentJob.query.filter_by(idempotency_key=idempotency_key).first()
+
+    @staticmethod
+    def for_order(order_id):
+        """Latest payment job of an order, or None"""
+        from models import PaymentJob
+
+        return PaymentJob.query.filter_by(order_id=order_id).order_by(PaymentJob.id.desc()).first()
+
+    def create(self, order, card_token, idempotency_key=None, description=None):
+        """
+        Add a queued charge for an order to the session
+
+        It is committed with the order; call submit() after the commit.
+        """
+        from models import PaymentJob
+
+        job = PaymentJob(
+            order=order,
+            idempotency_key=idempotency_key or uuid.uuid4().hex,
+            amount=int(round(Decimal(str(order.total_amount)) * 100)),  # satang
+            currency=current_app.config.get('STORE_CURRENCY', 'THB'),
+            card_token=card_token,
+            description=(description or '')[:255],
+            status='queued'
+        )
+        db.session.add(job)
+        return job
+
+    def submit(self, job_id):
+        """
+        Hand a committed job to the worker pool
+
+        Returns:
+            False when the pool is full; the job stays queued for the sweep
+        """
+        self.resume_stalled()
+        return self._submit(job_id)
+
+    def _submit(self, job_id):
+        pool = self._pool()
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"Payment queue full; job {job_id} left for the sweep")
+            return False
+        try:
+            pool.submit(self._run, current_app._get_current_object(), job_id)
+        except RuntimeError:
+            # Pool shut down
+            self._slots.release()
+            return False
+        return True
+
+    def _run(self, app, job_id):
+        try:
+            with app.app_context():
+                self.process(job_id)
+        except Exception as e:
+            logger.error(f"Payment job {job_id} failed: {e}")
+        finally:
+            self._slots.release()
+
+    def process(self, job_id):
+        """
+        Charge one queued job and settle its order
+
+        Returns:
+            Job status ('queued' again after a transient gateway failure,
+            'review' if the gateway never answered), or None if the job was
+            not queued (another worker has it)
+        """
+        from models import PaymentJob
+
+        jobs = PaymentJob.__table__
+        claimed = db.session.execute(
+            update(jobs).where(jobs.c.id == job_id, jobs.c.status == 'queued')
+            .values(status='processing', attempts=jobs.c.attempts + 1)
+        ).rowcount == 1
+        db.session.commit()
+        if not claimed:
+            return None
+
+        job = db.session.get(PaymentJob, job_id)
+        try:
+            success, charge, error = self._charge(job)
+        except GatewayError as e:
+            if not e.retryable:
+                success, charge, error = False, None, str(e)
+            elif job.attempts < current_app.config.get('PAYMENT_MAX_ATTEMPTS', 5):
+                # Gateway unreachable or degraded; the sweep tries again with the same key
+                job.status = 'queued'
+                job.error = str(e)[:255]
+                db.session.commit()
+                logger.warning(f"Payment job {job_id} will be retried: {e}")
+                return job.status
+            else:
+                # Out of attempts, but a timed-out charge may still have gone
+                # through; ask once more under the same key, which replays it
+                try:
+                    success, charge, error = self._charge(job)
+                except Exception as confirm_error:
+                    return self._hold_for_review(job, confirm_error)
+        except Exception as e:
+            return self._hold_for_review(job, e)
+
+        try:
+            self._settle(job, success, charge, error)
+        except Exception:
+            # Left in processing; the sweep retries it and the gateway replays the result
+            db.session.rollback()
+            raise
+        return job.status
+
+    def _charge(self, job):
+        """Charge (or replay, under the job's idempotency key) one job; returns (success, charge, error)"""
+        return self.gateway().charge(
+            amount=job.amount,
+            currency=job.currency,
+            token_id=job.card_token,
+            description=job.description,
+            metadata={
+                'source': 'gaojie_skincare',
+                'platform': 'web',
+                'order_number': job.order.order_number
+            },
+            idempotency_key=job.idempotency_key
+        )
+
+    @staticmethod
+    def _hold_for_review(job, error):
+        """
+        Park a job whose charge outcome is unknown
+
+        The order keeps its reserved stock and is not cancelled; whoever
+        reviews it checks the charge at the gateway (by order number or
+        idempotency key) and settles or refunds by hand.
+        """
+        job.status = 'review'
+        job.error = str(error)[:255]
+        job.order.payment_status = 'processing'
+        db.session.commit()
+        logger.error(f"Payment job {job.id} held for review; charge outcome unknown: {error}")
+        return job.status
+
+    @staticmethod
+    def _settle(job, success, charge, error):
+        """Record the charge result on the job and its order and commit"""
+        order = job.order
+        job.completed_at = datetime.utcnow()
+        job.card_token = None  # Single use, and not worth keeping
+
+        if success:
+            job.status = 'succeeded'
+            job.error = None
+            job.charge_id = charge['id']
+            order.payment_reference = charge['id']
+            order.payment_status = 'completed' if charge.get('paid') else 'processing'
+            if order.payment_status == 'completed':
+                order.status = 'confirmed'
+            db.session.commit()
+            logger.info(f"Payment succeeded for order {order.order_number}")
+            return
+
+        job.status = 'failed'
+        job.error = (error or 'Payment failed')[:255]
+        order.payment_status = 'failed'
+        order.status = 'cancelled'
+
+        # Give the stock back and take the sale off the counters
+        _, restocked = stock_reservations.release_order(order.id)
+        sold = {}
+        for item in order.order_items:
+            if item.product_id:
+                sold[item.product_id] = sold.get(item.product_id, 0) - item.quantity
+        trending_scores.record_sales(sold, at=order.created_at)
+        db.session.commit()
+        if restocked:
+            catalog_version.bump()  # A sold-out product is available again
+        # Its co-purchases were counted at checkout; recompute without them
+        related_products_index.mark_stale(sold)
+        logger.info(f"Payment failed for order {order.order_number}: {job.error}")
+
+    @staticmethod
+    def counts():
+        """{status: number of payment jobs}"""
+        from models import PaymentJob
+
+        return dict(db.session.query(PaymentJob.status, db.func.count(PaymentJob.id)).group_by(PaymentJob.status).all())
+
+    def wait(self, job_id, timeout):
+        """Block until the job is settled or `timeout` seconds pass; returns the job"""
+        from models import PaymentJob
+
+        self.resume_stalled()
+        jobs = PaymentJob.__table__
+        deadline = time.monotonic() + min(timeout, MAX_WAIT)
+        while True:
+            status = db.session.execute(select(jobs.c.status).where(jobs.c.id == job_id)).scalar()
+            # End the read so no transaction stays open while sleeping
+            db.session.rollback()
+            remaining = deadline - time.monotonic()
+            if status in PaymentJob.FINAL_STATUSES or remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL, remaining))
+        return db.session.get(PaymentJob, job_id)
+
+    def resume_stalled(self, force=False):
+        """
+        Re-submit queued jobs nobody is running and requeue jobs stuck in processing
+        (at most once per sweep interval unless forced)
+
+        Returns:
+            Number of jobs submitted
+        """
+        from models import PaymentJob
+
+        interval = self._sweep_interval()
+        now = time.monotonic()
+        if not force and now - self._last_sweep < interval:
+            return 0
+        with self._sweep_lock:
+            if not force and now - self._last_sweep < interval:
+                return 0
+            self._last_sweep = now
+
+        jobs = PaymentJob.__table__
+        timeout = timedelta(seconds=current_app.config.get('PAYMENT_JOB_TIMEOUT', 120))
+        cutoff = datetime.utcnow() - timedelta(seconds=interval)
+        try:
+            # A worker died mid-charge; keep updated_at so the job is picked up below
+            db.session.execute(
+                update(jobs).where(jobs.c.status == 'processing', jobs.c.updated_at < datetime.utcnow() - timeout)
+                .values(status='queued', updated_at=jobs.c.updated_at)
+            )
+            stalled = db.session.execute(
+                select(jobs.c.id).where(jobs.c.status == 'queued', jobs.c.updated_at < cutoff)
+                .order_by(jobs.c.id)
+            ).scalars().all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Payment job sweep failed: {e}")
+            return 0
+
+        submitted = 0
+        for job_id in stalled:
+            if not self._submit(job_id):
+                break
+            submitted += 1
+        if submitted:
+            logger.info(f"Resumed {submitted} stalled payment jobs")
+        return submitted
+
+    def shutdown(self, wait=True):
+        """Stop the sweep and the worker pool (running jobs finish when wait is True)"""
+        self._stop.set()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+# Global payment jobs instance
+payment_jobs = PaymentJobs()
@@ -0,0 +1,279 @@
+"""
+Bulk product import/export
+Streams CSV or JSON Lines catalogs in and out without loading the whole file
+into memory: imports allocate slugs and insert rows one batch at a time,
+exports read the products table in chunks. Rows carrying the id of an
+existing product update it, so an export can be edited and imported back.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, select, update
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ('csv', 'jsonl')
+
+# Importable columns by value type
+TEXT_FIELDS = (
+    'name', 'slug', 'description', 'short_description', 'category', 'skin_type', 'ingredients',
+    'usage_instructions', 'benefits', 'more_details', 'size', 'meta_title', 'meta_description',
+    'tags', 'primary_image', 'secondary_image', 'video_url', 'urgency_message'
+)
+DECIMAL_FIELDS = ('price', 'original_price', 'cost_price')
+INTEGER_FIELDS = ('stock_quantity', 'low_stock_threshold', 'urgency_stock_display')
+BOOLEAN_FIELDS = (
+    'is_active', 'is_featured', 'is_bestseller', 'is_new', 'track_inventory', 'show_urgency_override'
+)
+JSON_FIELDS = ('gallery_images', 'gallery_items', 'badge_ids')
+
+IMPORT_FIELDS = TEXT_FIELDS + DECIMAL_FIELDS + INTEGER_FIELDS + BOOLEAN_FIELDS + JSON_FIELDS
+EXPORT_FIELDS = ('id',) + IMPORT_FIELDS + ('view_count', 'sales_count', 'created_at', 'updated_at')
+
+# Values used when a row leaves a column empty (same as admin_create_product / model defaults)
+IMPORT_DEFAULTS = {
+    'name': 'Untitled Product',
+    'description': '',
+    'category': 'uncategorized',
+    'price': Decimal('0'),
+    'stock_quantity': 0,
+    'low_stock_threshold': 10,
+    'track_inventory': True,
+    'show_urgency_override': False,
+    'is_active': True,
+    'is_featured': False,
+    'is_bestseller': False,
+    'is_new': False,
+}
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'n', 'off')
+
+
+class ProductImportExport:
+    """Streaming CSV/JSONL import and export of the product catalog"""
+
+    def __init__(self, batch_size=500, max_reported_errors=100):
+        self.batch_size = batch_size
+        self.max_reported_errors = max_reported_errors
+
+    # ===== IMPORT =====
+
+    def iter_rows(self, stream, fmt):
+        """
+        Yield (row number, raw row) from a binary stream
+
+        CSV rows are dicts; JSONL rows are the undecoded line so a malformed
+        line only fails that row.
+        """
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+        if fmt == 'csv':
+            for row_number, row in enumerate(csv.DictReader(text), start=2):
+                yield row_number, row
+        else:
+            for row_number, line in enumerate(text, start=1):
+                if line.strip():
+                    yield row_number, line
+
+    def parse_row(self, raw):
+        """Convert one raw row into column values for the products table (id only if given)"""
+        if isinstance(raw, str):
+            raw = json.loads(raw)
+            if not isinstance(raw, dict):
+                raise ValueError('Each line must be a JSON object')
+
+        values = {}
+        product_id = raw.get('id')
+        if isinstance(product_id, str):
+            product_id = product_id.strip()
+        if product_id not in (None, ''):
+            try:
+                values['id'] = int(product_id)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value for id: {product_id!r}") from e
+
+        for field in IMPORT_FIELDS:
+            value = raw.get(field)
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == '':
+                values[field] = IMPORT_DEFAULTS.get(field)
+                continue
+
+            try:
+                if field in DECIMAL_FIELDS:
+                    values[field] = Decimal(str(value))
+                elif field in INTEGER_FIELDS:
+                    values[field] = int(value)
+                elif field in BOOLEAN_FIELDS:
+                    values[field] = self._parse_bool(value)
+                elif field in JSON_FIELDS:
+                    values[field] = json.loads(value) if isinstance(value, str) else value
+                else:
+                    values[field] = str(value)
+            except (InvalidOperation, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value for {field}: {value!r}") from e
+
+        return values
+
+    @staticmethod
+    def _parse_bool(value):
+        if isinstance(value, bool):
+            return value
+        text = str(value).lower()
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise ValueError(value)
+
+    def import_stream(self, stream, fmt='csv'):
+        """
+        Import every row of a CSV/JSONL stream
+
+        Rows with the id of an existing product replace its importable columns;
+        all other rows are inserted as new products. Rows that fail to parse
+        are skipped and reported; everything is committed together at the end.
+
+        Returns:
+            Dict with imported, updated, skipped and errors (first max_reported_errors)
+
+        Raises:
+            ValueError: for an unsupported format or a file that is not UTF-8
+        """
+        from models import Product
+
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        table = Product.__table__
+        reserved_slugs = set()
+        batch = []
+        imported = updated = skipped = 0
+        errors = []
+
+        def flush_batch():
+            # One id lookup, one slug lookup, then one executemany UPDATE and INSERT per batch
+            ids = [values['id'] for _, values in batch if 'id' in values]
+            current_slugs = dict(db.session.execute(
+                select(table.c.id, table.c.slug).where(table.c.id.in_(ids))
+            ).all()) if ids else {}
+
+            # Updated products keep their slug unless the row asks for another one
+            rows, base_slugs = [], []
+            for row_number, values in batch:
+                values = dict(values)
+                product_id = values.pop('id', None)
+                if product_id not in current_slugs:
+                    product_id = None
+                base = Product.generate_slug(values['slug'] or values['name']) or f"product-{row_number}"
+                keep = product_id is not None and current_slugs[product_id] == base
+                if keep:
+                    values['slug'] = base
+                else:
+                    base_slugs.append(base)
+                rows.append((product_id, values, keep))
+            slugs = iter(Product.allocate_slugs(base_slugs, reserved_slugs))
+
+            now = datetime.utcnow()
+            updates, inserts = [], []
+            for product_id, values, keep in rows:
+                if not keep:
+                    values['slug'] = next(slugs)
+                if product_id is None:
+                    inserts.append(dict(values, view_count=0, sales_count=0, created_at=now, updated_at=now))
+                else:
+                    updates.append(dict(values, id=product_id, updated_at=now))
+            if updates:
+                db.session.execute(update(Product), updates)
+            if inserts:
+                db.session.execute(insert(table), inserts)
+            batch.clear()
+            return len(inserts), len(updates)
+
+        try:
+            for row_number, raw in self.iter_rows(stream, fmt):
+                try:
+                    batch.append((row_number, self.parse_row(raw)))
+                except ValueError as e:
+                    skipped += 1
+                    if len(errors) < self.max_reported_errors:
+                        errors.append({'row': row_number, 'error': str(e)})
+                    continue
+
+                if len(batch) >= self.batch_size:
+                    inserted, changed = flush_batch()
+                    imported, updated = imported + inserted, updated + changed
+
+            if batch:
+                inserted, changed = flush_batch()
+                imported, updated = imported + inserted, updated + changed
+
+            db.session.commit()
+
+        except UnicodeDecodeError:
+            db.session.rollback()
+            raise ValueError('Import file must be UTF-8 encoded')
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        logger.info(f"Imported {imported} products, updated {updated} ({skipped} rows skipped)")
+        return {'imported': imported, 'updated': updated, 'skipped': skipped, 'errors': errors}
+
+    # ===== EXPORT =====
+
+    def iter_products(self):
+        """Yield export rows as dicts, reading the table in chunks of batch_size"""
+        from models import Product
+
+        columns = [Product.__table__.c[field] for field in EXPORT_FIELDS]
+        result = db.session.execute(
+            select(*columns).order_by(Product.id).execution_options(yield_per=self.batch_size)
+        )
+        for row in result:
+            yield dict(zip(EXPORT_FIELDS, row))
+
+    @staticmethod
+    def _export_value(value, fmt):
+        if isinstance(value, Decimal):
+            return str(value) if fmt == 'csv' else float(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if fmt == 'csv':
+            if isinstance(value, bool):
+                return 'true' if value else 'false'
+            if isinstance(value, (list, dict)):
+                return json.dumps(value, separators=(',', ':'))
+        return value
+
+    def export_lines(self, fmt='csv'):
+        """Yield the catalog as CSV or JSONL text chunks"""
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        if fmt == 'jsonl':
+            for row in self.iter_products():
+                yield json.dumps({key: self._export_value(value, fmt) for key, value in row.items()}) + '\n'
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for count, row in enumerate(self.iter_products(), start=1):
+            writer.writerow([self._export_value(row[field], fmt) for field in EXPORT_FIELDS])
+            if count % self.batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+# Global import/export instance
+product_io = ProductImportExport()
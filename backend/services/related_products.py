@@ -0,0 +1,247 @@
+"""
+Related-products index
+Maintains the related_products table from same-category membership and
+order co-purchase frequency so product pages can read recommendations with
+a single indexed lookup instead of ORDER BY random(). products.related_indexed_at
+records when a product was last computed, so a product with no candidates is
+not recomputed on every view.
+"""
+
+import logging
+from datetime import datetime
+from itertools import permutations
+from sqlalchemy import func, or_, select, update
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class RelatedProductsIndex:
+    """Builds, refreshes and reads precomputed related-product rows"""
+
+    def __init__(self, max_related=12):
+        # Rows kept per product when it is (re)computed
+        self.max_related = max_related
+
+    def get_related(self, product_id, limit=4, options=()):
+        """
+        Return up to `limit` active related products, best first
+
+        Products that have never been indexed are indexed on first request.
+        """
+        from models import Product, RelatedProduct
+
+        # Usually already in the session (the route loaded it), so no extra query
+        product = db.session.get(Product, product_id)
+        if product is None:
+            return []
+
+        query = Product.query.join(
+            RelatedProduct, RelatedProduct.related_product_id == Product.id
+        ).filter(
+            RelatedProduct.product_id == product_id,
+            Product.is_active == True
+        ).options(*options).order_by(
+            RelatedProduct.score.desc(), RelatedProduct.related_product_id.asc()
+        ).limit(limit)
+
+        if product.related_indexed_at is None:
+            self.refresh_product(product_id)
+        return query.all()
+
+    def _candidates(self, product):
+        """Score candidate related products for one product"""
+        from models import Product, Order, OrderItem, RelatedProduct
+
+        # Co-purchases: other products appearing in the same orders (cancelled ones excluded)
+        other_item = db.aliased(OrderItem)
+        co_purchases = dict(
+            db.session.query(other_item.product_id, func.count(func.distinct(other_item.order_id)))
+            .join(OrderItem, OrderItem.order_id == other_item.order_id)
+            .join(Order, Order.id == other_item.order_id)
+            .filter(
+                OrderItem.product_id == product.id,
+                other_item.product_id != product.id,
+                Order.status != 'cancelled'
+            )
+            .group_by(other_item.product_id)
+            .order_by(func.count(func.distinct(other_item.order_id)).desc())
+            .limit(self.max_related)
+            .all()
+        )
+
+        # Same category, most popular first
+        same_category_ids = [
+            row[0] for row in db.session.query(Product.id).filter(
+                Product.category == product.category,
+                Product.id != product.id,
+                Product.is_active == True
+            ).order_by(Product.sales_count.desc(), Product.id.desc()).limit(self.max_related).all()
+        ]
+
+        # Category of co-purchased products decides their same-category flag
+        co_purchase_categories = dict(
+            db.session.query(Product.id, Product.category).filter(Product.id.in_(co_purchases)).all()
+        ) if co_purchases else {}
+
+        scored = {}
+        for related_id, count in co_purchases.items():
+            same_category = co_purchase_categories.get(related_id) == product.category
+            scored[related_id] = (count, same_category)
+        for related_id in same_category_ids:
+            if related_id not in scored:
+                scored[related_id] = (0, True)
+
+        ranked = sorted(
+            scored.items(),
+            key=lambda item: (-RelatedProduct.compute_score(*item[1]), item[0])
+        )
+        return ranked[:self.max_related]
+
+    @staticmethod
+    def _mark_indexed(product_ids):
+        """Stamp products.related_indexed_at (runs in the caller's transaction)"""
+        from models import Product
+
+        # Keep updated_at untouched; reindexing is not a product edit
+        products = Product.__table__
+        db.session.execute(
+            update(products).where(products.c.id.in_(product_ids))
+            .values(related_indexed_at=datetime.utcnow(), updated_at=products.c.updated_at)
+        )
+
+    def refresh_product(self, product_id):
+        """
+        Recompute the related rows of one product and mirror them onto its neighbours
+
+        Call after a product is created, changes category or is (de)activated.
+        """
+        from models import Product, RelatedProduct
+
+        try:
+            product = db.session.get(Product, product_id)
+
+            # Drop every row involving this product; they are rebuilt below
+            RelatedProduct.query.filter(
+                or_(RelatedProduct.product_id == product_id, RelatedProduct.related_product_id == product_id)
+            ).delete(synchronize_session=False)
+
+            if product is not None and product.is_active:
+                for related_id, (count, same_category) in self._candidates(product):
+                    score = RelatedProduct.compute_score(count, same_category)
+                    for source_id, target_id in ((product_id, related_id), (related_id, product_id)):
+                        db.session.add(RelatedProduct(
+                            product_id=source_id,
+                            related_product_id=target_id,
+                            co_purchase_count=count,
+                            same_category=same_category,
+                            score=score
+                        ))
+
+            self._mark_indexed([product_id])
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to refresh related products for {product_id}: {e}")
+
+    def mark_stale(self, product_ids):
+        """
+        Queue products for a refresh after a bulk change, in two statements
+
+        Rows of inactive products are dropped; the others are recomputed on
+        their next get_related() instead of during the bulk request.
+        """
+        from models import Product, RelatedProduct
+
+        product_ids = list(set(product_ids))
+        if not product_ids:
+            return
+
+        try:
+            products = Product.__table__
+            db.session.execute(
+                update(products).where(products.c.id.in_(product_ids))
+                .values(related_indexed_at=None, updated_at=products.c.updated_at)
+            )
+            inactive_ids = select(products.c.id).where(products.c.id.in_(product_ids), products.c.is_active == False)
+            RelatedProduct.query.filter(
+                or_(RelatedProduct.product_id.in_(inactive_ids), RelatedProduct.related_product_id.in_(inactive_ids))
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to mark related products stale for {len(product_ids)} products: {e}")
+
+    def record_order(self, product_ids):
+        """
+        Add one co-purchase to every pair of distinct products bought together (call after the order is committed)
+
+        Pairs are upserted, so concurrent orders for the same products all count.
+        """
+        from models import Product, RelatedProduct
+
+        product_ids = sorted(set(product_ids))
+        if len(product_ids) < 2:
+            return
+
+        try:
+            categories = dict(
+                db.session.query(Product.id, Product.category).filter(Product.id.in_(product_ids)).all()
+            )
+            now = datetime.utcnow()
+            rows = []
+            for source_id, target_id in permutations(categories, 2):
+                same_category = categories[source_id] == categories[target_id]
+                rows.append({
+                    'product_id': source_id,
+                    'related_product_id': target_id,
+                    'co_purchase_count': 1,
+                    'same_category': same_category,
+                    'score': RelatedProduct.compute_score(1, same_category),
+                    'updated_at': now
+                })
+            if rows:
+                db.session.execute(self._upsert_co_purchases(rows))
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to record co-purchases: {e}")
+
+    @staticmethod
+    def _upsert_co_purchases(rows):
+        """INSERT new pairs; existing pairs get one more co-purchase"""
+        from models import RelatedProduct
+
+        table = RelatedProduct.__table__
+        increment = {
+            'co_purchase_count': table.c.co_purchase_count + 1,
+            'score': table.c.score + RelatedProduct.CO_PURCHASE_WEIGHT,
+            'updated_at': datetime.utcnow()
+        }
+        dialect = db.engine.dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            return insert(table).values(rows).on_duplicate_key_update(**increment)
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(table).values(rows).on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.related_product_id], set_=increment
+        )
+
+    def rebuild(self):
+        """Rebuild the whole index (e.g. after importing a catalog)"""
+        from models import Product, RelatedProduct
+
+        RelatedProduct.query.delete(synchronize_session=False)
+        db.session.commit()
+        for (product_id,) in db.session.query(Product.id).filter(Product.is_active == True).all():
+            self.refresh_product(product_id)
+
+# Global related-products index instance
+related_products_index = RelatedProductsIndex()
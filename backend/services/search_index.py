@@ -0,0 +1,159 @@
+"""
+Full-text search index for the product catalog
+Uses an FTS5 virtual table on SQLite and a GIN tsvector index on PostgreSQL,
+falling back to ILIKE matching on any other database
+"""
+
+import logging
+import re
+import threading
+from sqlalchemy import column, or_, text
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# bm25() weights for the indexed columns name, slug, tags, description (higher = more relevant)
+SQLITE_COLUMN_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+# Weighted tsvector over the same columns; the GIN index is built on this exact expression
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(slug, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, slug, tags, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, slug, tags, description)
+        VALUES (new.id, new.name, new.slug, new.tags, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, slug, tags, description)
+        VALUES ('delete', old.id, old.name, old.slug, old.tags, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, slug, tags, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, slug, tags, description)
+        VALUES ('delete', old.id, old.name, old.slug, old.tags, old.description);
+        INSERT INTO products_fts(rowid, name, slug, tags, description)
+        VALUES (new.id, new.name, new.slug, new.tags, new.description);
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_products_search ON products USING GIN (({POSTGRES_VECTOR}))",
+]
+
+
+def tokenize_search(search):
+    """Split a raw search string into index-safe word tokens"""
+    return re.findall(r'\w+', (search or '').lower())
+
+
+class ProductSearchIndex:
+    """Keeps the product full-text index in place and applies searches to product queries"""
+
+    def __init__(self):
+        self._ready = {}
+        self._lock = threading.Lock()
+
+    def backend(self):
+        """Return 'sqlite' or 'postgresql', or a false value when no full-text index is available"""
+        engine = db.engine
+        key = str(engine.url)
+        if key not in self._ready:
+            with self._lock:
+                if key not in self._ready:
+                    result = self._create_index(engine)
+                    if result is None:
+                        # Tables not created yet; check again on the next search
+                        return None
+                    self._ready[key] = result
+        return self._ready[key]
+
+    def _create_index(self, engine):
+        """Create the index structures for the current database (idempotent)"""
+        dialect = engine.dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            return False
+
+        try:
+            if not db.inspect(engine).has_table('products'):
+                return None
+
+            with engine.begin() as conn:
+                if dialect == 'sqlite':
+                    created = not db.inspect(conn).has_table('products_fts')
+                    for statement in SQLITE_DDL:
+                        conn.execute(text(statement))
+                    if created:
+                        # Populate from the existing catalog
+                        conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+                else:
+                    for statement in POSTGRES_DDL:
+                        conn.execute(text(statement))
+
+            logger.info(f"Product search index ready ({dialect})")
+            return dialect
+
+        except Exception as e:
+            logger.warning(f"Full-text index unavailable, falling back to ILIKE search: {e}")
+            return False
+
+    def rebuild(self):
+        """Rebuild the SQLite index from the products table"""
+        if self.backend() == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+    def apply(self, query, search):
+        """
+        Filter a Product query by a search string and order it by relevance
+
+        Every word must match and each word is prefix-matched, so partial
+        input like "vit ser" finds "Vitamin C Serum". Callers may add
+        further order_by() clauses, which act as tie-breakers.
+        """
+        from models import Product
+
+        tokens = tokenize_search(search)
+        backend = self.backend() if tokens else None
+
+        if backend == 'sqlite':
+            match = ' '.join(f'"{token}"*' for token in tokens)
+            weights = ', '.join(str(weight) for weight in SQLITE_COLUMN_WEIGHTS)
+            matches = text(
+                f"SELECT rowid AS product_id, bm25(products_fts, {weights}) AS rank "
+                "FROM products_fts WHERE products_fts MATCH :fts_match"
+            ).bindparams(fts_match=match).columns(
+                column('product_id', db.Integer), column('rank', db.Float)
+            ).subquery('search_matches')
+            return query.join(matches, Product.id == matches.c.product_id).order_by(matches.c.rank.asc())
+
+        if backend == 'postgresql':
+            tsquery = ' & '.join(f'{token}:*' for token in tokens)
+            return query.filter(
+                text(f"({POSTGRES_VECTOR}) @@ to_tsquery('simple', :fts_query)").bindparams(fts_query=tsquery)
+            ).order_by(
+                text(f"ts_rank_cd({POSTGRES_VECTOR}, to_tsquery('simple', :fts_rank_query)) DESC").bindparams(fts_rank_query=tsquery)
+            )
+
+        # Fallback: substring match without an index
+        search_term = f"%{search}%"
+        return query.filter(
+            or_(
+                Product.name.ilike(search_term),
+                Product.description.ilike(search_term),
+                Product.slug.ilike(search_term),
+                Product.tags.ilike(search_term)
+            )
+        )
+
+# Global search index instance
+product_search = ProductSearchIndex()
@@ -0,0 +1,269 @@
+"""
+Fingerprinted frontend assets
+Builds an in-memory manifest of the frontend directory at startup: every file
+is content-hashed, HTML and CSS references to other assets are rewritten to
+hashed URLs (style.css -> style.3f2a1b9c0d.css), and text assets are
+precompressed with gzip (and brotli when installed). Hashed URLs are served
+with year-long immutable cache headers; HTML revalidates with its ETag.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from urllib.parse import quote, unquote
+from flask import Response, abort, request, send_file
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 10
+
+# style.3f2a1b9c0d.css -> (style, 3f2a1b9c0d, .css)
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+
+# Asset references rewritten to hashed URLs
+HTML_REFERENCE = re.compile(r'''(?P<prefix>\b(?:src|href)=)(?P<quote>["'])(?P<url>[^"'#?]+)(?P=quote)''')
+CSS_REFERENCE = re.compile(r'''url\((?P<quote>["']?)(?P<url>[^)"'#?]+)(?P=quote)\)''')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Unhashed, non-HTML URLs (e.g. images referenced from JS) are cached briefly
+UNHASHED_MAX_AGE = 300
+
+
+class Asset:
+    """One frontend file in the manifest"""
+
+    __slots__ = ('path', 'source', 'mimetype', 'digest', 'hashed_path', 'body', 'gzip', 'brotli')
+
+    def __init__(self, path, source, mimetype):
+        self.path = path
+        self.source = source
+        self.mimetype = mimetype
+        self.digest = None
+        self.hashed_path = None
+        # Kept in memory for text assets (possibly rewritten); binaries are sent from disk
+        self.body = None
+        self.gzip = None
+        self.brotli = None
+
+    @property
+    def is_html(self):
+        return self.mimetype == 'text/html'
+
+    @property
+    def is_text(self):
+        return self.mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+class AssetManifest:
+    """Content-hashed view of the frontend directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.signature = None
+
+    def build(self):
+        """Hash every file; binaries, then CSS, then other text, then HTML, so rewritten references are final"""
+        files = self._scan()
+        self.signature = self._signature(files)
+        for path, (source, _) in files.items():
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            self.assets[path] = Asset(path, source, mimetype)
+
+        def stage(asset):
+            if not asset.is_text:
+                return 0
+            if asset.mimetype == 'text/css':
+                return 1
+            return 3 if asset.is_html else 2
+
+        for asset in sorted(self.assets.values(), key=stage):
+            self._load(asset)
+        return self
+
+    def _scan(self):
+        files = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                source = os.path.join(directory, filename)
+                path = os.path.relpath(source, self.root).replace(os.sep, '/')
+                files[path] = (source, os.stat(source).st_mtime_ns)
+        return files
+
+    @staticmethod
+    def _signature(files):
+        return tuple(sorted((path, mtime) for path, (_, mtime) in files.items()))
+
+    def is_stale(self):
+        """True when files were added, removed or modified since the build"""
+        return self._signature(self._scan()) != self.signature
+
+    def _load(self, asset):
+        with open(asset.source, 'rb') as f:
+            content = f.read()
+
+        if asset.is_text:
+            if asset.is_html:
+                content = self._rewrite(asset, content, HTML_REFERENCE)
+            elif asset.mimetype == 'text/css':
+                content = self._rewrite(asset, content, CSS_REFERENCE)
+            asset.body = content
+            if len(content) >= MIN_COMPRESS_SIZE:
+                compressed = gzip.compress(content, compresslevel=9, mtime=0)
+                asset.gzip = compressed if len(compressed) < len(content) else None
+                if brotli is not None:
+                    compressed = brotli.compress(content, quality=11)
+                    asset.brotli = compressed if len(compressed) < len(content) else None
+
+        asset.digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        if not asset.is_html:
+            directory, filename = posixpath.split(asset.path)
+            stem, ext = posixpath.splitext(filename)
+            asset.hashed_path = posixpath.join(directory, f'{stem}.{asset.digest}{ext}')
+
+    def _rewrite(self, asset, content, pattern):
+        """Point references to known assets at their hashed URLs"""
+        text = content.decode('utf-8', errors='surrogateescape')
+        base = posixpath.dirname(asset.path)
+
+        def replace(match):
+            url = match.group('url').strip()
+            if not url or ':' in url or url.startswith('//'):
+                return match.group(0)
+            decoded = unquote(url)
+            target_path = posixpath.normpath(
+                decoded.lstrip('/') if decoded.startswith('/') else posixpath.join(base, decoded)
+            )
+            target = self.assets.get(target_path)
+            if target is None or target.is_html or target.hashed_path is None:
+                return match.group(0)
+            hashed_url = posixpath.join(posixpath.dirname(url), quote(posixpath.basename(target.hashed_path)))
+            return match.group(0).replace(match.group('url'), hashed_url)
+
+        return pattern.sub(replace, text).encode('utf-8', errors='surrogateescape')
+
+    def lookup(self, path):
+        """
+        Resolve a request path
+
+        Returns:
+            (asset, is_hashed_url) or (None, False)
+        """
+        asset = self.assets.get(path)
+        if asset is not None:
+            return asset, False
+        directory, filename = posixpath.split(path)
+        match = HASHED_NAME.match(filename)
+        if match:
+            asset = self.assets.get(posixpath.join(directory, match.group('stem') + match.group('ext')))
+            if asset is not None:
+                # An outdated hash still gets the current file, just without the immutable promise
+                return asset, asset.digest == match.group('hash')
+        return None, False
+
+
+class StaticAssets:
+    """Serves the frontend from a fingerprinted, precompressed manifest"""
+
+    def __init__(self):
+        self.app = None
+        self.root = None
+        self._manifest = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind to the app and build the manifest"""
+        self.app = app
+        self.root = os.path.abspath(
+            app.config.get('FRONTEND_DIR') or os.path.join(app.root_path, '..', 'frontend')
+        )
+        if os.path.isdir(self.root):
+            self.rebuild()
+        else:
+            logger.warning(f"Frontend directory not found: {self.root}")
+
+    def rebuild(self):
+        """Rebuild the manifest from disk"""
+        manifest = AssetManifest(self.root).build()
+        self._manifest = manifest
+        logger.info(f"Frontend asset manifest built: {len(manifest.assets)} files")
+        return manifest
+
+    def manifest(self):
+        """Current manifest; in debug mode it is rebuilt when frontend files change"""
+        manifest = self._manifest
+        if manifest is not None and self.app.debug and manifest.is_stale():
+            with self._lock:
+                if self._manifest is manifest:
+                    manifest = self.rebuild()
+        return manifest
+
+    def url_for(self, path):
+        """Hashed URL of a frontend file (the plain path when unknown)"""
+        manifest = self.manifest()
+        asset = manifest.assets.get(path) if manifest else None
+        return '/' + (asset.hashed_path if asset and asset.hashed_path else path)
+
+    def send(self, path):
+        """Response for a frontend file, or 404"""
+        manifest = self.manifest()
+        if manifest is None:
+            abort(404)
+        asset, is_hashed_url = manifest.lookup(path.strip('/'))
+        if asset is None:
+            abort(404)
+
+        if asset.body is None:
+            response = send_file(asset.source, mimetype=asset.mimetype, etag=asset.digest, conditional=True)
+        else:
+            body, encoding = self._negotiate(asset)
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if asset.gzip or asset.brotli:
+                response.vary.add('Accept-Encoding')
+            response.set_etag(f'{asset.digest}-{encoding}' if encoding else asset.digest)
+            response.make_conditional(request)
+
+        # send_file marks responses no-cache when no max_age is given
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        if is_hashed_url:
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        elif asset.is_html:
+            # Always revalidate; unchanged pages come back as 304
+            response.cache_control.max_age = 0
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.max_age = UNHASHED_MAX_AGE
+        return response
+
+    @staticmethod
+    def _negotiate(asset):
+        accepted = request.accept_encodings
+        if asset.brotli and accepted['br']:
+            return asset.brotli, 'br'
+        if asset.gzip and accepted['gzip']:
+            return asset.gzip, 'gzip'
+        return asset.body, None
+
+# Global static assets instance
+static_assets = StaticAssets()
@@ -0,0 +1,298 @@
+"""
+Checkout stock reservations
+Stock is taken with a conditional UPDATE (... WHERE stock_quantity >= :q), so
+concurrent checkouts can never oversell, and the hold is committed straight
+away so the database writer lock is not kept across the payment call. Holds
+become part of the order when it is placed, or are released on payment
+failure or after STOCK_RESERVATION_TTL seconds. The catalog version is only
+bumped when a product sells out or comes back into stock; other stock levels
+and sales counters in cached responses refresh with CATALOG_CACHE_TTL.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, insert, select, update
+from extensions import db
+from services.catalog_cache import catalog_version
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds between expiry sweeps triggered by new reservations
+SWEEP_INTERVAL = 30
+
+
+class InsufficientStock(ValueError):
+    """Raised when a product cannot cover the requested quantity"""
+
+
+class StockReservations:
+    """Reserves, commits and releases checkout stock holds"""
+
+    def __init__(self):
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    @staticmethod
+    def _ttl():
+        return current_app.config.get('STOCK_RESERVATION_TTL', 900)
+
+    @staticmethod
+    def _take(product_id, quantity):
+        """Conditionally take stock; True when the row had enough"""
+        from models import Product
+
+        products = Product.__table__
+        result = db.session.execute(
+            update(products)
+            .where(products.c.id == product_id, products.c.track_inventory == True,
+                   products.c.stock_quantity >= quantity)
+            .values(stock_quantity=products.c.stock_quantity - quantity)
+        )
+        return result.rowcount == 1
+
+    @staticmethod
+    def _return(product_id, quantity):
+        """Give stock back; True when the product was sold out before"""
+        from models import Product
+
+        products = Product.__table__
+        returned = update(products).where(products.c.id == product_id).values(
+            stock_quantity=products.c.stock_quantity + quantity
+        )
+        if db.engine.dialect.update_returning:
+            stock = db.session.execute(returned.returning(products.c.stock_quantity)).scalar()
+        else:
+            db.session.execute(returned)
+            stock = db.session.execute(select(products.c.stock_quantity).where(products.c.id == product_id)).scalar()
+        return stock is not None and stock - quantity <= 0
+
+    def reserve(self, items, ttl=None):
+        """
+        Hold stock for every cart item in one short transaction
+
+        All tracked products are taken by a single conditional UPDATE and the
+        holds are written with one bulk INSERT. Products that do not track
+        inventory are not held.
+
+        Args:
+            items: list of {'id': product id, 'quantity': n} (cart items)
+
+        Returns:
+            Reservation token
+
+        Raises:
+            InsufficientStock: if any product lacks stock (nothing is held)
+            ValueError: for unknown products or invalid quantities
+        """
+        from models import Product, StockReservation
+
+        self.release_expired()
+
+        # Sum duplicate lines per product
+        quantities = {}
+        for item in items:
+            quantity = int(item['quantity'])
+            if quantity <= 0:
+                raise ValueError('Quantity must be positive')
+            product_id = int(item['id'])
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+        token = str(uuid.uuid4())
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl or self._ttl())
+        product_ids = sorted(quantities)
+        products = Product.__table__
+        dialect = db.engine.dialect
+
+        try:
+            if dialect.name != 'sqlite':
+                # Lock rows in id order so concurrent multi-product checkouts cannot deadlock
+                db.session.execute(
+                    select(products.c.id).where(products.c.id.in_(product_ids))
+                    .order_by(products.c.id).with_for_update()
+                )
+
+            wanted = case(quantities, value=products.c.id)
+            take = update(products).where(
+                products.c.id.in_(product_ids),
+                products.c.track_inventory == True,
+                products.c.stock_quantity >= wanted
+            ).values(stock_quantity=products.c.stock_quantity - wanted)
+
+            if dialect.update_returning:
+                remaining = dict(db.session.execute(take.returning(products.c.id, products.c.stock_quantity)).all())
+            else:
+                # Read the (locked) stock first; the UPDATE takes exactly the rows that cover their quantity
+                before = db.session.execute(
+                    select(products.c.id, products.c.stock_quantity)
+                    .where(products.c.id.in_(product_ids), products.c.track_inventory == True)
+                ).all()
+                remaining = {
+                    product_id: stock - quantities[product_id]
+                    for product_id, stock in before if stock is not None and stock >= quantities[product_id]
+                }
+                if db.session.execute(take).rowcount != len(remaining):
+                    raise InsufficientStock('Stock changed during checkout; please try again')
+            taken = set(remaining)
+
+            # Rows not taken are either untracked (fine), missing or short of stock
+            not_taken = set(product_ids) - taken
+            if not_taken:
+                rows = {
+                    row.id: row for row in db.session.query(
+                        Product.id, Product.name, Product.stock_quantity, Product.track_inventory
+                    ).filter(Product.id.in_(not_taken)).all()
+                }
+                for product_id in sorted(not_taken):
+                    row = rows.get(product_id)
+                    if row is None:
+                        raise ValueError(f'Product not available: {product_id}')
+                    if row.track_inventory:
+                        raise InsufficientStock(f'Insufficient stock for {row.name}. Available: {row.stock_quantity}')
+
+            if taken:
+                db.session.execute(insert(StockReservation), [
+                    {'token': token, 'product_id': product_id, 'quantity': quantities[product_id],
+                     'status': 'held', 'expires_at': expires_at, 'created_at': datetime.utcnow()}
+                    for product_id in sorted(taken)
+                ])
+            db.session.commit()
+            if any(stock <= 0 for stock in remaining.values()):
+                catalog_version.bump()  # Sold out
+            return token
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def commit(self, token, order_id):
+        """
+        Attach a reservation to its order (runs in the caller's transaction)
+
+        One UPDATE claims every hold; a hold that already expired is taken
+        again if stock allows (the rare case the catalog version is left to
+        the cache TTL).
+
+        Raises:
+            InsufficientStock: if an expired hold can no longer be covered
+        """
+        from models import StockReservation
+
+        reservations = StockReservation.__table__
+        db.session.execute(
+            update(reservations)
+            .where(reservations.c.token == token, reservations.c.status == 'held')
+            .values(status='committed', order_id=order_id)
+        )
+
+        # Released by the expiry sweep in the meantime; stock was returned, so take it again
+        expired = db.session.execute(
+            select(reservations.c.id, reservations.c.product_id, reservations.c.quantity)
+            .where(reservations.c.token == token, reservations.c.status == 'released')
+        ).all()
+        for reservation in expired:
+            if not self._take(reservation.product_id, reservation.quantity):
+                raise InsufficientStock(f'Reserved stock for product {reservation.product_id} expired')
+            db.session.execute(
+                update(reservations).where(reservations.c.id == reservation.id)
+                .values(status='committed', order_id=order_id)
+            )
+
+    def release(self, token):
+        """
+        Return held stock (payment failed or checkout abandoned) and commit
+
+        Safe to call more than once and concurrently with the expiry sweep;
+        never raises, since it runs on error paths.
+
+        Returns:
+            Number of units returned
+        """
+        from models import StockReservation
+
+        try:
+            reservations = StockReservation.query.filter_by(token=token, status='held').all()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to load stock reservation {token}: {e}")
+            return 0
+        return self._release(reservations)
+
+    def release_order(self, order_id):
+        """
+        Return the stock committed to an order whose payment failed
+        (runs in the caller's transaction; bump the catalog version after the
+        commit when a product came back into stock)
+
+        Returns:
+            Tuple of (units returned, whether a sold-out product came back into stock)
+        """
+        from models import StockReservation
+
+        return self._return_reservations(
+            StockReservation.query.filter_by(order_id=order_id, status='committed').all(),
+            status='committed'
+        )
+
+    def release_expired(self, force=False):
+        """Release holds past their expiry (at most every SWEEP_INTERVAL seconds unless forced)"""
+        from models import StockReservation
+
+        now = time.monotonic()
+        if not force and now - self._last_sweep < SWEEP_INTERVAL:
+            return 0
+        with self._sweep_lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return 0
+            self._last_sweep = now
+
+        expired = StockReservation.query.filter(
+            StockReservation.status == 'held',
+            StockReservation.expires_at < datetime.utcnow()
+        ).all()
+        released = self._release(expired)
+        if released:
+            logger.info(f"Released {released} units of expired stock reservations")
+        return released
+
+    def _release(self, reservations):
+        if not reservations:
+            return 0
+
+        try:
+            released, restocked = self._return_reservations(reservations)
+            db.session.commit()
+            if restocked:
+                catalog_version.bump()
+            return released
+
+        except Exception as e:
+            # Holds left in place are returned by the expiry sweep
+            db.session.rollback()
+            logger.error(f"Failed to release stock reservations: {e}")
+            return 0
+
+    def _return_reservations(self, reservations, status='held'):
+        from models import StockReservation
+
+        reservations_table = StockReservation.__table__
+        released = 0
+        restocked = False
+        for reservation in reservations:
+            # Flip the status first; only the caller that wins it returns the stock
+            flipped = db.session.execute(
+                update(reservations_table)
+                .where(reservations_table.c.id == reservation.id, reservations_table.c.status == status)
+                .values(status='released')
+            ).rowcount == 1
+            if flipped:
+                restocked = self._return(reservation.product_id, reservation.quantity) or restocked
+                released += reservation.quantity
+        return released, restocked
+
+# Global stock reservations instance
+stock_reservations = StockReservations()
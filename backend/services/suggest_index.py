@@ -0,0 +1,163 @@
+"""
+Search-as-you-type suggestions
+Keeps a sorted in-process array of (term, product id) pairs built from product
+names, tags, categories and badge names, so prefix lookups are two bisects
+instead of a database scan. The index refreshes incrementally when the catalog
+changes, re-reading only products whose updated_at moved.
+"""
+
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from flask import current_app
+from extensions import db
+from services.catalog_cache import catalog_version
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text"""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class SuggestIndex:
+    """Prefix index over active products for the /suggest endpoint"""
+
+    def __init__(self, max_limit=20):
+        self.max_limit = max_limit
+        self._entries = []      # sorted (term, product id)
+        self._terms = {}        # product id -> terms indexed for it
+        self._products = {}     # product id -> suggestion payload and ranking data
+        self._stamps = {}       # product id -> updated_at when indexed
+        self._badge_names = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def suggest(self, query, limit=8):
+        """
+        Return up to `limit` products whose indexed words start with every word of the query
+
+        Products whose name starts with the query rank first, then by sales.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        limit = max(1, min(limit, self.max_limit))
+
+        self._ensure_fresh()
+
+        with self._lock:
+            matches = None
+            for token in set(tokens):
+                ids = self._prefix_ids(token)
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+
+            phrase = ' '.join(tokens)
+            ranked = sorted(
+                (self._products[product_id] for product_id in matches),
+                key=lambda product: (
+                    not product['_name'].startswith(phrase), -product['_sales'], product['_name']
+                )
+            )
+            return [
+                {key: value for key, value in product.items() if not key.startswith('_')}
+                for product in ranked[:limit]
+            ]
+
+    def _prefix_ids(self, prefix):
+        start = bisect_left(self._entries, (prefix,))
+        end = bisect_left(self._entries, (prefix + '\uffff',), start)
+        return {product_id for _, product_id in self._entries[start:end]}
+
+    def _ensure_fresh(self):
+        # Catalog edits in this process bump the version; the TTL picks up edits made by other workers
+        ttl = current_app.config.get('CATALOG_CACHE_TTL', 60)
+        if self._version == catalog_version.current and time.monotonic() - self._checked_at <= ttl:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh suggestion index: {e}")
+
+    def refresh(self):
+        """Re-index new and changed products, drop removed ones (full rebuild when badges changed)"""
+        from models import Product, Badge
+
+        with self._lock:
+            version = catalog_version.current
+            stamps = dict(db.session.query(Product.id, Product.updated_at).filter(Product.is_active == True).all())
+            badge_names = dict(db.session.query(Badge.id, Badge.name).filter(Badge.is_active == True).all())
+
+            if badge_names != self._badge_names:
+                self._entries, self._terms, self._products, self._stamps = [], {}, {}, {}
+                self._badge_names = badge_names
+
+            removed = self._stamps.keys() - stamps.keys()
+            changed = [product_id for product_id, stamp in stamps.items() if self._stamps.get(product_id) != stamp]
+
+            for product_id in removed:
+                self._remove(product_id)
+
+            if changed:
+                columns = (
+                    Product.id, Product.name, Product.slug, Product.primary_image, Product.tags,
+                    Product.category, Product.badge_ids, Product.sales_count
+                )
+                # Small changes are applied in place; large ones re-sort the whole array once
+                if len(changed) > max(100, len(self._terms) // 10):
+                    dropped = set(changed)
+                    self._entries = [entry for entry in self._entries if entry[1] not in dropped]
+                    for product_id in dropped:
+                        self._terms.pop(product_id, None)
+                        self._products.pop(product_id, None)
+                    for row in db.session.query(*columns).filter(Product.is_active == True).all():
+                        if row.id in dropped:
+                            self._add(row, insert=False)
+                    self._entries.sort()
+                else:
+                    for row in db.session.query(*columns).filter(Product.id.in_(changed)).all():
+                        self._remove(row.id)
+                        self._add(row)
+
+            self._stamps = stamps
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _add(self, row, insert=True):
+        terms = set(tokenize(row.name)) | set(tokenize(row.tags)) | set(tokenize(row.category))
+        for badge_id in row.badge_ids or ():
+            terms.update(tokenize(self._badge_names.get(int(badge_id)) if str(badge_id).isdigit() else None))
+
+        self._terms[row.id] = terms
+        self._products[row.id] = {
+            'id': row.id,
+            'name': row.name,
+            'slug': row.slug,
+            'thumbnail': row.primary_image,
+            '_name': (row.name or '').lower(),
+            '_sales': row.sales_count or 0
+        }
+        for term in terms:
+            if insert:
+                insort(self._entries, (term, row.id))
+            else:
+                self._entries.append((term, row.id))
+
+    def _remove(self, product_id):
+        for term in self._terms.pop(product_id, ()):
+            position = bisect_left(self._entries, (term, product_id))
+            if position < len(self._entries) and self._entries[position] == (term, product_id):
+                del self._entries[position]
+        self._products.pop(product_id, None)
+
+# Global suggestion index instance
+suggest_index = SuggestIndex()
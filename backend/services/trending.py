@@ -0,0 +1,229 @@
+"""
+Time-decayed trending scores
+Each unit sold adds 2^((sold_at - epoch) / half_life) to products.trending_score.
+Because every sale is weighted against the same epoch, ordering by the
+stored column equals ordering by the decayed score at any moment, so new
+sales are a single in-place increment and reads are a plain indexed sort.
+Weights grow without bound, so once the epoch is REBASE_AFTER half-lives old
+it is moved to now and every stored score is rescaled by the same factor
+(ordering is unchanged). The epoch lives in the trending_state table so all
+worker processes agree on it.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, case, func, select, update
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Reference point until the first rebase stores one in trending_state
+EPOCH = datetime(2025, 1, 1)
+
+# Rebase once the newest weights reach 2^REBASE_AFTER (floats overflow at 2^1024)
+REBASE_AFTER = 64
+
+# Shortest accepted TRENDING_HALF_LIFE_DAYS; shorter ones need rebasing too often
+MIN_HALF_LIFE_DAYS = 1
+
+# Seconds between checks whether a rebase is due, and how long the epoch is cached for display
+REBASE_CHECK_INTERVAL = 3600
+EPOCH_CACHE_TTL = 60
+
+
+class TrendingScores:
+    """Maintains products.trending_score from order items"""
+
+    def __init__(self):
+        self._epoch = None
+        self._epoch_loaded_at = 0.0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Validate the half-life setting at startup"""
+        half_life = app.config.get('TRENDING_HALF_LIFE_DAYS', 7)
+        if half_life < MIN_HALF_LIFE_DAYS:
+            raise ValueError(f'TRENDING_HALF_LIFE_DAYS must be at least {MIN_HALF_LIFE_DAYS} (got {half_life})')
+
+    @staticmethod
+    def _half_life_days():
+        return current_app.config.get('TRENDING_HALF_LIFE_DAYS', 7)
+
+    def _half_lives(self, at, epoch):
+        return ((at or datetime.utcnow()) - epoch).total_seconds() / 86400 / self._half_life_days()
+
+    @staticmethod
+    def _load_epoch(lock=False):
+        """Stored epoch (EPOCH if none yet); lock=True blocks a concurrent rebase until the caller commits"""
+        from models import TrendingState
+
+        query = select(TrendingState.epoch).where(TrendingState.id == 1)
+        if lock:
+            query = query.with_for_update(read=True)
+        return db.session.execute(query).scalar() or EPOCH
+
+    def epoch(self):
+        """Current epoch, cached for EPOCH_CACHE_TTL seconds (display only; writes read it fresh)"""
+        if self._epoch is None or time.monotonic() - self._epoch_loaded_at > EPOCH_CACHE_TTL:
+            self._remember(self._load_epoch())
+        return self._epoch
+
+    def _remember(self, epoch):
+        self._epoch = epoch
+        self._epoch_loaded_at = time.monotonic()
+
+    def weight(self, at=None, epoch=None):
+        """Weight of one unit sold at `at` (default now)"""
+        return 2 ** self._half_lives(at, epoch or self.epoch())
+
+    def decayed(self, stored_score, at=None):
+        """Convert a stored score into units sold, decayed to `at` (default now)"""
+        return (stored_score or 0) / self.weight(at)
+
+    def record_sales(self, quantities, at=None):
+        """
+        Add sold quantities to sales_count and trending_score in one UPDATE
+
+        Runs in the caller's transaction, so call it before the order commit.
+
+        Args:
+            quantities: {product_id: units sold}
+        """
+        from models import Product
+
+        if not quantities:
+            return
+        epoch = self._load_epoch(lock=True)
+        products = Product.__table__
+        sold = case(quantities, value=products.c.id, else_=0)
+        # Keep updated_at untouched; sales are not product edits
+        db.session.execute(
+            update(products).where(products.c.id.in_(list(quantities))).values(
+                sales_count=func.coalesce(products.c.sales_count, 0) + sold,
+                trending_score=products.c.trending_score + sold * self.weight(at, epoch),
+                updated_at=products.c.updated_at
+            )
+        )
+
+    def rebase_if_due(self, force=False):
+        """
+        Move the epoch to now and rescale every stored score once it is
+        REBASE_AFTER half-lives old (checked at most every REBASE_CHECK_INTERVAL
+        seconds unless forced). Commits its own transaction.
+
+        Returns:
+            True if the scores were rebased
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < REBASE_CHECK_INTERVAL:
+            return False
+        with self._lock:
+            if not force and now - self._last_check < REBASE_CHECK_INTERVAL:
+                return False
+            self._last_check = now
+
+        try:
+            old_epoch = self._load_epoch()
+            if self._half_lives(None, old_epoch) < REBASE_AFTER:
+                db.session.rollback()
+                self._remember(old_epoch)
+                return False
+
+            new_epoch = datetime.utcnow()
+            if not self._store_epoch(old_epoch, new_epoch):
+                # Another worker rebased first
+                db.session.rollback()
+                self._remember(self._load_epoch())
+                return False
+
+            from models import Product
+
+            products = Product.__table__
+            factor = 2 ** -self._half_lives(new_epoch, old_epoch)
+            db.session.execute(
+                update(products).where(products.c.trending_score != 0)
+                .values(trending_score=products.c.trending_score * factor, updated_at=products.c.updated_at)
+            )
+            db.session.commit()
+            self._remember(new_epoch)
+            logger.info(f"Trending scores rebased from {old_epoch} to {new_epoch}")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to rebase trending scores: {e}")
+            return False
+
+    @staticmethod
+    def _store_epoch(old_epoch, new_epoch):
+        """Swap the stored epoch (runs in the caller's transaction); False if it is no longer old_epoch"""
+        from models import TrendingState
+
+        state = TrendingState.__table__
+        if db.session.execute(select(state.c.id).where(state.c.id == 1).with_for_update()).first() is None:
+            if old_epoch != EPOCH:
+                return False
+            db.session.add(TrendingState(id=1, epoch=new_epoch))
+            db.session.flush()
+            return True
+        return db.session.execute(
+            update(state).where(state.c.id == 1, state.c.epoch == old_epoch).values(epoch=new_epoch)
+        ).rowcount == 1
+
+    def rebuild(self, window_days=None):
+        """
+        Recompute every score from order items inside the rolling window,
+        weighted against a fresh epoch
+
+        Older sales have decayed to near zero and are dropped, and so are
+        items of cancelled orders.
+
+        Returns:
+            Number of products with a non-zero score
+        """
+        from models import Product, Order, OrderItem
+
+        window_days = window_days or current_app.config.get('TRENDING_WINDOW_DAYS', 90)
+        since = datetime.utcnow() - timedelta(days=window_days)
+
+        try:
+            epoch = datetime.utcnow()
+            if not self._store_epoch(self._load_epoch(), epoch):
+                raise RuntimeError('Trending epoch changed during rebuild; try again')
+
+            rows = db.session.query(
+                OrderItem.product_id, OrderItem.created_at, OrderItem.quantity
+            ).join(Order, Order.id == OrderItem.order_id).filter(
+                OrderItem.created_at >= since,
+                Order.status != 'cancelled'
+            ).execution_options(yield_per=1000)
+
+            scores = {}
+            for product_id, sold_at, quantity in rows:
+                scores[product_id] = scores.get(product_id, 0.0) + (quantity or 0) * self.weight(sold_at, epoch)
+
+            # Keep updated_at untouched; scores are not product edits
+            products = Product.__table__
+            db.session.execute(update(products).values(trending_score=0, updated_at=products.c.updated_at))
+            if scores:
+                db.session.execute(
+                    update(products).where(products.c.id == bindparam('product_id'))
+                    .values(trending_score=bindparam('score'), updated_at=products.c.updated_at),
+                    [{'product_id': product_id, 'score': score} for product_id, score in scores.items()]
+                )
+            db.session.commit()
+            self._remember(epoch)
+            return len(scores)
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to rebuild trending scores: {e}")
+            raise
+
+# Global trending scores instance
+trending_scores = TrendingScores()
@@ -0,0 +1,121 @@
+"""
+Write-behind buffer for product view counts
+Page views are counted in memory and periodically written to the database as
+one batched UPDATE, keeping product reads free of write transactions
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import bindparam, update
+from extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Accumulates product views in-process and flushes them in batches"""
+
+    def __init__(self):
+        self.app = None
+        self._by_id = Counter()
+        self._by_slug = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Bind to the app and start the background flusher"""
+        self.app = app
+        interval = app.config.get('VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+        if self._thread is None and interval:
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), name='view-counter-flush', daemon=True
+            )
+            self._thread.start()
+            # Flush whatever is still buffered on graceful shutdown
+            atexit.register(self.shutdown)
+
+    def record(self, product_id):
+        """Count one view of a product by id"""
+        with self._lock:
+            self._by_id[product_id] += 1
+
+    def record_slug(self, slug):
+        """Count one view of a product by slug (used when the product row was not loaded)"""
+        with self._lock:
+            self._by_slug[slug] += 1
+
+    def pending(self):
+        """Number of buffered views not yet written"""
+        with self._lock:
+            return sum(self._by_id.values()) + sum(self._by_slug.values())
+
+    def flush(self):
+        """
+        Write all buffered views in a single transaction
+
+        The buffer is swapped out before writing; if the write fails the counts
+        are merged back so they are retried on the next flush.
+
+        Returns:
+            Number of views written
+        """
+        with self._flush_lock:
+            with self._lock:
+                by_id, self._by_id = self._by_id, Counter()
+                by_slug, self._by_slug = self._by_slug, Counter()
+
+            if not by_id and not by_slug:
+                return 0
+
+            try:
+                with self.app.app_context():
+                    self._write(by_id, by_slug)
+            except Exception as e:
+                logger.error(f"Failed to flush product view counts: {e}")
+                with self._lock:
+                    self._by_id.update(by_id)
+                    self._by_slug.update(by_slug)
+                return 0
+
+            return sum(by_id.values()) + sum(by_slug.values())
+
+    def _write(self, by_id, by_slug):
+        products = db.metadata.tables['products']
+        # Keep updated_at untouched; view counts are not product edits
+        increment = {
+            'view_count': products.c.view_count + bindparam('views'),
+            'updated_at': products.c.updated_at
+        }
+
+        with db.engine.begin() as conn:
+            if by_id:
+                conn.execute(
+                    update(products).where(products.c.id == bindparam('product_id')).values(increment),
+                    [{'product_id': product_id, 'views': views} for product_id, views in by_id.items()]
+                )
+            if by_slug:
+                conn.execute(
+                    update(products).where(
+                        products.c.slug == bindparam('product_slug'),
+                        products.c.is_active == True
+                    ).values(increment),
+                    [{'product_slug': slug, 'views': views} for slug, views in by_slug.items()]
+                )
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def shutdown(self):
+        """Stop the background flusher and write the remaining views"""
+        self._stop.set()
+        self.flush()
+
+# Global view counter instance
+view_counter = ViewCounter()
@@ -0,0 +1,97 @@
+"""
+Keyset (cursor) pagination helpers
+Pages are fetched with WHERE (sort_column, id) < (last_value, last_id) (or > for
+ascending sorts) instead of OFFSET, so deep pages cost the same as the first one.
+Rows whose sort value is NULL come last in either direction, ordered by id.
+"""
+
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import DateTime, and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded or belongs to another sort order"""
+
+
+def encode_cursor(sort_key, sort_value, row_id):
+    """Build an opaque cursor pointing just after the given row"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    elif isinstance(sort_value, Decimal):
+        sort_value = float(sort_value)
+    payload = json.dumps([sort_key, sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_key, sort_column):
+    """Decode a cursor into (sort_value, row_id) for the given sort order"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_key, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if cursor_key != sort_key:
+            raise InvalidCursor('Cursor does not match the requested sort order')
+        if sort_value is not None and isinstance(sort_column.type, DateTime):
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid pagination cursor')
+
+
+def keyset_paginate(query, sort_key, sort_column, id_column, cursor=None, per_page=12, include_total=False,
+                    descending=True):
+    """
+    Fetch one page of a query ordered by (sort_column, id_column), newest/largest first
+    unless descending is False
+
+    sort_column may be a column or a SQL expression (e.g. a hybrid property); its
+    value is read back from the database for the next cursor. Any ordering
+    already on the query is replaced. The total count is only computed when
+    include_total is set, since it needs a full COUNT(*).
+
+    Returns:
+        Tuple of (items, pagination_dict)
+    """
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort_key, sort_column)
+        next_id = id_column < last_id if descending else id_column > last_id
+        if last_value is None:
+            # Already in the trailing NULL rows
+            after = and_(sort_column.is_(None), next_id)
+        else:
+            beyond = sort_column < last_value if descending else sort_column > last_value
+            after = or_(beyond, and_(sort_column == last_value, next_id), sort_column.is_(None))
+        query = query.filter(after)
+
+    if descending:
+        ordering = (sort_column.desc().nulls_last(), id_column.desc())
+    else:
+        ordering = (sort_column.asc().nulls_last(), id_column.asc())
+    rows = query.add_columns(sort_column.label('keyset_sort_value')).order_by(None).order_by(
+        *ordering
+    ).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    items = [row[0] for row in rows]
+
+    next_cursor = None
+    if has_next and rows:
+        last_item, last_value = rows[-1]
+        next_cursor = encode_cursor(sort_key, last_value, getattr(last_item, id_column.key))
+
+    pagination = {
+        'per_page': per_page,
+        'cursor': cursor or None,
+        'next_cursor': next_cursor,
+        'has_next': has_next
+    }
+    if include_total:
+        pagination['total'] = total
+
+    return items, pagination
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Checkout throughput under a slow payment gateway.
+Places card orders from concurrent clients against a throwaway SQLite
+database, with the local stand-in gateway sleeping --latency seconds per
+charge, and reports how fast orders are accepted and how long payments take
+to settle. --blocking makes every client wait for its charge before placing
+the next order, which is what a synchronous charge inside the request costs
+a worker. SQLite serializes writers, so absolute numbers (and the response
+tail) are pessimistic next to PostgreSQL; compare runs with each other.
+
+Run with: python benchmark_checkout.py --orders 200 --clients 8 --latency 1.5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=200, help='orders to place')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients (WSGI workers)')
+    parser.add_argument('--latency', type=float, default=1.5, help='gateway seconds per charge')
+    parser.add_argument('--workers', type=int, default=4, help='payment worker threads')
+    parser.add_argument('--blocking', action='store_true', help='wait for each charge before the next order')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Throwaway database and gateway settings; must be set before the app is imported
+    db_dir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'benchmark.db')}"
+    os.environ['PAYMENT_GATEWAY'] = 'local'
+    os.environ['PAYMENT_GATEWAY_LATENCY'] = str(args.latency)
+    os.environ['PAYMENT_WORKERS'] = str(args.workers)
+    os.environ['PAYMENT_QUEUE_SIZE'] = str(args.orders)
+    sys.path.insert(0, 'backend')
+
+    from app import app
+    from extensions import db
+    from models import Product, PaymentJob
+    from services.payments import payment_jobs
+
+    app.config['CATALOG_CACHE_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        product = Product(name='Benchmark Serum', slug='benchmark-serum', description='Benchmark product',
+                          price=500, category='serum', stock_quantity=args.orders)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+    print(f"🧪 {args.orders} orders, {args.clients} clients, {args.latency}s gateway latency, "
+          f"{args.workers} payment workers{' (blocking)' if args.blocking else ''}")
+
+    timings = []
+    timings_lock = threading.Lock()
+    counter = iter(range(args.orders))
+    counter_lock = threading.Lock()
+
+    def client():
+        http = app.test_client()
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            started = time.monotonic()
+            response = http.post('/api/orders/guest/create', json={
+                'items': [{'id': product_id, 'quantity': 1}],
+                'guest_info': {'email': f'bench{index}@example.com'},
+                'shipping_info': {
+                    'first_name': 'Bench', 'last_name': str(index), 'address_line1': '1 Sukhumvit Rd',
+                    'city': 'Bangkok', 'state': 'Bangkok', 'postal_code': '10110'
+                },
+                'payment_info': {'method': 'card', 'token': 'tokn_benchmark'}
+            })
+            if response.status_code != 201:
+                print(f"❌ Order {index} failed: {response.get_json()}")
+                continue
+            if args.blocking:
+                payment_url = response.get_json()['order']['payment_url']
+                while True:
+                    retry_after = http.get(payment_url).headers.get('Retry-After')
+                    if retry_after is None:
+                        break
+                    time.sleep(float(retry_after))
+            with timings_lock:
+                timings.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    accepted = time.monotonic() - started
+
+    # Wait for the background charges to finish
+    with app.app_context():
+        while PaymentJob.query.filter(PaymentJob.status.in_(['queued', 'processing'])).count():
+            db.session.rollback()
+            time.sleep(0.1)
+        settled = time.monotonic() - started
+        succeeded = PaymentJob.query.filter_by(status='succeeded').count()
+    payment_jobs.shutdown()
+
+    timings.sort()
+    print(f"📦 Orders accepted: {len(timings)} in {accepted:.2f}s ({len(timings) / accepted:.1f} orders/s)")
+    print(f"⏱️  Checkout response: p50 {statistics.median(timings) * 1000:.0f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.0f} ms")
+    print(f"💳 Payments settled: {succeeded} in {settled:.2f}s "
+          f"(gateway bound: {args.workers / args.latency:.1f} charges/s)")
+
+if __name__ == '__main__':
+    main()
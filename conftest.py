@@ -0,0 +1,49 @@
+"""
+Shared pytest fixtures.
+Every test module gets its own app from the application factory, bound to a
+throwaway SQLite database, so modules run in one pytest process never see
+each other's rows.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from app import create_app
+from extensions import db
+from models import Product
+from services.view_counter import view_counter
+
+
+@pytest.fixture(scope='module')
+def app(request):
+    """App for one test module, on an empty database of its own"""
+    db_dir = tempfile.mkdtemp()
+    db_path = os.path.join(db_dir, f'{request.module.__name__}.db')
+    app = create_app('testing', {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        db.create_all()
+    yield app
+    # Buffered views belong to this module's database
+    view_counter.flush()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope='module')
+def create_product(app):
+    """Factory: add a product with the given stock and return its id"""
+    def create(slug, stock, **fields):
+        with app.app_context():
+            product = Product(name=slug.title(), slug=slug, description='Test product', price=500,
+                              category='serum', stock_quantity=stock, **fields)
+            db.session.add(product)
+            db.session.commit()
+            return product.id
+    return create
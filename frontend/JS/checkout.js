@@ -6,6 +6,12 @@ document.addEventListener('DOMContentLoaded', function() {
     let isAuthenticated = false;
     let currentUser = null;
 
+    // One key per checkout: a resubmitted order (e.g. after a network error) gets the
+    // original order back from the server instead of being placed and charged twice
+    const idempotencyKey = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
     // Omise configuration - you'll need to set your public key
     const OMISE_PUBLIC_KEY = 'pkey_test_64jt8kd53p45vdulorn'; // Replace with your actual public key
     
@@ -516,6 +522,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey,
                 },
                 credentials: 'include',
                 body: JSON.stringify(orderData)
@@ -196,6 +196,11 @@ async function loadOrderData() {
         
         if (data.status === 'success' && data.order) {
             populateOrderData(data.order);
+            
+            // Card charges settle in the background; wait for the result
+            if (data.order.payment_method === 'card' && data.order.payment_status === 'pending') {
+                await waitForPayment(orderNumber);
+            }
         } else {
             throw new Error(data.message || 'Failed to load order data');
         }
@@ -206,6 +211,31 @@ async function loadOrderData() {
     }
 }
 
+async function waitForPayment(orderNumber) {
+    // Poll the payment status, pausing as long as the server's Retry-After asks
+    const deadline = Date.now() + 3 * 60 * 1000;
+    while (Date.now() < deadline) {
+        const response = await fetch(`/api/orders/${orderNumber}/payment`);
+        const data = await response.json();
+        if (data.status !== 'success') {
+            return;
+        }
+        
+        const payment = data.payment;
+        if (payment.payment_status === 'failed') {
+            const reason = payment.job && payment.job.error ? ` (${payment.job.error})` : '';
+            showOrderError(`Payment was declined${reason}. Your order has been cancelled and you have not been charged.`);
+            return;
+        }
+        if (payment.payment_status !== 'pending') {
+            return;
+        }
+        
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 2;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+}
+
 function populateOrderData(order) {
     try {
         console.log('Populating order data:', order);
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Database migration script to convert the product gallery and badge fields to JSON columns.
+Normalizes stored JSON text, then on PostgreSQL changes the column type to JSONB.
+SQLite keeps storing JSON text, so only the clean-up step applies there.
+Malformed values are listed and the migration stops without changing anything;
+fix them by hand and run it again.
+"""
+
+import json
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+JSON_FIELDS = ['gallery_images', 'gallery_items', 'badge_ids']
+
+def normalize_json_text(value):
+    """Return compact JSON text for a stored value, or None if it is empty
+
+    Raises:
+        ValueError: if the value is not valid JSON
+    """
+    if value is None or not str(value).strip():
+        return None
+    try:
+        return json.dumps(json.loads(value), separators=(',', ':'))
+    except (json.JSONDecodeError, TypeError) as e:
+        raise ValueError(f'Malformed JSON: {e}')
+
+def find_malformed(conn, db, columns):
+    """List (field, product id, value) for stored values that are not valid JSON"""
+    malformed = []
+    for field in JSON_FIELDS:
+        if field not in columns or 'JSON' in str(columns[field]['type']).upper():
+            continue
+        rows = conn.execute(db.text(f"SELECT id, {field} FROM products WHERE {field} IS NOT NULL")).fetchall()
+        for product_id, value in rows:
+            try:
+                normalize_json_text(value)
+            except ValueError:
+                malformed.append((field, product_id, value))
+    return malformed
+
+def migrate_json_columns():
+    """Normalize stored JSON text and convert the columns to JSON where supported."""
+
+    try:
+        print("🔄 Starting JSON columns migration...")
+
+        from extensions import db
+        from app import app
+
+        with app.app_context():
+            engine = db.engine
+            dialect = engine.dialect.name
+            print(f"✅ Database connection established ({dialect})")
+
+            inspector = db.inspect(engine)
+            columns = {col['name']: col for col in inspector.get_columns('products')}
+
+            with engine.begin() as conn:
+                malformed = find_malformed(conn, db, columns)
+                if malformed:
+                    for field, product_id, value in malformed:
+                        print(f"❌ Product {product_id}: {field} is not valid JSON: {value!r}")
+                    print(f"⚠️  {len(malformed)} malformed values - fix them and run the migration again")
+                    return False
+
+                for field in JSON_FIELDS:
+                    if field not in columns:
+                        print(f"⚠️  Column {field} not found - skipping")
+                        continue
+
+                    column_type = str(columns[field]['type']).upper()
+                    if 'JSON' in column_type:
+                        print(f"✅ {field} is already {column_type}")
+                        continue
+
+                    # Normalize values first so the type conversion cannot fail
+                    rows = conn.execute(db.text(f"SELECT id, {field} FROM products WHERE {field} IS NOT NULL")).fetchall()
+                    changed = 0
+                    for product_id, value in rows:
+                        normalized = normalize_json_text(value)
+                        if normalized != value:
+                            conn.execute(
+                                db.text(f"UPDATE products SET {field} = :value WHERE id = :id"),
+                                {'value': normalized, 'id': product_id}
+                            )
+                            changed += 1
+                    print(f"🔧 {field}: normalized {changed} of {len(rows)} stored values")
+
+                    if dialect == 'postgresql':
+                        conn.execute(db.text(
+                            f"ALTER TABLE products ALTER COLUMN {field} TYPE JSONB USING {field}::jsonb"
+                        ))
+                        print(f"✅ Converted {field} to JSONB")
+
+            print("🎉 Migration completed successfully!")
+            return True
+
+    except ImportError as e:
+        print(f"❌ Import error: {e}")
+        print("Make sure you're running this from the project root directory")
+        return False
+    except Exception as e:
+        print(f"❌ Migration error: {e}")
+        return False
+
+if __name__ == '__main__':
+    if not migrate_json_columns():
+        print("❌ Migration failed - check the errors above")
+        sys.exit(1)
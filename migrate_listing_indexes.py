@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the composite listing indexes.
+Creates every index declared on the products and related_products models that
+is missing from the database, and drops the superseded related-products index.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+# Replaced by ix_related_products_ranked
+OBSOLETE_INDEXES = {
+    'products': ['ix_products_active_sales'],
+    'related_products': ['ix_related_products_lookup'],
+}
+
+def migrate_listing_indexes():
+    """Create missing model indexes and drop obsolete ones."""
+
+    try:
+        print("🔄 Starting listing indexes migration...")
+
+        from extensions import db
+        from app import app
+        from models import Product, RelatedProduct
+
+        with app.app_context():
+            engine = db.engine
+            print("✅ Database connection established")
+
+            inspector = db.inspect(engine)
+            existing_tables = inspector.get_table_names()
+
+            for model in (Product, RelatedProduct):
+                table = model.__table__
+                if table.name not in existing_tables:
+                    print(f"⚠️  Table {table.name} not found - skipping (db.create_all() will create it with its indexes)")
+                    continue
+
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+
+                for name in OBSOLETE_INDEXES.get(table.name, []):
+                    if name in existing_indexes:
+                        with engine.begin() as conn:
+                            conn.execute(db.text(f"DROP INDEX {name}"))
+                        print(f"🗑️  Dropped obsolete index: {name}")
+
+                for index in sorted(table.indexes, key=lambda index: index.name):
+                    if index.name in existing_indexes:
+                        continue
+                    index.create(bind=engine)
+                    print(f"✅ Added index: {index.name}")
+
+            print("🎉 Migration completed successfully!")
+            return True
+
+    except ImportError as e:
+        print(f"❌ Import error: {e}")
+        print("Make sure you're running this from the project root directory")
+        return False
+    except Exception as e:
+        print(f"❌ Migration error: {e}")
+        return False
+
+if __name__ == '__main__':
+    if not migrate_listing_indexes():
+        print("❌ Migration failed - check the errors above")
+        sys.exit(1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the related_indexed_at column to the products table.
+Products that already have related-product rows are marked as indexed, so they
+are not recomputed on their next page view.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+def migrate_related_index():
+    """Add products.related_indexed_at and mark already-indexed products."""
+
+    try:
+        print("🔄 Starting related products index migration...")
+
+        from extensions import db
+        from app import app
+
+        with app.app_context():
+            engine = db.engine
+            print("✅ Database connection established")
+
+            inspector = db.inspect(engine)
+            existing_columns = [col['name'] for col in inspector.get_columns('products')]
+
+            with engine.begin() as conn:
+                if 'related_indexed_at' not in existing_columns:
+                    conn.execute(db.text("ALTER TABLE products ADD COLUMN related_indexed_at DATETIME"))
+                    print("✅ Added column: related_indexed_at")
+                else:
+                    print("✅ Column related_indexed_at already exists")
+
+                marked = conn.execute(db.text(
+                    "UPDATE products SET related_indexed_at = CURRENT_TIMESTAMP "
+                    "WHERE related_indexed_at IS NULL "
+                    "AND id IN (SELECT DISTINCT product_id FROM related_products)"
+                )).rowcount
+                print(f"📊 Marked {marked} products as indexed")
+
+            print("🎉 Migration completed successfully!")
+            return True
+
+    except ImportError as e:
+        print(f"❌ Import error: {e}")
+        print("Make sure you're running this from the project root directory")
+        return False
+    except Exception as e:
+        print(f"❌ Migration error: {e}")
+        return False
+
+if __name__ == '__main__':
+    if not migrate_related_index():
+        print("❌ Migration failed - check the errors above")
+        sys.exit(1)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the trending_score column to the products table.
+Adds the column and its index if missing, creates the trending_state table that
+holds the score epoch, then fills the scores from recent order history.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+def migrate_trending_score():
+    """Add products.trending_score and compute the initial scores."""
+
+    try:
+        print("🔄 Starting trending score migration...")
+
+        from extensions import db
+        from app import app
+        from services.trending import trending_scores
+        from models import TrendingState
+
+        with app.app_context():
+            engine = db.engine
+            print("✅ Database connection established")
+
+            inspector = db.inspect(engine)
+            existing_columns = [col['name'] for col in inspector.get_columns('products')]
+            existing_indexes = [index['name'] for index in inspector.get_indexes('products')]
+
+            with engine.begin() as conn:
+                if 'trending_score' not in existing_columns:
+                    conn.execute(db.text("ALTER TABLE products ADD COLUMN trending_score FLOAT DEFAULT 0 NOT NULL"))
+                    print("✅ Added column: trending_score")
+                else:
+                    print("✅ Column trending_score already exists")
+
+                if 'ix_products_trending_score' not in existing_indexes:
+                    conn.execute(db.text("CREATE INDEX ix_products_trending_score ON products (trending_score)"))
+                    print("✅ Added index: ix_products_trending_score")
+
+            TrendingState.__table__.create(engine, checkfirst=True)
+            print("✅ Table trending_state ready")
+
+            scored = trending_scores.rebuild()
+            print(f"📊 Computed trending scores for {scored} products")
+
+            print("🎉 Migration completed successfully!")
+            return True
+
+    except ImportError as e:
+        print(f"❌ Import error: {e}")
+        print("Make sure you're running this from the project root directory")
+        return False
+    except Exception as e:
+        print(f"❌ Migration error: {e}")
+        return False
+
+if __name__ == '__main__':
+    if not migrate_trending_score():
+        print("❌ Migration failed - check the errors above")
+        sys.exit(1)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Tests for the pooled payment gateway client.
+A local mock of the Omise API (threaded HTTP/1.1 server) scripts slow,
+failing and declined responses; the client must reuse connections, time out,
+retry only idempotent calls, trip its circuit breaker and record metrics.
+
+Run with: python -m pytest test_gateway_client.py
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from services.gateway_client import CircuitBreaker, GatewayClient, GatewayError, CircuitOpenError
+from services.omise_service import omise_service
+
+
+class MockOmise(BaseHTTPRequestHandler):
+    """Answers like the Omise API; tests queue (status, body, delay) per path"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    scripted = {}
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'null') if length else None
+        with self.lock:
+            self.requests.append({
+                'method': method, 'path': self.path, 'payload': payload,
+                'headers': dict(self.headers), 'port': self.client_address[1]
+            })
+            queue = self.scripted.get((method, self.path))
+            status, body, delay = queue.pop(0) if queue else self.default(method, payload)
+        if delay:
+            time.sleep(delay)
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out and hung up
+
+    def default(self, method, payload):
+        if self.path.startswith('/charges') and self.path.endswith('/refunds'):
+            return 200, {'object': 'refund', 'id': 'rfnd_test_1', 'amount': (payload or {}).get('amount')}, 0
+        if self.path.startswith('/charges/'):
+            return 200, {'object': 'charge', 'id': self.path.split('/')[2], 'status': 'successful', 'paid': True}, 0
+        if self.path == '/charges':
+            return 200, {'object': 'charge', 'id': 'chrg_test_1', 'status': 'successful', 'paid': True,
+                         'amount': payload['amount']}, 0
+        return 404, {'object': 'error', 'code': 'not_found', 'message': 'not found'}, 0
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+
+server = None
+
+@pytest.fixture(scope='module', autouse=True)
+def mock_omise(app):
+    """Start the mock API and point the Omise service at it"""
+    global server
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOmise)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app.config.update(
+        OMISE_SECRET_KEY='skey_test_mock',
+        OMISE_API_URL=f'http://127.0.0.1:{server.server_port}',
+        OMISE_READ_TIMEOUT=0.5,
+        OMISE_MAX_RETRIES=2
+    )
+    yield server
+    omise_service.close()
+    server.shutdown()
+
+def reset(**client_options):
+    """Forget scripted responses and recorded requests; return a fresh client"""
+    MockOmise.scripted.clear()
+    MockOmise.requests.clear()
+    options = {'read_timeout': 0.5, 'backoff': 0.01}
+    options.update(client_options)
+    return GatewayClient(f'http://127.0.0.1:{server.server_port}', 'skey_test_mock', **options)
+
+def script(method, path, *responses):
+    MockOmise.scripted[(method, path)] = [
+        response if len(response) == 3 else response + (0,) for response in responses
+    ]
+
+def test_connections_are_reused():
+    """Sequential calls go over one keep-alive connection"""
+    client = reset()
+    for _ in range(5):
+        client.request('get_charge', 'get', 'charges/chrg_test_1', idempotent=True)
+    assert len({request['port'] for request in MockOmise.requests}) == 1
+    assert MockOmise.requests[0]['headers']['Authorization'].startswith('Basic ')
+
+def test_idempotent_calls_are_retried():
+    """Transient failures of a GET are retried until it succeeds"""
+    client = reset()
+    script('GET', '/charges/chrg_retry', (503, {}), (502, {}))
+    body = client.request('get_charge', 'get', 'charges/chrg_retry', idempotent=True)
+    assert body['id'] == 'chrg_retry'
+    assert len(MockOmise.requests) == 3
+    stats = client.stats()['operations']['get_charge']
+    assert stats['attempts'] == 3 and stats['outcomes'] == {'ok': 1}
+
+def test_charges_without_a_key_are_not_retried():
+    """A POST is only retried when it carries an idempotency key, which is resent unchanged"""
+    client = reset()
+    script('POST', '/charges', (503, {}))
+    try:
+        client.request('create_charge', 'post', 'charges', payload={'amount': 100})
+        assert False, 'expected GatewayError'
+    except GatewayError as e:
+        assert e.retryable and e.status == 503
+    assert len(MockOmise.requests) == 1
+
+    script('POST', '/charges', (503, {}))
+    client.request('create_charge', 'post', 'charges', payload={'amount': 100},
+                   idempotent=True, idempotency_key='order-key-1')
+    keys = [request['headers'].get('Idempotency-Key') for request in MockOmise.requests[1:]]
+    assert keys == ['order-key-1', 'order-key-1']
+
+def test_read_timeout():
+    """A hung gateway fails the call after the read timeout instead of holding the worker"""
+    client = reset(read_timeout=0.2, max_retries=0)
+    script('GET', '/charges/chrg_slow', (200, {'object': 'charge', 'id': 'chrg_slow'}, 1.0))
+    started = time.monotonic()
+    try:
+        client.request('get_charge', 'get', 'charges/chrg_slow', idempotent=True)
+        assert False, 'expected GatewayError'
+    except GatewayError as e:
+        assert e.code == 'timeout' and e.retryable
+    assert time.monotonic() - started < 0.8
+
+def test_circuit_breaker_fails_fast_and_recovers():
+    """After repeated failures calls are rejected without a request; a probe closes the circuit again"""
+    client = reset(max_retries=0, breaker=CircuitBreaker(threshold=3, reset_timeout=0.3))
+    script('GET', '/charges/chrg_down', *[(500, {})] * 3)
+    for _ in range(3):
+        try:
+            client.request('get_charge', 'get', 'charges/chrg_down', idempotent=True)
+        except GatewayError:
+            pass
+    assert client.breaker.state == 'open'
+
+    try:
+        client.request('get_charge', 'get', 'charges/chrg_down', idempotent=True)
+        assert False, 'expected CircuitOpenError'
+    except CircuitOpenError as e:
+        assert e.retryable
+    assert len(MockOmise.requests) == 3
+
+    time.sleep(0.35)
+    assert client.request('get_charge', 'get', 'charges/chrg_down', idempotent=True)['id'] == 'chrg_down'
+    assert client.breaker.state == 'closed'
+    assert client.stats()['operations']['get_charge']['outcomes'] == {'http_500': 3, 'circuit_open': 1, 'ok': 1}
+
+def test_declines_do_not_trip_the_breaker():
+    """Errors the gateway returns on purpose are final and count as a healthy gateway"""
+    client = reset(breaker=CircuitBreaker(threshold=2, reset_timeout=30))
+    declined = {'object': 'error', 'code': 'invalid_card', 'message': 'card is invalid'}
+    script('POST', '/charges', *[(400, declined)] * 3)
+    for _ in range(3):
+        try:
+            client.request('create_charge', 'post', 'charges', payload={'amount': 100},
+                           idempotent=True, idempotency_key='declined-key')
+        except GatewayError as e:
+            assert not e.retryable and e.code == 'invalid_card'
+    assert len(MockOmise.requests) == 3
+    assert client.breaker.state == 'closed'
+
+def test_omise_service_against_mock(app):
+    """The service keeps its (success, data, error) results on top of the client"""
+    with app.app_context():
+        omise_service.init_app(app)
+        reset()
+
+        success, charge, error = omise_service.create_charge(
+            150000, 'THB', 'tokn_test_1', 'Order payment', idempotency_key='order-key-2'
+        )
+        assert success and charge['amount'] == 150000 and error is None
+        assert MockOmise.requests[-1]['headers']['Idempotency-Key'] == 'order-key-2'
+        assert MockOmise.requests[-1]['headers']['Omise-Version'] == '2017-11-02'
+
+        script('POST', '/charges', (200, {'object': 'charge', 'id': 'chrg_failed', 'status': 'failed',
+                                          'failure_code': 'insufficient_fund',
+                                          'failure_message': 'insufficient funds in the account'}))
+        success, charge, error = omise_service.create_charge(100, 'THB', 'tokn_test_2', 'Declined')
+        assert not success and error == 'insufficient funds in the account'
+
+        script('POST', '/charges/chrg_test_1/refunds', (503, {}))
+        success, refund, _ = omise_service.refund_charge('chrg_test_1', 5000)
+        assert success and refund['amount'] == 5000
+        keys = {request['headers'].get('Idempotency-Key') for request in MockOmise.requests[-2:]}
+        assert len(keys) == 1 and keys.pop().startswith('refund-chrg_test_1-')
+
+        metrics = omise_service.stats()['api']['operations']
+        assert set(metrics) >= {'create_charge', 'refund_charge'}
+        assert metrics['refund_charge']['attempts'] == 2
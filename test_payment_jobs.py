@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Tests for background card payments.
+Checkouts run against a throwaway SQLite database and the local stand-in
+gateway with added latency: orders must come back before the charge, settle
+through the worker pool, and never be placed or charged twice for one
+idempotency key.
+
+Run with: python -m pytest test_payment_jobs.py
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from extensions import db
+from models import Product, Order, PaymentJob
+from services.gateway_client import GatewayError
+from services.payments import LocalGateway, PaymentJobs, payment_jobs
+
+GATEWAY_LATENCY = 0.3
+THREADS = 8
+
+@pytest.fixture(scope='module', autouse=True)
+def slow_local_gateway(app):
+    """Charge through the local gateway with added latency"""
+    app.config['PAYMENT_GATEWAY_LATENCY'] = GATEWAY_LATENCY
+    payment_jobs._gateway = None
+    yield
+    payment_jobs._gateway = None
+
+def stock_of(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).stock_quantity
+
+def gateway_charges(app):
+    with app.app_context():
+        return payment_jobs.gateway().charges
+
+def checkout(app, product_id, email, token='tokn_test_ok', idempotency_key=None):
+    """Place a guest card order; returns (status code, response JSON)"""
+    headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+    response = app.test_client().post('/api/orders/guest/create', headers=headers, json={
+        'items': [{'id': product_id, 'quantity': 1}],
+        'guest_info': {'email': email},
+        'shipping_info': {
+            'first_name': 'Test', 'last_name': 'Buyer', 'address_line1': '1 Sukhumvit Rd',
+            'city': 'Bangkok', 'state': 'Bangkok', 'postal_code': '10110'
+        },
+        'payment_info': {'method': 'card', 'token': token}
+    })
+    return response.status_code, response.get_json()
+
+@pytest.fixture
+def sweeper(app):
+    """A second PaymentJobs whose background sweep runs every 0.2 seconds"""
+    interval = app.config['PAYMENT_SWEEP_INTERVAL']
+    app.config['PAYMENT_SWEEP_INTERVAL'] = 0.2
+    jobs = PaymentJobs()
+    jobs.init_app(app)
+    yield jobs
+    jobs.shutdown()
+    app.config['PAYMENT_SWEEP_INTERVAL'] = interval
+
+def job_status(app, job_id, timeout=5):
+    """Read a job's status from the database until it is final or `timeout` seconds pass"""
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            job = db.session.get(PaymentJob, job_id)
+            if job.is_final or time.monotonic() > deadline:
+                return job.status, job.attempts
+        time.sleep(0.05)
+
+def wait_for_payment(app, order_number, timeout=10):
+    """Poll the payment status the way the success page does, until it settles"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = app.test_client().get(f'/api/orders/{order_number}/payment')
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None or time.monotonic() > deadline:
+            return response.get_json()['payment']
+        time.sleep(min(float(retry_after), 0.2))
+
+def test_order_returns_before_the_charge(app, create_product):
+    """The order is placed without waiting for the gateway and settles in the background"""
+    product_id = create_product('async-serum', 5)
+
+    started = time.monotonic()
+    status, body = checkout(app, product_id, 'async@example.com')
+    elapsed = time.monotonic() - started
+
+    assert status == 201
+    assert elapsed < GATEWAY_LATENCY
+    assert body['order']['payment_status'] == 'pending'
+    assert body['order']['payment_url'].endswith('/payment')
+
+    # A pending payment is a short poll that says when to come back
+    response = app.test_client().get(body['order']['payment_url'])
+    assert response.get_json()['payment']['payment_status'] == 'pending'
+    assert response.headers['Retry-After'] == '1'
+
+    payment = wait_for_payment(app, body['order']['order_number'])
+    assert payment['payment_status'] == 'completed'
+    assert payment['order_status'] == 'confirmed'
+    assert payment['job']['status'] == 'succeeded'
+    assert payment['job']['charge_id'].startswith('chrg_local_')
+
+def test_retry_with_same_key_returns_the_original_order(app, create_product):
+    """A resubmitted checkout is neither placed nor charged again"""
+    product_id = create_product('retry-serum', 5)
+    charges = gateway_charges(app)
+
+    first_status, first = checkout(app, product_id, 'retry@example.com', idempotency_key='retry-key')
+    second_status, second = checkout(app, product_id, 'retry@example.com', idempotency_key='retry-key')
+
+    assert (first_status, second_status) == (201, 200)
+    assert first['order']['order_number'] == second['order']['order_number']
+    wait_for_payment(app, first['order']['order_number'])
+    assert gateway_charges(app) == charges + 1
+    assert stock_of(app, product_id) == 4
+
+    # The key belongs to its customer
+    status, _ = checkout(app, product_id, 'someone-else@example.com', idempotency_key='retry-key')
+    assert status == 409
+
+def test_concurrent_retries_place_one_order(app, create_product):
+    """Simultaneous submissions with one key end up as one order and one charge"""
+    product_id = create_product('double-click-serum', 20)
+    charges = gateway_charges(app)
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def submit(index):
+        barrier.wait()
+        results[index] = checkout(app, product_id, 'double@example.com', idempotency_key='double-click-key')
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(status in (200, 201) for status, _ in results)
+    order_numbers = {body['order']['order_number'] for _, body in results}
+    assert len(order_numbers) == 1
+    wait_for_payment(app, order_numbers.pop())
+    assert gateway_charges(app) == charges + 1
+    assert stock_of(app, product_id) == 19
+    with app.app_context():
+        assert PaymentJob.query.filter_by(idempotency_key='double-click-key').count() == 1
+
+def test_declined_payment_cancels_and_restocks(app, create_product):
+    """A declined card cancels the order and returns its stock"""
+    product_id = create_product('declined-serum', 3)
+
+    status, body = checkout(app, product_id, 'declined@example.com', token='tokn_test_fail')
+    assert status == 201
+    assert stock_of(app, product_id) == 2
+
+    payment = wait_for_payment(app, body['order']['order_number'])
+    assert payment['payment_status'] == 'failed'
+    assert payment['order_status'] == 'cancelled'
+    assert payment['job']['error'] == 'Card declined'
+    assert stock_of(app, product_id) == 3
+    with app.app_context():
+        assert db.session.get(Product, product_id).sales_count == 0
+
+def test_stalled_job_is_resumed_without_a_second_charge(app, create_product):
+    """A job whose worker died after charging is retried and gets the original charge back"""
+    product_id = create_product('stalled-serum', 3)
+    _, body = checkout(app, product_id, 'stalled@example.com', token=None)
+
+    with app.app_context():
+        order = Order.query.filter_by(order_number=body['order']['order_number']).one()
+        job = payment_jobs.create(order, 'tokn_test_ok', 'stalled-key', 'Stalled payment')
+        db.session.commit()
+        # The worker charged the card, then died before recording the result
+        success, charge, _ = payment_jobs.gateway().charge(
+            job.amount, job.currency, job.card_token, job.description, idempotency_key='stalled-key'
+        )
+        assert success
+        job.status = 'processing'
+        job.attempts = 1
+        job.updated_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        charges = payment_jobs.gateway().charges
+
+        assert payment_jobs.resume_stalled(force=True) == 1
+        job = payment_jobs.wait(job.id, 10)
+        assert job.status == 'succeeded'
+        assert job.attempts == 2
+        assert job.charge_id == charge['id']
+        assert payment_jobs.gateway().charges == charges
+
+def test_card_payments_need_a_configured_gateway(app, create_product):
+    """Without Omise keys or an explicit local gateway, card checkouts are refused, not approved"""
+    product_id = create_product('unconfigured-serum', 3)
+    saved = {key: app.config.get(key) for key in ('PAYMENT_GATEWAY', 'OMISE_SECRET_KEY')}
+    app.config.update(PAYMENT_GATEWAY=None, OMISE_SECRET_KEY=None)
+    local, payment_jobs._gateway = payment_jobs._gateway, None
+    try:
+        status, body = checkout(app, product_id, 'unconfigured@example.com')
+    finally:
+        app.config.update(saved)
+        payment_jobs._gateway = local
+
+    assert status == 503
+    assert body['status'] == 'error'
+    assert stock_of(app, product_id) == 3
+
+def test_job_left_queued_by_a_full_pool_settles(app, create_product, sweeper):
+    """A job the pool had no room for is charged by the background sweep, without another checkout"""
+    product_id = create_product('overflow-serum', 3)
+
+    with app.app_context():
+        payment_jobs._pool()
+        taken = 0
+        while payment_jobs._slots.acquire(blocking=False):
+            taken += 1
+    try:
+        status, body = checkout(app, product_id, 'overflow@example.com')
+    finally:
+        for _ in range(taken):
+            payment_jobs._slots.release()
+    assert status == 201
+
+    with app.app_context():
+        order = Order.query.filter_by(order_number=body['order']['order_number']).one()
+        job_id = payment_jobs.for_order(order.id).id
+    assert job_status(app, job_id) == ('succeeded', 1)
+
+class FlakyGateway(LocalGateway):
+    """Times out on the first charge, then answers like the local gateway"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def charge(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise GatewayError('Gateway timed out', code='timeout', retryable=True)
+        return super().charge(*args, **kwargs)
+
+def test_requeued_job_is_retried_by_the_sweep(app, create_product, sweeper):
+    """After a transient gateway error the job is charged again without any further request"""
+    product_id = create_product('flaky-serum', 3)
+    _, body = checkout(app, product_id, 'flaky@example.com', token=None)
+    sweeper._gateway = FlakyGateway()
+
+    with app.app_context():
+        order = Order.query.filter_by(order_number=body['order']['order_number']).one()
+        job = payment_jobs.create(order, 'tokn_test_ok', 'flaky-key', 'Flaky payment')
+        db.session.commit()
+        assert sweeper.process(job.id) == 'queued'
+        job_id = job.id
+
+    assert job_status(app, job_id) == ('succeeded', 2)
+    assert sweeper._gateway.charges == 1
+
+class UnreachableGateway:
+    """Times out on every charge, like a gateway that may or may not have charged the card"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def charge(self, *args, **kwargs):
+        self.calls += 1
+        raise GatewayError('Gateway timed out', code='timeout', retryable=True)
+
+def test_unknown_outcome_is_held_for_review(app, create_product):
+    """A charge that never got an answer is neither failed nor cancelled once retries run out"""
+    product_id = create_product('unknown-serum', 3)
+    _, body = checkout(app, product_id, 'unknown@example.com', token=None)
+    assert stock_of(app, product_id) == 2
+
+    gateway = UnreachableGateway()
+    with app.app_context():
+        order = Order.query.filter_by(order_number=body['order']['order_number']).one()
+        job = payment_jobs.create(order, 'tokn_test_ok', 'unknown-key', 'Unknown payment')
+        job.attempts = app.config.get('PAYMENT_MAX_ATTEMPTS', 5) - 1
+        db.session.commit()
+
+        local, payment_jobs._gateway = payment_jobs._gateway, gateway
+        try:
+            assert payment_jobs.process(job.id) == 'review'
+        finally:
+            payment_jobs._gateway = local
+
+        # The last attempt was confirmed once more under the same key
+        assert gateway.calls == 2
+        job = db.session.get(PaymentJob, job.id)
+        assert job.is_final
+        assert job.order.status != 'cancelled'
+        assert job.order.payment_status == 'processing'
+        assert payment_jobs.resume_stalled(force=True) == 0
+    assert stock_of(app, product_id) == 2
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression tests for the product listing endpoints.
+Calls each endpoint against a throwaway SQLite database, captures the SQL it
+runs and checks EXPLAIN QUERY PLAN: no full table scans and no temp B-tree
+sorts on products or related_products.
+
+Run with: python -m pytest test_query_plans.py
+"""
+
+import re
+
+import pytest
+from sqlalchemy import event
+from extensions import db
+from models import Product, Badge, User
+
+# Endpoints whose SQL must stay on indexes
+LISTING_URLS = [
+    '/api/products/',
+    '/api/products/?category=serum',
+    '/api/products/?featured=1',
+    '/api/products/?new=1',
+    '/api/products/?bestseller=1',
+    '/api/products/?cursor=',
+    '/api/products/?category=serum&cursor=',
+    '/api/products/?bestseller=1&cursor=',
+    '/api/products/?sort=price_asc',
+    '/api/products/?sort=price_desc',
+    '/api/products/?sort=discount',
+    '/api/products/?sort=popular',
+    '/api/products/?sort=price_asc&cursor=',
+    '/api/products/?sort=discount&cursor=',
+    '/api/products/?on_sale=1',
+    '/api/products/?min_price=100&max_price=200&sort=price_asc',
+    '/api/products/featured',
+    '/api/products/new',
+    '/api/products/bestsellers',
+    '/api/products/categories',
+    '/api/products/facets',
+    '/api/products/related/2',
+    '/api/products/batch?ids=1,2&slugs=product-3',
+    '/api/products/slug/product-2',
+    '/api/products/3',
+    '/api/products/admin',
+    '/api/products/admin?status=active',
+    '/api/products/admin?category=serum',
+    '/api/products/admin?cursor=',
+]
+
+CHECKED_TABLES = ('products', 'related_products')
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)( AS \w+)?$')
+MAIN_TABLE = re.compile(r'\bFROM\s+(?P<table>\w+)', re.IGNORECASE)
+
+@pytest.fixture(scope='module')
+def admin_id(app):
+    """Create a small catalog; returns the id of an admin user"""
+    with app.app_context():
+        badge = Badge(name='Vegan', slug='vegan', background_color='#E3F2FD', text_color='#1976D2')
+        db.session.add(badge)
+        db.session.flush()
+
+        categories = ['cleanser', 'serum', 'moisturizer']
+        for i in range(12):
+            db.session.add(Product(
+                name=f'Product {i}', slug=f'product-{i}', description='Test product',
+                price=100 + i, original_price=150 + i if i % 4 == 0 else None, category=categories[i % 3], stock_quantity=i,
+                is_featured=i % 2 == 0, is_bestseller=i % 5 == 0, is_new=i % 3 == 0,
+                badge_ids=[badge.id] if i % 2 else None, sales_count=i
+            ))
+
+        admin = User(email='plans-admin@example.com', first_name='Plan', last_name='Admin', is_admin=True)
+        admin.set_password('plans-admin')
+        db.session.add(admin)
+        db.session.commit()
+        return admin.id
+
+def capture_selects(app, client, url):
+    """Call an endpoint and return the (sql, params) of every SELECT it ran"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return statements
+
+def plan_problems(app, statement, parameters):
+    """Return the plan lines that indicate a table scan or a temp B-tree sort"""
+    main_table = MAIN_TABLE.search(statement)
+    if not main_table or main_table.group('table') not in CHECKED_TABLES:
+        return []
+    # Aggregates (admin counters) read every row by design
+    if 'GROUP BY' in statement.upper():
+        return []
+
+    with app.app_context():
+        plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        scan = FULL_SCAN.match(detail)
+        if scan and scan.group('table') in CHECKED_TABLES:
+            problems.append(detail)
+        elif 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+def test_listing_queries_use_indexes(app, admin_id):
+    """Every listing endpoint's SQL avoids table scans and temp B-tree sorts"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = admin_id
+
+    failures = []
+    for url in LISTING_URLS:
+        for statement, parameters in capture_selects(app, client, url):
+            for problem in plan_problems(app, statement, parameters):
+                failures.append(f"{url}: {problem}\n    {' '.join(statement.split())[:200]}")
+
+    assert not failures, 'Query plans degraded:\n' + '\n'.join(failures)
+
+def test_batch_uses_key_lookups(app, admin_id):
+    """/batch finds active products by primary key and slug, not by a range over is_active"""
+    client = app.test_client()
+    for url in ('/api/products/batch?ids=1,2', '/api/products/batch?slugs=product-3,product-4',
+                '/api/products/batch?ids=1,2&slugs=product-3'):
+        statements = [
+            (statement, parameters) for statement, parameters in capture_selects(app, client, url)
+            if MAIN_TABLE.search(statement).group('table') == 'products'
+        ]
+        assert statements, f'{url} ran no product query'
+        for statement, parameters in statements:
+            with app.app_context():
+                plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            for row in plan:
+                assert '(is_active=?)' not in row[-1], f'{url}: {row[-1]}'
+
+def test_composite_indexes_exist():
+    """The migration's composite indexes are part of the model"""
+    names = {index.name for index in Product.__table__.indexes}
+    expected = {
+        'ix_products_active_created', 'ix_products_active_category_created',
+        'ix_products_active_featured_created', 'ix_products_active_new_created',
+        'ix_products_active_trending', 'ix_products_active_price',
+        'ix_products_active_discount', 'ix_products_active_popular',
+        'ix_products_updated', 'ix_products_active_updated', 'ix_products_category_updated',
+    }
+    assert expected <= names, f'Missing indexes: {expected - names}'
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Concurrency tests for checkout stock reservations.
+Many threads reserve and check out the same product against a throwaway
+SQLite database; stock must never go below zero or be sold twice.
+
+Run with: python -m pytest test_stock_reservation.py
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Product, Order, StockReservation
+from services.stock_reservations import stock_reservations, InsufficientStock
+
+THREADS = 24
+
+def stock_of(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).stock_quantity
+
+def run_concurrently(worker):
+    """Start THREADS workers at the same moment and collect their results"""
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def run(index):
+        barrier.wait()
+        results[index] = worker(index)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_reservations_never_oversell(app, create_product):
+    """Only as many single-unit holds succeed as there are units in stock"""
+    product_id = create_product('contended-serum', 10)
+
+    def reserve(index):
+        with app.app_context():
+            try:
+                return stock_reservations.reserve([{'id': product_id, 'quantity': 1}])
+            except InsufficientStock:
+                return None
+
+    tokens = [token for token in run_concurrently(reserve) if token]
+
+    assert len(tokens) == 10
+    assert stock_of(app, product_id) == 0
+    with app.app_context():
+        assert StockReservation.query.filter_by(product_id=product_id, status='held').count() == 10
+
+def test_concurrent_checkouts_never_oversell(app, create_product):
+    """Parallel guest checkouts place exactly as many orders as there is stock"""
+    product_id = create_product('checkout-serum', 5)
+
+    def checkout(index):
+        client = app.test_client()
+        response = client.post('/api/orders/guest/create', json={
+            'items': [{'id': product_id, 'quantity': 1}],
+            'guest_info': {'email': f'buyer{index}@example.com'},
+            'shipping_info': {
+                'first_name': 'Test', 'last_name': f'Buyer {index}', 'address_line1': '1 Sukhumvit Rd',
+                'city': 'Bangkok', 'state': 'Bangkok', 'postal_code': '10110'
+            }
+        })
+        return response.status_code
+
+    statuses = run_concurrently(checkout)
+
+    assert statuses.count(201) == 5
+    assert statuses.count(400) == THREADS - 5
+    assert stock_of(app, product_id) == 0
+    with app.app_context():
+        committed = StockReservation.query.filter_by(product_id=product_id, status='committed').all()
+        assert len(committed) == 5
+        assert Order.query.filter(Order.id.in_([row.order_id for row in committed])).count() == 5
+
+def test_release_returns_stock_once(app, create_product):
+    """Releasing a hold restores the stock, and releasing it again is a no-op"""
+    product_id = create_product('released-serum', 3)
+
+    with app.app_context():
+        token = stock_reservations.reserve([{'id': product_id, 'quantity': 2}])
+    assert stock_of(app, product_id) == 1
+
+    def release(index):
+        with app.app_context():
+            return stock_reservations.release(token)
+
+    assert sum(run_concurrently(release)) == 2
+    assert stock_of(app, product_id) == 3
+
+def test_expired_reservations_are_released(app, create_product):
+    """Holds past their TTL go back into stock on the next sweep"""
+    product_id = create_product('expired-serum', 4)
+
+    with app.app_context():
+        token = stock_reservations.reserve([{'id': product_id, 'quantity': 4}])
+        StockReservation.query.filter_by(token=token).update(
+            {'expires_at': datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.session.commit()
+        assert stock_of(app, product_id) == 0
+
+        assert stock_reservations.release_expired(force=True) == 4
+    assert stock_of(app, product_id) == 4
+
+def test_reservation_without_returning_names_the_short_product(app, create_product, monkeypatch):
+    """Databases without UPDATE ... RETURNING report the product that is actually short"""
+    plenty_id = create_product('plenty-toner', 10)
+    short_id = create_product('short-toner', 1)
+
+    with app.app_context():
+        monkeypatch.setattr(db.engine.dialect, 'update_returning', False)
+        try:
+            stock_reservations.reserve([{'id': plenty_id, 'quantity': 2}, {'id': short_id, 'quantity': 2}])
+            assert False, 'reservation should have failed'
+        except InsufficientStock as e:
+            assert str(e) == 'Insufficient stock for Short-Toner. Available: 1'
+
+        token = stock_reservations.reserve([{'id': plenty_id, 'quantity': 2}, {'id': short_id, 'quantity': 1}])
+        assert StockReservation.query.filter_by(token=token).count() == 2
+
+    assert stock_of(app, plenty_id) == 8
+    assert stock_of(app, short_id) == 0
+
+def test_failed_reservation_holds_nothing(app, create_product):
+    """A cart that cannot be covered in full leaves every product untouched"""
+    first_id = create_product('plenty-serum', 10)
+    second_id = create_product('scarce-serum', 1)
+
+    with app.app_context():
+        try:
+            stock_reservations.reserve([{'id': first_id, 'quantity': 2}, {'id': second_id, 'quantity': 2}])
+            assert False, 'reservation should have failed'
+        except InsufficientStock:
+            pass
+
+    assert stock_of(app, first_id) == 10
+    assert stock_of(app, second_id) == 1